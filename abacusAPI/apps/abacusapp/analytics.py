@@ -0,0 +1,163 @@
+"""
+Performance metrics of a valuation series: returns, volatility, drawdown and
+Sharpe ratio, overall and over rolling windows.
+
+Deposits and trades move money in and out of a portfolio, so returns are
+time-weighted: each day's return is the change in value not explained by
+that day's cash flows. Every step is a vectorized pass over the days, and
+rolling windows use running sums, so the cost is linear in the number of
+days whatever the windows are.
+"""
+
+import numpy as np
+
+TRADING_DAYS = 252
+
+
+def daily_returns(values: np.ndarray, flows: np.ndarray) -> np.ndarray:
+    """
+    Get the return of each day after the first, NaN when the day before was
+    worth nothing
+    """
+    previous = values[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = (values[1:] - flows[1:]) / previous - 1
+    returns[previous <= 0] = np.nan
+    return returns
+
+
+def rolling_volatility(returns: np.ndarray, window: int) -> np.ndarray:
+    """
+    Annualized standard deviation of the returns of each window, ending on
+    each day, skipping NaNs
+    """
+    valid = ~np.isnan(returns)
+    r = np.where(valid, returns, 0)
+
+    def window_sums(x):
+        sums = np.concatenate([[0], np.cumsum(x)])
+        out = np.full(len(x), np.nan)
+        out[window - 1 :] = sums[window:] - sums[:-window]
+        return out
+
+    n = window_sums(valid.astype(float))
+    s1 = window_sums(r)
+    s2 = window_sums(r * r)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variance = (s2 - s1 * s1 / n) / (n - 1)
+    # running sums leave tiny negative variances when it's really 0
+    variance = np.where(n > 1, np.maximum(variance, 0), np.nan)
+    return np.sqrt(variance * TRADING_DAYS)
+
+
+def drawdown(wealth: np.ndarray) -> np.ndarray:
+    """
+    How far below its running peak the wealth is each day
+    """
+    return wealth / np.maximum.accumulate(wealth) - 1
+
+
+def max_drawdown(dates: list, wealth: np.ndarray) -> dict:
+    """
+    Get the deepest drawdown, with the dates of its peak, its trough and when
+    it was recovered (None if it hasn't been)
+    """
+    losses = drawdown(wealth)
+    trough = int(np.argmin(losses))
+    peak = int(np.argmax(wealth[: trough + 1]))
+    recovered = np.flatnonzero(wealth[trough:] >= wealth[peak])
+    recovery = trough + int(recovered[0]) if len(recovered) and trough > peak else None
+
+    return {
+        "value": losses[trough],
+        "peak": dates[peak],
+        "trough": dates[trough],
+        "recovery": dates[recovery] if recovery is not None else None,
+    }
+
+
+def compute_analytics(
+    dates: list,
+    values: np.ndarray,
+    flows: np.ndarray,
+    windows: list,
+    risk_free: float = 0.0,
+    include_series: bool = False,
+) -> dict:
+    """
+    Get the metrics of a valuation series, given the net amount of money that
+    came in on each date (deposits and buys, minus sells).
+
+    `risk_free` is the annual rate the Sharpe ratio is measured against, and
+    `windows` the numbers of days of the rolling metrics.
+    """
+    returns = daily_returns(values, flows)
+    # growth of one unit invested on the first date
+    wealth = np.concatenate([[1.0], np.cumprod(1 + np.nan_to_num(returns))])
+    n_returns = int(np.count_nonzero(~np.isnan(returns)))
+
+    total_return = wealth[-1] - 1
+    annualized_return = volatility = sharpe_ratio = np.nan
+    if n_returns:
+        annualized_return = wealth[-1] ** (TRADING_DAYS / n_returns) - 1
+    if n_returns > 1:
+        std = np.nanstd(returns, ddof=1)
+        volatility = std * np.sqrt(TRADING_DAYS)
+        if std > 0:
+            excess = np.nanmean(returns) - risk_free / TRADING_DAYS
+            sharpe_ratio = excess / std * np.sqrt(TRADING_DAYS)
+
+    rolling = {}
+    for window in windows:
+        rolling_return = np.full(len(wealth), np.nan)
+        rolling_return[window:] = wealth[window:] / wealth[:-window] - 1
+        # returns start on the second date
+        rolling_vol = np.concatenate([[np.nan], rolling_volatility(returns, window)])
+        rolling[window] = {"return": rolling_return, "volatility": rolling_vol}
+
+    data = {
+        "start": dates[0],
+        "end": dates[-1],
+        "days": len(dates),
+        "start_value": values[0],
+        "end_value": values[-1],
+        "net_flows": flows[1:].sum(),
+        "total_return": total_return,
+        "annualized_return": annualized_return,
+        "volatility": volatility,
+        "sharpe_ratio": sharpe_ratio,
+        "risk_free": risk_free,
+        "max_drawdown": max_drawdown(dates, wealth),
+        "windows": {
+            str(window): {name: series[-1] for name, series in metrics.items()}
+            for window, metrics in rolling.items()
+        },
+    }
+
+    if include_series:
+        data["series"] = {
+            "dates": dates,
+            "returns": np.concatenate([[np.nan], returns]),
+            "wealth": wealth,
+            "drawdown": drawdown(wealth),
+            "rolling": {str(window): metrics for window, metrics in rolling.items()},
+        }
+
+    return data
+
+
+def to_json(value, places: int = 6):
+    """
+    Turn the numpy values of some analytics into plain, rounded ones, with
+    None for NaNs
+    """
+    if isinstance(value, dict):
+        return {k: to_json(v, places) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(v, places) for v in value]
+    if isinstance(value, np.ndarray):
+        rounded = np.round(value.astype(float), places)
+        return [None if np.isnan(v) else v for v in rounded.tolist()]
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else round(float(value), places)
+    return value
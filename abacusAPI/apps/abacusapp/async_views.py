@@ -0,0 +1,152 @@
+"""
+Async versions of the heavy PortfolioViewSet actions, for ASGI deployments.
+
+DRF views are synchronous, so these are plain Django async views. They run
+the API's authentication and permission classes, read through the async ORM,
+and await renders on the process pool, so a single ASGI process can keep
+many slow requests in flight. Under WSGI they still work, one per thread.
+"""
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.exceptions import APIException
+from rest_framework.views import APIView
+
+from .models import Portfolio
+from .rendering import PoolTimeout, PoolUnavailable
+from .serializers import PortfolioDailyValueSerializer
+from .services import (
+    acalculate_portfolio_daily_values,
+    agenerate_portfolio_chart_data,
+    agenerate_portfolio_plots,
+)
+from .views import (
+    PLOT_CONTENT_TYPES,
+    get_plot_params,
+    get_weights_param,
+    portfolio_validators,
+)
+
+
+def check_access(request):
+    """
+    Run the API's authentication, permission and throttling classes on a
+    request, returning the error response when it's not allowed
+    """
+    view = APIView()
+    view.args, view.kwargs = (), {}
+    view.headers = view.default_response_headers
+    drf_request = view.initialize_request(request)
+    view.request = drf_request
+
+    try:
+        view.initial(drf_request)
+    except APIException as exc:
+        # the same 401/403 response the API views would give
+        response = view.finalize_response(drf_request, view.handle_exception(exc))
+        return response.render()
+
+    request.user = drf_request.user
+    return None
+
+
+async def get_portfolio(request, pk):
+    """
+    Get the portfolio of a request, or the response to send instead: an
+    access error, a 404 or a 304 when the client's copy is still current
+    """
+    error = await sync_to_async(check_access)(request)
+    if error is not None:
+        return None, error
+
+    try:
+        portfolio = await Portfolio.objects.aget(pk=pk)
+    except Portfolio.DoesNotExist:
+        return None, JsonResponse(
+            {"detail": "No Portfolio matches the given query."}, status=404
+        )
+
+    etag, last_modified = portfolio_validators(portfolio)
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified)
+    )
+    return portfolio, not_modified
+
+
+def with_validators(response, portfolio):
+    etag, last_modified = portfolio_validators(portfolio)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+async def portfolio_daily_values(request, pk):
+    portfolio, response = await get_portfolio(request, pk)
+    if response is not None:
+        return response
+
+    initial_date = request.GET.get("fecha_inicio")
+    end_date = request.GET.get("fecha_fin")
+
+    if not initial_date or not end_date:
+        return JsonResponse(
+            {"error": "Please provide both fecha_inicio and fecha_fin."}, status=400
+        )
+
+    try:
+        weights = get_weights_param(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    daily_values = await acalculate_portfolio_daily_values(
+        portfolio, initial_date, end_date, weights
+    )
+    serializer = PortfolioDailyValueSerializer(daily_values, many=True)
+
+    return with_validators(JsonResponse(serializer.data, safe=False), portfolio)
+
+
+async def portfolio_plot(request, pk):
+    portfolio, response = await get_portfolio(request, pk)
+    if response is not None:
+        return response
+
+    initial_date = request.GET.get("fecha_inicio")
+    end_date = request.GET.get("fecha_fin")
+
+    if not initial_date or not end_date:
+        return JsonResponse(
+            {"error": "Please provide both fecha_inicio and fecha_fin."}, status=400
+        )
+
+    try:
+        output, points = get_plot_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        if output == "json":
+            data = await agenerate_portfolio_chart_data(
+                portfolio, initial_date, end_date, points
+            )
+        else:
+            data = await agenerate_portfolio_plots(
+                portfolio, initial_date, end_date, output, points
+            )
+    except PoolTimeout as e:
+        return JsonResponse({"error": str(e)}, status=504)
+    except PoolUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=503)
+
+    if not data:
+        return JsonResponse(
+            {"error": "No data available for the given date range."}, status=404
+        )
+
+    if output == "json":
+        response = JsonResponse(data)
+    else:
+        response = HttpResponse(data, content_type=PLOT_CONTENT_TYPES[output])
+    return with_validators(response, portfolio)
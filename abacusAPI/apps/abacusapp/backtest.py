@@ -0,0 +1,161 @@
+"""
+Backtests of portfolios that keep fixed target weights, over a price history.
+
+Kept apart from Django, like rendering.py, so backtests can run in worker
+processes. Quantities only change on rebalances, so between two of them
+each asset's value grows with its price relative to the last one: the whole
+simulation is a few vectorized passes over the dates x assets price matrix.
+Only threshold rebalancing has to step from one rebalance to the next.
+"""
+
+import numpy as np
+
+from .analytics import compute_analytics, to_json
+
+FREQUENCIES = ("daily", "weekly", "monthly", "threshold")
+
+
+def fill_forward(prices: np.ndarray) -> np.ndarray:
+    """
+    Carry each asset's last price over the dates it has none
+    """
+    rows = np.where(~np.isnan(prices), np.arange(len(prices))[:, None], 0)
+    rows = np.maximum.accumulate(rows, axis=0)
+    return prices[rows, np.arange(prices.shape[1])]
+
+
+def calendar_rebalances(dates: list, frequency: str) -> np.ndarray:
+    """
+    Get the indices of the dates a portfolio is rebalanced on: the first
+    one, and the first date of each day, week or month after it
+    """
+    if frequency == "daily":
+        return np.arange(len(dates))
+    if frequency == "weekly":
+        periods = [date.isocalendar()[:2] for date in dates]
+    else:
+        periods = [(date.year, date.month) for date in dates]
+    starts = [0] + [i for i in range(1, len(dates)) if periods[i] != periods[i - 1]]
+    return np.array(starts)
+
+
+def threshold_rebalances(
+    prices: np.ndarray, weights: np.ndarray, threshold: float, lookahead: int = 32
+) -> np.ndarray:
+    """
+    Get the indices of the dates a portfolio is rebalanced on: the first
+    one, and each date some asset drifted more than `threshold` away from
+    its target weight since the last rebalance.
+
+    The dates after each rebalance are checked in growing blocks, so long
+    stretches without one take a few passes.
+    """
+    starts = [0]
+    start, size = 0, lookahead
+    while start + 1 < len(prices):
+        end = min(start + 1 + size, len(prices))
+        held = prices[start + 1 : end] / prices[start] * weights
+        drifted = held / held.sum(axis=1, keepdims=True)
+        over = np.flatnonzero((np.abs(drifted - weights) > threshold).any(axis=1))
+        if len(over):
+            start += 1 + int(over[0])
+            starts.append(start)
+            size = lookahead
+        elif end == len(prices):
+            break
+        else:
+            size *= 2
+    return np.array(starts)
+
+
+def simulate(
+    prices: np.ndarray,
+    weights: np.ndarray,
+    capital: float,
+    rebalances: np.ndarray,
+    cost: float = 0.0,
+) -> tuple:
+    """
+    Value a portfolio invested in `weights` on the first date and brought
+    back to them on each of the `rebalances`, paying `cost` times the value
+    traded each time.
+
+    Returns the value on each date, and the turnover (value traded over the
+    portfolio's value) and costs of each rebalance, the first being the
+    initial investment.
+    """
+    segment = np.zeros(len(prices), dtype=np.intp)
+    segment[rebalances[1:]] = 1
+    segment = np.cumsum(segment)
+
+    # growth of each period up to the next rebalance, and how far the
+    # weights drifted by then
+    relative = prices[rebalances[1:]] / prices[rebalances[:-1]]
+    growth = relative @ weights
+    drifted = relative * weights / growth[:, None]
+    turnover = np.concatenate([[1.0], np.abs(drifted - weights).sum(axis=1)])
+
+    # value right before each rebalance, and right after paying for it
+    kept = 1 - cost * turnover
+    before = capital * np.cumprod(np.concatenate([[1.0], growth * kept[:-1]]))
+    after = before * kept
+
+    values = after[segment] * ((prices / prices[rebalances][segment]) @ weights)
+    return values, turnover, before * cost * turnover
+
+
+def backtest(
+    dates: list,
+    prices: np.ndarray,
+    weights: np.ndarray,
+    capital: float,
+    rebalance: str = "monthly",
+    threshold: float = 0.05,
+    cost: float = 0.0,
+    windows: tuple = (),
+    risk_free: float = 0.0,
+    include_series: bool = False,
+):
+    """
+    Simulate a portfolio from `capital` and its target weights over the
+    prices of its assets (dates x assets, NaN where there's no price), and
+    get its analytics (see analytics.py) and rebalancing stats, ready for
+    JSON.
+
+    It starts on the first date every asset has a price, and is None when
+    there are less than two of those.
+    """
+    prices = fill_forward(prices)
+    priced = np.flatnonzero(~np.isnan(prices).any(axis=1))
+    if len(priced) < 2:
+        return None
+    dates = dates[priced[0] :]
+    prices = prices[priced[0] :]
+
+    if rebalance == "threshold":
+        rebalances = threshold_rebalances(prices, weights, threshold)
+    else:
+        rebalances = calendar_rebalances(dates, rebalance)
+    values, turnover, costs = simulate(prices, weights, capital, rebalances, cost)
+
+    data = compute_analytics(
+        dates,
+        values,
+        np.zeros(len(values)),
+        windows,
+        risk_free,
+        include_series=include_series,
+    )
+    data["rebalancing"] = {
+        "frequency": rebalance,
+        "threshold": threshold if rebalance == "threshold" else None,
+        "cost": cost,
+        "count": len(rebalances) - 1,
+        "turnover": turnover[1:].sum(),
+        "costs": costs.sum(),
+    }
+    if include_series:
+        data["series"]["values"] = values
+        data["series"]["rebalances"] = [dates[i] for i in rebalances.tolist()]
+
+    return to_json(data)
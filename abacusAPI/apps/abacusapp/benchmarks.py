@@ -0,0 +1,189 @@
+"""
+Service-level benchmarks, run on synthetic datasets (see synthetic.py).
+
+Each benchmark times one call to a service over a few repeats, with an
+optional setup step before each repeat that isn't timed. Results are
+compared against stored baselines by the run_benchmarks command.
+"""
+
+import statistics
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from pathlib import Path
+
+from django.core.cache import cache
+
+from .models import Deposit, Portfolio, PortfolioAsset, Price, Transaction
+from .services import (
+    calculate_portfolio_daily_value,
+    calculate_portfolio_daily_values,
+    generate_portfolio_plots,
+    import_workbook,
+    plan_rebalance,
+    run_backtests,
+)
+from .synthetic import Scale, write_workbook
+
+
+@dataclass
+class Dataset:
+    """
+    What the benchmarks need to know about the generated data
+    """
+
+    scale: Scale
+    portfolio: Portfolio
+    dates: list
+    workbook: Path
+
+
+@dataclass
+class Benchmark:
+    name: str
+    run: callable
+    setup: callable = None
+
+
+@dataclass
+class Result:
+    name: str
+    timings: list = field(default_factory=list)
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.timings)
+
+    @property
+    def best(self) -> float:
+        return min(self.timings)
+
+
+BENCHMARKS = []
+
+
+def benchmark(name, setup=None):
+    def register(run):
+        BENCHMARKS.append(Benchmark(name=name, run=run, setup=setup))
+        return run
+
+    return register
+
+
+def load_dataset(scale: Scale, workdir: Path) -> Dataset:
+    # the portfolio with the most assets, as the worst case
+    portfolio = max(
+        Portfolio.objects.all(),
+        key=lambda p: PortfolioAsset.objects.filter(portfolio=p).count(),
+    )
+    dates = list(
+        Price.objects.order_by("date").values_list("date", flat=True).distinct()
+    )
+    workbook = workdir / "upload.xlsx"
+    write_workbook(workbook, scale)
+    return Dataset(scale=scale, portfolio=portfolio, dates=dates, workbook=workbook)
+
+
+def mark_stale(data: Dataset):
+    Portfolio.touch([data.portfolio.id])
+    data.portfolio.refresh_from_db()
+
+
+@benchmark("daily_values_cold", setup=mark_stale)
+def daily_values_cold(data: Dataset):
+    """
+    Daily values over the whole history, recomputing the materialized rows
+    """
+    calculate_portfolio_daily_values(data.portfolio, data.dates[0], data.dates[-1])
+
+
+@benchmark("daily_values_warm")
+def daily_values_warm(data: Dataset):
+    calculate_portfolio_daily_values(data.portfolio, data.dates[0], data.dates[-1])
+
+
+@benchmark("daily_value")
+def daily_value(data: Dataset):
+    calculate_portfolio_daily_value(data.portfolio, data.dates[len(data.dates) // 2])
+
+
+def clear_cache(data: Dataset):
+    cache.clear()
+
+
+@benchmark("plot_png", setup=clear_cache)
+def plot_png(data: Dataset):
+    generate_portfolio_plots(data.portfolio, data.dates[0], data.dates[-1])
+
+
+@benchmark("plot_svg_500_points", setup=clear_cache)
+def plot_svg(data: Dataset):
+    generate_portfolio_plots(
+        data.portfolio, data.dates[0], data.dates[-1], "svg", points=500
+    )
+
+
+@benchmark("deposit_save")
+def deposit_save(data: Dataset):
+    Deposit(portfolio=data.portfolio, amount=Decimal(1000), date=data.dates[-1]).save()
+
+
+@benchmark("transaction_save")
+def transaction_save(data: Dataset):
+    asset_id = (
+        PortfolioAsset.objects.filter(portfolio=data.portfolio)
+        .values_list("asset_id", flat=True)
+        .first()
+    )
+    Transaction(
+        portfolio=data.portfolio,
+        asset_id=asset_id,
+        date=data.dates[len(data.dates) // 2],
+        transaction_type=Transaction.TRANSACTION_BUY,
+        value=Decimal(100),
+    ).save()
+
+
+@benchmark("rebalance_plan")
+def rebalance_plan(data: Dataset):
+    """
+    The trades that rebalance every portfolio on the last date
+    """
+    plan_rebalance(list(Portfolio.objects.all()), data.dates[-1])
+
+
+@benchmark("backtest_threshold")
+def backtest_threshold(data: Dataset):
+    run_backtests(
+        [data.portfolio],
+        data.dates[0],
+        data.dates[-1],
+        1_000_000,
+        [{"rebalance": "threshold", "threshold": 0.02}],
+        windows=[21, 63, 252],
+    )
+
+
+@benchmark("import_workbook")
+def ingestion(data: Dataset):
+    """
+    What UploadExcelView's background job runs. The warm-up run inserts the
+    rows, so the timed ones measure re-uploading the same file.
+    """
+    import_workbook(data.workbook)
+
+
+def run_benchmark(bench: Benchmark, data: Dataset, repeat: int) -> Result:
+    """
+    Time a benchmark `repeat` times, after one untimed warm-up run
+    """
+    result = Result(name=bench.name)
+    for i in range(repeat + 1):
+        if bench.setup:
+            bench.setup(data)
+        started = time.perf_counter()
+        bench.run(data)
+        elapsed = time.perf_counter() - started
+        if i:
+            result.timings.append(elapsed)
+    return result
@@ -0,0 +1,81 @@
+"""
+In-process caches for hot lookups.
+
+These live in each worker's memory, so entries also expire after a short TTL
+to bound how stale a worker can get when another one writes.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with a bounded size and a TTL
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key, MISSING)
+            if entry is MISSING:
+                return default
+
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Latest price of each asset, keyed by asset id
+latest_prices = LRUCache(
+    maxsize=getattr(settings, "LATEST_PRICE_CACHE_SIZE", 1024),
+    ttl=getattr(settings, "LATEST_PRICE_CACHE_TTL", 60),
+)
+
+# Price history of each asset sorted by date, for as-of lookups (see
+# Price.prices_as_of)
+price_history = LRUCache(
+    maxsize=getattr(settings, "PRICE_HISTORY_CACHE_SIZE", 256),
+    ttl=getattr(settings, "PRICE_HISTORY_CACHE_TTL", 60),
+)
+
+
+def invalidate_prices(asset_ids):
+    """
+    Drop what's cached about the prices of the given assets
+    """
+    latest_prices.invalidate(asset_ids)
+    price_history.invalidate(asset_ids)
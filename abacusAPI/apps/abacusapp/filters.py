@@ -1,6 +1,6 @@
 import django_filters
 
-from .models import PortfolioAsset
+from .models import PortfolioAsset, Price
 
 
 class PortfolioAssetFilter(django_filters.FilterSet):
@@ -12,3 +12,14 @@ class PortfolioAssetFilter(django_filters.FilterSet):
     class Meta:
         model = PortfolioAsset
         fields = ["portfolio", "portfolio_id"]
+
+
+class PriceFilter(django_filters.FilterSet):
+    asset = django_filters.CharFilter(field_name="asset__name", lookup_expr="iexact")
+    asset_id = django_filters.NumberFilter(field_name="asset__id")
+    fecha_inicio = django_filters.DateFilter(field_name="date", lookup_expr="gte")
+    fecha_fin = django_filters.DateFilter(field_name="date", lookup_expr="lte")
+
+    class Meta:
+        model = Price
+        fields = ["asset", "asset_id", "fecha_inicio", "fecha_fin"]
@@ -0,0 +1,91 @@
+"""
+Background execution of Excel imports.
+
+Imports run in a small local thread pool, so uploads return right away
+without needing an outside broker. The number of queued and running jobs
+is capped so several huge uploads can't starve the API workers.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from . import profiling
+from .models import ImportJob
+from .services import import_workbook
+from .valuation import refresh_stale_daily_values
+
+logger = logging.getLogger("abacusapp")
+
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "IMPORT_JOB_WORKERS", 2),
+    thread_name_prefix="abacus-import",
+)
+# Jobs either running or waiting for a worker
+slots = threading.BoundedSemaphore(getattr(settings, "IMPORT_JOB_MAX_PENDING", 4))
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def submit_import(file_path, file_name, profile=False) -> ImportJob:
+    """
+    Queue the import of an uploaded file, which is removed once it's done.
+
+    With `profile`, the import is profiled too (see profiling.py).
+    """
+    if not slots.acquire(blocking=False):
+        raise JobQueueFull("Too many imports in progress, try again later.")
+
+    try:
+        job = ImportJob.objects.create(file_name=file_name)
+        executor.submit(run_import, job.id, file_path, profile)
+    except Exception:
+        slots.release()
+        raise
+
+    logger.info("Queued File Import [job=%d, file=%s]", job.id, file_name)
+    return job
+
+
+def run_import(job_id, file_path, profile=False):
+    jobs = ImportJob.objects.filter(id=job_id)
+
+    def on_progress(rows):
+        jobs.update(rows_processed=F("rows_processed") + rows)
+
+    # the upload request is still being profiled, give it time to finish
+    profiled = (
+        profiling.profile(f"import job {job_id}", wait=30, job=job_id)
+        if profile
+        else nullcontext()
+    )
+
+    try:
+        jobs.update(status=ImportJob.STATUS_RUNNING, started_at=timezone.now())
+        with profiled:
+            import_workbook(file_path, on_progress=on_progress)
+            # get the daily values ready here instead of on the next request
+            refresh_stale_daily_values()
+        jobs.update(status=ImportJob.STATUS_DONE, finished_at=timezone.now())
+        logger.info("File Import Done [job=%d]", job_id)
+    except Exception as e:
+        logger.exception("File Import Failed [job=%d]", job_id)
+        jobs.update(
+            status=ImportJob.STATUS_FAILED,
+            error=str(e),
+            finished_at=timezone.now(),
+        )
+    finally:
+        # Always clean up the file
+        os.remove(file_path)
+        slots.release()
+        close_old_connections()
@@ -0,0 +1,121 @@
+"""
+Logging pieces wired up in settings.LOGGING.
+
+Records are handed to a background thread that formats and writes them, so
+a logging call only costs building the record. Logs inside loops over rows
+go to the `abacusapp.rows` logger, which only lets a sample of them through.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+from collections import Counter
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler as BaseQueueHandler
+from logging.handlers import QueueListener
+
+# attributes every record has, anything else came in `extra`
+RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record, with the `extra` fields it was logged with
+    """
+
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **{k: v for k, v in vars(record).items() if k not in RECORD_ATTRS},
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class QueueHandler(BaseQueueHandler):
+    """
+    Queue records for a background listener that writes them with `target`
+    (stderr by default), instead of writing them in the logging thread.
+
+    When the queue is full records are dropped rather than blocking the
+    caller. The formatter set on this handler is used by the target.
+    """
+
+    def __init__(self, target: logging.Handler = None, maxsize: int = 10_000):
+        super().__init__(queue.Queue(maxsize))
+        self.target = target or logging.StreamHandler()
+        self.dropped = 0
+        self.listener = None
+        self.pid = None
+        atexit.register(self.stop)
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        """
+        Resolve what can change or can't be pickled, and leave the rest of
+        the formatting to the listener
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        # the listener thread doesn't survive a fork
+        if self.pid != os.getpid():
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        self.pid = os.getpid()
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def stop(self):
+        """
+        Write out what's still queued
+        """
+        if self.listener is not None and self.pid == os.getpid():
+            try:
+                self.listener.stop()
+            except queue.Full:
+                pass
+            self.listener = None
+
+
+class SampleFilter(logging.Filter):
+    """
+    Let through the first record of each logging call, and then one every
+    `every` of them
+    """
+
+    def __init__(self, every: int = 100):
+        super().__init__()
+        self.every = every
+        self.counts = Counter()
+
+    def filter(self, record):
+        key = (record.pathname, record.lineno)
+        count = self.counts[key]
+        self.counts[key] = count + 1
+        if count % self.every:
+            return False
+        record.sampled = f"1/{self.every}"
+        return True
@@ -0,0 +1,51 @@
+import time
+from dataclasses import replace
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from abacusAPI.apps.abacusapp.synthetic import SCALES, generate_dataset
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic portfolios, assets, prices, deposits and trades"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            choices=SCALES,
+            default="small",
+            help="Preset sizes, which the options below override",
+        )
+        parser.add_argument("--portfolios", type=int)
+        parser.add_argument("--assets", type=int)
+        parser.add_argument("--days", type=int, help="Business days of prices")
+        parser.add_argument("--transactions", type=int)
+        parser.add_argument("--deposits", type=int)
+        parser.add_argument(
+            "--start", type=date.fromisoformat, default=date(2015, 1, 1)
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--prefix", default="SYN", help="Prefix of the asset and portfolio names"
+        )
+
+    def handle(self, *args, **options):
+        overrides = {
+            field: options[field]
+            for field in ("portfolios", "assets", "days", "transactions", "deposits")
+            if options[field] is not None
+        }
+        scale = replace(SCALES[options["scale"]], **overrides)
+
+        started = time.perf_counter()
+        counts = generate_dataset(
+            scale,
+            start=options["start"],
+            seed=options["seed"],
+            prefix=options["prefix"],
+        )
+        elapsed = time.perf_counter() - started
+
+        summary = ", ".join(f"{count} {name}" for name, count in counts.items())
+        self.stdout.write(f"Generated {summary} in {elapsed:.1f}s")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from abacusAPI.apps.abacusapp.models import Portfolio
+from abacusAPI.apps.abacusapp.valuation import refresh_daily_values
+
+
+class Command(BaseCommand):
+    help = "Recompute the materialized daily values of every portfolio"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--portfolio",
+            type=int,
+            action="append",
+            dest="portfolios",
+            help="Only rebuild the given portfolio id (can be repeated)",
+        )
+
+    def handle(self, *args, **options):
+        portfolios = Portfolio.objects.all()
+        if options["portfolios"]:
+            portfolios = portfolios.filter(id__in=options["portfolios"])
+
+        Portfolio.touch(portfolios.values_list("id", flat=True))
+
+        for portfolio in portfolios:
+            refresh_daily_values(portfolio)
+            self.stdout.write(
+                f"Rebuilt {portfolio} ({portfolio.daily_values.count()} days)"
+            )
@@ -0,0 +1,128 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from abacusAPI.apps.abacusapp.models import (
+    Deposit,
+    Holding,
+    Portfolio,
+    PortfolioAsset,
+    Transaction,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the holdings ledger by replaying every Deposit and Transaction. "
+        "The result is approximate: deposits are split with the current target "
+        "weights, and movements without a price on their date are skipped. "
+        "Whatever is left to match the current quantities counts from the start "
+        "of the history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--portfolio",
+            type=int,
+            action="append",
+            dest="portfolios",
+            help="Only rebuild the given portfolio id (can be repeated)",
+        )
+
+    def handle(self, *args, **options):
+        portfolios = Portfolio.objects.all()
+        if options["portfolios"]:
+            portfolios = portfolios.filter(id__in=options["portfolios"])
+
+        for portfolio in portfolios:
+            with transaction.atomic():
+                Holding.objects.filter(portfolio=portfolio).delete()
+                count, skipped = self.replay(portfolio)
+                reconciled = self.reconcile(portfolio)
+                Portfolio.touch([portfolio.id])
+
+            self.stdout.write(
+                f"Rebuilt {portfolio} from {count} movements (approximate)"
+            )
+            if skipped:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"  skipped {skipped} splits or transactions without a price"
+                    )
+                )
+            if reconciled:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"  {reconciled} assets didn't match their current quantity, "
+                        "the difference counts from the start of the history"
+                    )
+                )
+
+    def replay(self, portfolio):
+        """
+        Replay the movements of a portfolio on its empty ledger, and get how
+        many were replayed and how many deposit splits or transactions were
+        skipped for lack of a price
+        """
+        deposits = Deposit.objects.filter(portfolio=portfolio)
+        transactions = Transaction.objects.filter(portfolio=portfolio).select_related(
+            "asset"
+        )
+        # deposits are split with the current target weights, as there's no
+        # record of the weights they were split with
+        portfolio_assets = list(
+            PortfolioAsset.objects.filter(
+                portfolio=portfolio, weight__gt=0
+            ).select_related("asset")
+        )
+
+        skipped = 0
+        movements = sorted(
+            [*deposits, *transactions], key=lambda movement: movement.date
+        )
+        for movement in movements:
+            if isinstance(movement, Deposit):
+                for pa in portfolio_assets:
+                    price = pa.asset.price_by_date(movement.date, cached=False)
+                    if not price:
+                        skipped += 1
+                        continue
+                    Holding.apply_delta(
+                        portfolio,
+                        pa.asset,
+                        movement.date,
+                        pa.weight * movement.amount / price,
+                    )
+            else:
+                price = movement.asset.price_by_date(movement.date, cached=False)
+                if not price:
+                    skipped += 1
+                    continue
+                quantity = movement.value / price
+                if movement.transaction_type == Transaction.TRANSACTION_SELL:
+                    quantity = -quantity
+                Holding.apply_delta(portfolio, movement.asset, movement.date, quantity)
+
+        return len(movements), skipped
+
+    def reconcile(self, portfolio):
+        """
+        Make the latest position of each asset match its current quantity,
+        like quantities set directly do, and get how many assets needed it
+        """
+        reconciled = 0
+        for pa in PortfolioAsset.objects.filter(portfolio=portfolio).select_related(
+            "asset"
+        ):
+            latest = (
+                Holding.objects.filter(portfolio=portfolio, asset=pa.asset)
+                .order_by("-date")
+                .values_list("quantity", flat=True)
+                .first()
+            )
+            delta = pa.quantity - (latest or 0)
+            if delta:
+                Holding.apply_delta(portfolio, pa.asset, date.min, delta)
+                reconciled += 1
+        return reconciled
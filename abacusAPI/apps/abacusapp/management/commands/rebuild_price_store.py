@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from abacusAPI.apps.abacusapp import pricestore
+from abacusAPI.apps.abacusapp.models import Asset, Portfolio, Price
+
+
+class Command(BaseCommand):
+    help = "Rewrite the memory-mapped price store from the Price table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--asset",
+            type=int,
+            action="append",
+            dest="assets",
+            help="Only rebuild the given asset id (can be repeated)",
+        )
+
+    def handle(self, *args, **options):
+        if pricestore.get_store_dir() is None:
+            raise CommandError("The price store is disabled (PRICE_STORE_DIR)")
+
+        assets = Asset.objects.all()
+        if options["assets"]:
+            assets = assets.filter(id__in=options["assets"])
+
+        asset_ids = list(assets.values_list("id", flat=True))
+        Price.rebuild_store(asset_ids)
+        Portfolio.touch(asset_ids=asset_ids)
+        self.stdout.write(
+            f"Rebuilt {len(asset_ids)} assets into {pricestore.get_store_dir()}"
+        )
@@ -0,0 +1,148 @@
+import json
+import logging
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from abacusAPI.apps.abacusapp.benchmarks import BENCHMARKS, load_dataset, run_benchmark
+from abacusAPI.apps.abacusapp.cache import latest_prices, price_history
+from abacusAPI.apps.abacusapp.synthetic import SCALES, generate_dataset
+
+DEFAULT_BASELINE = settings.BASE_DIR.parent / "benchmarks" / "baselines.json"
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the main services on synthetic data, in a throwaway database, "
+        "and compare the results with the stored baselines"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            choices=SCALES,
+            action="append",
+            dest="scales",
+            help="Dataset size to run at (can be repeated, small by default)",
+        )
+        parser.add_argument(
+            "--only",
+            action="append",
+            help="Only run the given benchmark (can be repeated)",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            help="Slowdown ratio over the baseline that counts as a regression",
+        )
+        parser.add_argument(
+            "--save-baseline",
+            action="store_true",
+            help="Store these results as the new baselines",
+        )
+
+    def handle(self, *args, **options):
+        baselines = {"threshold": 1.5, "min_delta": 0.005, "scales": {}}
+        if options["baseline"].exists():
+            baselines = json.loads(options["baseline"].read_text())
+        threshold = options["threshold"] or baselines["threshold"]
+
+        benchmarks = [
+            bench
+            for bench in BENCHMARKS
+            if not options["only"] or bench.name in options["only"]
+        ]
+
+        # the services log each row at INFO, which would drown the results
+        if options["verbosity"] < 2:
+            logging.disable(logging.INFO)
+
+        regressions = []
+        try:
+            for scale_name in options["scales"] or ["small"]:
+                results = self.run_scale(scale_name, benchmarks, options["repeat"])
+                regressions += self.report(
+                    scale_name,
+                    results,
+                    baselines["scales"].get(scale_name, {}),
+                    threshold,
+                    baselines["min_delta"],
+                )
+                if options["save_baseline"]:
+                    stored = baselines["scales"].setdefault(scale_name, {})
+                    stored.update({r.name: round(r.median, 6) for r in results})
+        finally:
+            logging.disable(logging.NOTSET)
+
+        if options["save_baseline"]:
+            options["baseline"].parent.mkdir(parents=True, exist_ok=True)
+            options["baseline"].write_text(json.dumps(baselines, indent=2) + "\n")
+            self.stdout.write(f"Saved baselines to {options['baseline']}")
+
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}"
+            )
+
+    def run_scale(self, scale_name, benchmarks, repeat) -> list:
+        scale = SCALES[scale_name]
+        self.stdout.write(f"\n[{scale_name}] {scale}")
+
+        with tempfile.TemporaryDirectory() as workdir, override_settings(
+            MEDIA_ROOT=workdir, PRICE_STORE_DIR=Path(workdir) / "price_store"
+        ):
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False
+            )
+            # sqlite keeps in-memory test databases alive between scales
+            call_command("flush", interactive=False, verbosity=0)
+            # ids start over in the new database
+            cache.clear()
+            latest_prices.clear()
+            price_history.clear()
+            try:
+                counts = generate_dataset(scale)
+                self.stdout.write(
+                    "Generated " + ", ".join(f"{v} {k}" for k, v in counts.items())
+                )
+                data = load_dataset(scale, Path(workdir))
+                return [run_benchmark(bench, data, repeat) for bench in benchmarks]
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def report(self, scale_name, results, baseline, threshold, min_delta) -> list:
+        self.stdout.write(
+            f"{'benchmark':<22}{'median':>10}{'best':>10}{'baseline':>10}{'ratio':>8}"
+        )
+
+        regressions = []
+        for result in results:
+            expected = baseline.get(result.name)
+            if expected is None:
+                ratio, status = "", "new"
+            else:
+                ratio = f"{result.median / expected:.2f}"
+                slower = result.median - expected
+                if result.median > expected * threshold and slower > min_delta:
+                    status = self.style.ERROR("REGRESSION")
+                    regressions.append(f"{scale_name}/{result.name}")
+                else:
+                    status = self.style.SUCCESS("ok")
+
+            self.stdout.write(
+                f"{result.name:<22}"
+                f"{result.median * 1000:>8.1f}ms"
+                f"{result.best * 1000:>8.1f}ms"
+                f"{'' if expected is None else f'{expected * 1000:.1f}ms':>10}"
+                f"{ratio:>8}  {status}"
+            )
+
+        return regressions
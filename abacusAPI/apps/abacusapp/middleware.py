@@ -0,0 +1,205 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import timing
+from .profiling import profile
+from .timing import RequestTiming, install_query_recorder
+
+logger = logging.getLogger("abacusapp")
+
+
+def ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+class RequestTimingMiddleware:
+    """
+    Measure the queries, database time, serialization and render time of
+    each request, and report them in a Server-Timing header and a log line.
+
+    Requests over REQUEST_QUERY_BUDGET queries or REQUEST_TIME_BUDGET_MS are
+    logged as warnings, to spot the endpoints with N+1 queries or slow paths.
+    Streaming responses are measured up to their first byte.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+        connection_created.connect(
+            install_query_recorder, dispatch_uid="abacusapp.timing"
+        )
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        metrics = RequestTiming()
+        token = timing.current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.current.reset(token)
+        return self.report(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestTiming()
+        token = timing.current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.current.reset(token)
+        return self.report(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        """
+        Time the rendering of DRF responses, which happens after the view
+        """
+        metrics = timing.current.get()
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.durations["render"] += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def report(self, request, response, metrics: RequestTiming):
+        total = metrics.elapsed
+        durations = {
+            name: ms(metrics.durations.get(name, 0))
+            for name in ("db", "serialize", "render")
+        }
+
+        if settings.SERVER_TIMING_HEADER:
+            entries = [f'db;dur={durations["db"]};desc="{metrics.queries} queries"']
+            entries += [
+                f"{name};dur={durations[name]}"
+                for name in ("serialize", "render")
+                if name in metrics.durations
+            ]
+            entries.append(f"total;dur={ms(total)}")
+            response["Server-Timing"] = ", ".join(entries)
+
+        endpoint = getattr(request.resolver_match, "view_name", None) or request.path
+        over_budget = []
+        if metrics.queries > settings.REQUEST_QUERY_BUDGET:
+            over_budget.append("queries")
+        if total * 1000 > settings.REQUEST_TIME_BUDGET_MS:
+            over_budget.append("time")
+
+        fields = {
+            "endpoint": endpoint,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": metrics.queries,
+            **{f"{name}_ms": duration for name, duration in durations.items()},
+            "total_ms": ms(total),
+            "over_budget": over_budget,
+        }
+        logger.log(
+            logging.WARNING if over_budget else logging.INFO,
+            "%s [endpoint=%s, method=%s, status=%d, queries=%d, db=%.1fms, "
+            "serialize=%.1fms, render=%.1fms, total=%.1fms]",
+            "Request Over Budget" if over_budget else "Request Done",
+            endpoint,
+            request.method,
+            response.status_code,
+            metrics.queries,
+            durations["db"],
+            durations["serialize"],
+            durations["render"],
+            ms(total),
+            extra={"timing": fields},
+        )
+        return response
+
+
+def wants_profile(request) -> bool:
+    return request.headers.get("X-Profile") == "1" or request.GET.get("profile") == "1"
+
+
+def is_staff(request) -> bool:
+    """
+    Check whether a request comes from staff, authenticating it like the
+    API views do
+    """
+    drf_request = Request(
+        request,
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+    )
+    try:
+        return drf_request.user.is_staff
+    except APIException:
+        return False
+
+
+class ProfilingMiddleware:
+    """
+    Profile a request when staff ask for it, with an `X-Profile: 1` header or
+    a `profile=1` query parameter (see profiling.py). The name of the stored
+    profile comes back in the X-Profile response header.
+
+    Async requests are only profiled on the event loop's thread, and
+    streaming responses up to their first byte.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not wants_profile(request) or not is_staff(request):
+            return self.get_response(request)
+
+        with profile(**self.describe(request)) as meta:
+            request.profile = meta
+            response = self.get_response(request)
+            self.finish(response, meta)
+        return response
+
+    async def __acall__(self, request):
+        if not wants_profile(request) or not await sync_to_async(is_staff)(request):
+            return await self.get_response(request)
+
+        with profile(**self.describe(request)) as meta:
+            request.profile = meta
+            response = await self.get_response(request)
+            self.finish(response, meta)
+        return response
+
+    def describe(self, request) -> dict:
+        return {
+            "label": f"{request.method} {request.path}",
+            "method": request.method,
+            "path": request.get_full_path(),
+            "user": request.user.username,
+        }
+
+    def finish(self, response, meta):
+        if meta is not None:
+            meta["status"] = response.status_code
+            response["X-Profile"] = meta["name"]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1 on 2026-10-18 15:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("abacusapp", "0012_alter_portfolioasset_quantity_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Holding",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                (
+                    "quantity",
+                    models.DecimalField(decimal_places=4, default=0, max_digits=20),
+                ),
+                (
+                    "asset",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="abacusapp.asset",
+                    ),
+                ),
+                (
+                    "portfolio",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="holdings",
+                        to="abacusapp.portfolio",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["portfolio", "date"],
+                        name="abacusapp_h_portfol_45fc57_idx",
+                    )
+                ],
+                "unique_together": {("portfolio", "asset", "date")},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 15:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("abacusapp", "0014_importjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="portfolio",
+            name="data_version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
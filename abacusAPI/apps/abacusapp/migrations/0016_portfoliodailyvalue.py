@@ -0,0 +1,56 @@
+# Generated by Django 5.1 on 2026-10-18 15:50
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mark_values_stale(apps, schema_editor):
+    # existing portfolios get their daily values built on the next read
+    Portfolio = apps.get_model("abacusapp", "Portfolio")
+    Portfolio.objects.update(values_stale_since=datetime.date.min)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("abacusapp", "0015_portfolio_data_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="portfolio",
+            name="values_stale_since",
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name="PortfolioDailyValue",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("value", models.DecimalField(decimal_places=4, max_digits=20)),
+                ("weights", models.JSONField(default=dict)),
+                (
+                    "portfolio",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_values",
+                        to="abacusapp.portfolio",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("portfolio", "date")},
+            },
+        ),
+        migrations.RunPython(mark_values_stale, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1 on 2026-10-18 15:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("abacusapp", "0016_portfoliodailyvalue"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="price",
+            index=models.Index(
+                fields=["date", "asset", "id"], name="abacusapp_p_date_317f35_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("abacusapp", "0017_price_abacusapp_p_date_317f35_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="portfolio",
+            name="data_updated_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
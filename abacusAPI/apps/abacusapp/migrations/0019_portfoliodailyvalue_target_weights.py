@@ -0,0 +1,27 @@
+# Generated by Django 5.1 on 2026-10-18 16:30
+
+import datetime
+
+from django.db import migrations, models
+
+
+def mark_values_stale(apps, schema_editor):
+    # existing rows hold the target weights as `weights`, rebuild them all
+    Portfolio = apps.get_model("abacusapp", "Portfolio")
+    Portfolio.objects.update(values_stale_since=datetime.date.min)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("abacusapp", "0018_portfolio_data_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="portfoliodailyvalue",
+            name="target_weights",
+            field=models.JSONField(default=dict),
+        ),
+        migrations.RunPython(mark_values_stale, migrations.RunPython.noop),
+    ]
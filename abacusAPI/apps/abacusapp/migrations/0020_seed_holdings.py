@@ -0,0 +1,43 @@
+# Generated by Django 5.1 on 2026-10-18 18:10
+
+import datetime
+
+from django.db import migrations
+from django.db.models import F
+
+
+def seed_holdings(apps, schema_editor):
+    # quantities set before the ledger (or outside of Deposits and
+    # Transactions) count from the start of the history
+    Holding = apps.get_model("abacusapp", "Holding")
+    Portfolio = apps.get_model("abacusapp", "Portfolio")
+    PortfolioAsset = apps.get_model("abacusapp", "PortfolioAsset")
+
+    for pa in PortfolioAsset.objects.all().iterator():
+        rows = Holding.objects.filter(portfolio_id=pa.portfolio_id, asset_id=pa.asset_id)
+        latest = rows.order_by("-date").values_list("quantity", flat=True).first()
+        delta = pa.quantity - (latest or 0)
+        if not delta:
+            continue
+
+        rows.update(quantity=F("quantity") + delta)
+        if not rows.filter(date=datetime.date.min).exists():
+            Holding.objects.create(
+                portfolio_id=pa.portfolio_id,
+                asset_id=pa.asset_id,
+                date=datetime.date.min,
+                quantity=delta,
+            )
+
+    Portfolio.objects.update(values_stale_since=datetime.date.min)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("abacusapp", "0019_portfoliodailyvalue_target_weights"),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_holdings, migrations.RunPython.noop),
+    ]
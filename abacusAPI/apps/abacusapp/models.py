@@ -1,11 +1,39 @@
 import logging
-from datetime import datetime
-
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate, groupby
+
+import numpy as np
+from django.conf import settings
 from django.db import models, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Least
 from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
+from . import pricestore, response_cache
+from .cache import MISSING, invalidate_prices, latest_prices, price_history
+
 logger = logging.getLogger("abacusapp")
+# per-row logs, sampled (see log.py)
+rows_logger = logging.getLogger("abacusapp.rows")
+
+QUANTITY_PLACES = Decimal("0.0001")
+
+# prices changed in each thread's transaction (see Price.changed)
+_pending_prices = threading.local()
+
+
+def pending_price_changes() -> dict:
+    """
+    Get the changed prices not applied yet, as asset id -> earliest date
+    """
+    if not hasattr(_pending_prices, "changes"):
+        _pending_prices.changes = {}
+    return _pending_prices.changes
 
 
 class Portfolio(models.Model):
@@ -13,10 +41,71 @@ class Portfolio(models.Model):
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Bumped whenever the prices or holdings behind its valuations change
+    data_version = models.PositiveIntegerField(default=0, editable=False)
+    # Earliest date whose PortfolioDailyValue rows are out of date, if any
+    values_stale_since = models.DateField(null=True, blank=True, editable=False)
+    # When data_version was last bumped
+    data_updated_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # Only ever written by touch() and the daily values refresh
+    TRACKING_FIELDS = ("data_version", "values_stale_since", "data_updated_at")
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # so saving a stale instance can't undo a concurrent touch()
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.TRACKING_FIELDS
+            ]
+        super().save(*args, **kwargs)
+        response_cache.invalidate()
+
+    def delete(self, *args, **kwargs):
+        response_cache.invalidate()
+        return super().delete(*args, **kwargs)
+
+    @property
+    def data_key(self) -> str:
+        """
+        Changes whenever anything behind this portfolio's valuations does
+        """
+        return f"{self.id}:{self.data_version}:{self.updated_at.isoformat()}"
+
+    @classmethod
+    def touch(cls, portfolio_ids=(), asset_ids=(), since=date.min):
+        """
+        Bump the data version of the given portfolios and of every portfolio
+        holding one of the given assets, so results cached on them expire.
+
+        Their daily values are also marked as stale from `since` on (all of
+        them by default), to be recomputed on the next read.
+        """
+        query = Q(id__in=list(portfolio_ids))
+        asset_ids = list(asset_ids)
+        if asset_ids:
+            query |= Q(
+                id__in=PortfolioAsset.objects.filter(asset_id__in=asset_ids).values(
+                    "portfolio"
+                )
+            ) | Q(
+                id__in=Holding.objects.filter(asset_id__in=asset_ids).values(
+                    "portfolio"
+                )
+            )
+
+        since = Value(since, output_field=models.DateField())
+        cls.objects.filter(query).update(
+            data_version=F("data_version") + 1,
+            values_stale_since=Coalesce(Least("values_stale_since", since), since),
+            data_updated_at=timezone.now(),
+        )
+        response_cache.invalidate()
+
 
 class Asset(models.Model):
     name = models.CharField(max_length=100)
@@ -24,16 +113,60 @@ class Asset(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        response_cache.invalidate()
+        if not adding:
+            # daily values keep their weights by asset name
+            Portfolio.touch(asset_ids=[self.id])
+
+    def delete(self, *args, **kwargs):
+        Portfolio.touch(asset_ids=[self.id])
+        asset_id = self.id
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(lambda: pricestore.discard([asset_id]))
+        return result
+
     @property
     def price(self):
         # Get the latest price for this asset
-        latest_price = self.prices.order_by("-date").first()
-        return latest_price.price if latest_price else None
+        return Asset.latest_prices([self.id])[self.id]
 
-    def price_by_date(self, date: datetime):
-        # Get the price on the given date
-        price = self.prices.get(date=date)
-        return price.price if price else None
+    @classmethod
+    def latest_prices(cls, asset_ids) -> dict:
+        """
+        Get the latest price of each asset, querying only the ones not cached
+        """
+        prices = {}
+        missing = []
+        for asset_id in asset_ids:
+            price = latest_prices.get(asset_id)
+            if price is MISSING:
+                missing.append(asset_id)
+            else:
+                prices[asset_id] = price
+
+        if missing:
+            latest = Price.objects.filter(asset=OuterRef("pk")).order_by("-date")
+            rows = (
+                cls.objects.filter(id__in=missing)
+                .annotate(latest_price=Subquery(latest.values("price")[:1]))
+                .values_list("id", "latest_price")
+            )
+            for asset_id, price in rows:
+                latest_prices.set(asset_id, price)
+                prices[asset_id] = price
+
+        return prices
+
+    def price_by_date(self, date: datetime, cached=True):
+        """
+        Get the price as of the given date (see Price.prices_as_of), or None
+        """
+        date = Price._meta.get_field("date").to_python(date)
+        prices = Price.prices_as_of([(self.id, date)], cached=cached)
+        return prices.get((self.id, date))
 
 
 class Price(models.Model):
@@ -44,6 +177,170 @@ class Price(models.Model):
     class Meta:
         # Ensure unique price per asset per date
         unique_together = ("asset", "date")
+        indexes = [
+            # keyset pagination key
+            models.Index(fields=["date", "asset", "id"]),
+        ]
+
+    def save(self, *args, **kwargs):
+        previous = Price.objects.filter(pk=self.pk).values_list("asset", "date").first()
+        super().save(*args, **kwargs)
+
+        # a price moved to another asset or date leaves a gap where it was
+        asset_ids = {self.asset_id}
+        since = Price._meta.get_field("date").to_python(self.date)
+        if previous:
+            asset_ids.add(previous[0])
+            since = min(since, previous[1])
+        Portfolio.touch(asset_ids=asset_ids, since=since)
+        Price.changed(asset_ids, since)
+
+    def delete(self, *args, **kwargs):
+        Portfolio.touch(asset_ids=[self.asset_id], since=self.date)
+        result = super().delete(*args, **kwargs)
+        Price.changed([self.asset_id], self.date)
+        return result
+
+    @classmethod
+    def changed(cls, asset_ids, since):
+        """
+        Expire the cached prices and rewrite the store files of the given
+        assets once the current transaction commits: only then, so other
+        requests can't cache the old prices again in between, and only once
+        for every price changed in the transaction.
+        """
+        pending = pending_price_changes()
+        for asset_id in asset_ids:
+            pending[asset_id] = min(pending.get(asset_id, since), since)
+        # later callbacks of the same transaction find nothing left to do
+        transaction.on_commit(cls.apply_changes)
+
+    @classmethod
+    def apply_changes(cls):
+        """
+        Expire and rewrite what changed since the last commit (see changed)
+        """
+        pending = pending_price_changes()
+        _pending_prices.changes = {}
+        if not pending:
+            return
+
+        invalidate_prices(pending)
+        if pricestore.get_store_dir() is None:
+            return
+        cls.rebuild_store(list(pending))
+        # valuations computed before the new files landed are stale again
+        Portfolio.touch(asset_ids=pending, since=min(pending.values()))
+
+    @classmethod
+    def prices_as_of(cls, pairs, max_staleness=None, cached=True) -> dict:
+        """
+        Get the price of each (asset_id, date) pair as of its date: the last
+        one on or before it, if it's at most `max_staleness` days older
+        (PRICE_MAX_STALENESS_DAYS by default). Pairs without one are left out
+        of the result, which is keyed by (asset_id, date object).
+
+        Writes pass `cached=False`, to read the prices of their own transaction
+        rather than cached ones, only over the dates the pairs can use.
+        """
+        if max_staleness is None:
+            max_staleness = settings.PRICE_MAX_STALENESS_DAYS
+        to_date = cls._meta.get_field("date").to_python
+        pairs = [(asset_id, to_date(day)) for asset_id, day in pairs]
+        if not pairs:
+            return {}
+
+        between = None
+        if not cached:
+            days = [day for _, day in pairs]
+            first = None
+            if max_staleness is not None:
+                first = min(days) - timedelta(days=max_staleness)
+            between = (first, max(days))
+        histories = cls.price_histories(
+            {asset_id for asset_id, _ in pairs}, cached=cached, between=between
+        )
+
+        prices = {}
+        for asset_id, day in pairs:
+            ordinals, values = histories[asset_id]
+            ordinal = day.toordinal()
+            i = bisect_right(ordinals, ordinal) - 1
+            if i >= 0 and (
+                max_staleness is None or ordinal - ordinals[i] <= max_staleness
+            ):
+                prices[asset_id, day] = values[i]
+        return prices
+
+    @classmethod
+    def price_histories(cls, asset_ids, cached=True, between=None) -> dict:
+        """
+        Get the (date ordinals, prices) of each asset sorted by date, reading
+        the ones not cached (or all of them, without `cached`) in a single query.
+
+        Uncached histories can be limited to the (first, last) dates in
+        `between`, either of them None for no limit.
+        """
+        histories = {}
+        missing = []
+        for asset_id in asset_ids:
+            history = price_history.get(asset_id) if cached else MISSING
+            if history is MISSING:
+                missing.append(asset_id)
+            else:
+                histories[asset_id] = history
+
+        if missing:
+            loaded = {asset_id: ([], []) for asset_id in missing}
+            rows = cls.objects.filter(asset_id__in=missing)
+            if not cached and between:
+                first, last = between
+                if first is not None:
+                    rows = rows.filter(date__gte=first)
+                if last is not None:
+                    rows = rows.filter(date__lte=last)
+            rows = rows.order_by("asset_id", "date").values_list(
+                "asset_id", "date", "price"
+            )
+            for asset_id, day, price in rows.iterator():
+                loaded[asset_id][0].append(day.toordinal())
+                loaded[asset_id][1].append(price)
+            # what a transaction reads may never be committed
+            for asset_id, history in loaded.items() if cached else ():
+                price_history.set(asset_id, history)
+            histories.update(loaded)
+
+        return histories
+
+    @classmethod
+    def rebuild_store(cls, asset_ids):
+        """
+        Rewrite the price store files of the given assets from this table
+        """
+        if pricestore.get_store_dir() is None or not asset_ids:
+            return
+
+        with pricestore.locked():
+            rows = (
+                cls.objects.filter(asset_id__in=asset_ids)
+                .order_by("asset_id", "date")
+                .values_list("asset_id", "date", "price")
+            )
+            written = set()
+            for asset_id, group in groupby(rows.iterator(), key=lambda row: row[0]):
+                records = np.array(
+                    [
+                        (day.toordinal(), int(price * pricestore.SCALE))
+                        for _, day, price in group
+                    ],
+                    dtype=pricestore.RECORD,
+                )
+                pricestore.write(asset_id, records)
+                written.add(asset_id)
+
+            # an empty file, so reads don't keep rebuilding it
+            for asset_id in set(asset_ids) - written:
+                pricestore.write(asset_id, np.empty(0, dtype=pricestore.RECORD))
 
     def __str__(self):
         return f"{self.asset.name} - {self.price} on {self.date}"
@@ -58,51 +355,285 @@ class PortfolioAsset(models.Model):
     class Meta:
         unique_together = ("portfolio", "asset")
 
+    def save(self, *args, record=True, **kwargs):
+        """
+        Record quantity changes on the holdings ledger, unless `record` is
+        False because the caller records them with their own date (like a
+        Transaction).
+
+        A quantity set directly has no date, so the change counts from the
+        start of the history, as every quantity did before the ledger. So do
+        new rows and weight changes, as the target weights of every day change.
+        """
+        # to avoid partial updates
+        with transaction.atomic():
+            previous = (
+                PortfolioAsset.objects.filter(pk=self.pk)
+                .values_list("portfolio", "asset", "quantity", "weight")
+                .first()
+            )
+            super().save(*args, **kwargs)
+
+            moved = previous and previous[:2] != (self.portfolio_id, self.asset_id)
+            if record and moved and previous[2]:
+                Holding.apply_delta(
+                    Portfolio(id=previous[0]),
+                    Asset(id=previous[1]),
+                    date.min,
+                    -previous[2],
+                )
+            delta = Decimal(self.quantity) - (
+                previous[2] if previous and not moved else 0
+            )
+            if record and delta:
+                Holding.apply_delta(self.portfolio, self.asset, date.min, delta)
+
+            if moved:
+                Portfolio.touch([previous[0], self.portfolio_id])
+            elif previous is None or previous[3] != Decimal(self.weight):
+                Portfolio.touch([self.portfolio_id])
+
+    def delete(self, *args, **kwargs):
+        quantity = (
+            PortfolioAsset.objects.filter(pk=self.pk)
+            .values_list("quantity", flat=True)
+            .first()
+        )
+        with transaction.atomic():
+            if quantity:
+                Holding.apply_delta(self.portfolio, self.asset, date.min, -quantity)
+            Portfolio.touch([self.portfolio_id])
+            return super().delete(*args, **kwargs)
+
     def __str__(self):
         return f"{self.portfolio.name} - {self.asset.name} (q={self.quantity}, w={self.weight}%)"
 
 
+class Holding(models.Model):
+    """
+    Point-in-time position of an asset in a portfolio.
+
+    Each row keeps the quantity owned at the end of its date, so the rows of a
+    (portfolio, asset) pair are a running sum of every Deposit and Transaction.
+    The quantity on any date is the latest row on or before it.
+    """
+
+    portfolio = models.ForeignKey(
+        Portfolio, on_delete=models.CASCADE, related_name="holdings"
+    )
+    asset = models.ForeignKey(Asset, on_delete=models.CASCADE)
+    date = models.DateField()
+    quantity = models.DecimalField(max_digits=20, decimal_places=4, default=0)
+
+    class Meta:
+        unique_together = ("portfolio", "asset", "date")
+        indexes = [models.Index(fields=["portfolio", "date"])]
+
+    def __str__(self):
+        return f"{self.portfolio.name} - {self.asset.name} (q={self.quantity}) on {self.date}"
+
+    @classmethod
+    def apply_delta(cls, portfolio: Portfolio, asset: Asset, date, delta):
+        """
+        Add a quantity change on the given date to the running positions.
+
+        Every later row is shifted by the same delta, so back-dated changes keep
+        the rows consistent without replaying the whole history.
+        """
+        delta = delta.quantize(QUANTITY_PLACES)
+        rows = cls.objects.filter(portfolio=portfolio, asset=asset)
+
+        with transaction.atomic():
+            Portfolio.touch([portfolio.id], since=date)
+
+            updated = rows.filter(date__gte=date).update(quantity=F("quantity") + delta)
+            if updated and rows.filter(date=date).exists():
+                return
+
+            previous = (
+                rows.filter(date__lt=date)
+                .order_by("-date")
+                .values_list("quantity", flat=True)
+                .first()
+            )
+            cls.objects.create(
+                portfolio=portfolio,
+                asset=asset,
+                date=date,
+                quantity=(previous or 0) + delta,
+            )
+
+    @classmethod
+    def apply_deltas(cls, deltas: dict):
+        """
+        Add many quantity changes at once, keyed by (portfolio_id, asset_id, date).
+
+        The history of the affected pairs is read in one query, shifted in memory
+        and written back with one bulk update and one bulk insert.
+        """
+        to_date = cls._meta.get_field("date").to_python
+        changes = defaultdict(lambda: defaultdict(Decimal))
+        for (portfolio_id, asset_id, date), delta in deltas.items():
+            changes[portfolio_id, asset_id][to_date(date)] += delta.quantize(
+                QUANTITY_PLACES
+            )
+        if not changes:
+            return
+
+        history = defaultdict(list)
+        rows = (
+            cls.objects.filter(
+                portfolio_id__in={pair[0] for pair in changes},
+                asset_id__in={pair[1] for pair in changes},
+            )
+            .order_by("date")
+            .values_list("id", "portfolio_id", "asset_id", "date", "quantity")
+        )
+        for row_id, portfolio_id, asset_id, date, quantity in rows:
+            if (portfolio_id, asset_id) in changes:
+                history[portfolio_id, asset_id].append((date, quantity, row_id))
+
+        to_update, to_create = [], []
+        for (portfolio_id, asset_id), pair_deltas in changes.items():
+            rows = history[portfolio_id, asset_id]
+            dates = [row[0] for row in rows]
+            delta_dates = sorted(pair_deltas)
+            cumulative = list(accumulate(pair_deltas[date] for date in delta_dates))
+
+            def shift(date):
+                i = bisect_right(delta_dates, date)
+                return cumulative[i - 1] if i else 0
+
+            # every row from the first change on moves by the changes before it
+            for date, quantity, row_id in rows[bisect_left(dates, delta_dates[0]) :]:
+                to_update.append(cls(id=row_id, quantity=quantity + shift(date)))
+
+            # and changes on new dates start from the previous row
+            existing = set(dates)
+            for date in delta_dates:
+                if date in existing:
+                    continue
+                i = bisect_right(dates, date)
+                previous = rows[i - 1][1] if i else 0
+                to_create.append(
+                    cls(
+                        portfolio_id=portfolio_id,
+                        asset_id=asset_id,
+                        date=date,
+                        quantity=previous + shift(date),
+                    )
+                )
+
+        with transaction.atomic():
+            cls.objects.bulk_update(to_update, ["quantity"], batch_size=1000)
+            cls.objects.bulk_create(to_create, batch_size=1000)
+            Portfolio.touch(
+                {pair[0] for pair in changes},
+                since=min(min(dates) for dates in changes.values()),
+            )
+
+
 class Deposit(models.Model):
     portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=20, decimal_places=4)
     date = models.DateField(default=timezone.now)
 
     def save(self, *args, **kwargs):
-        self.distribute_deposit()
-        super().save(*args, **kwargs)
+        # to avoid partial updates
+        with transaction.atomic():
+            self.distribute_deposit()
+            super().save(*args, **kwargs)
 
     def distribute_deposit(self):
-        portfolio_assets = PortfolioAsset.objects.filter(portfolio=self.portfolio)
-        logger.info(f"Deposit Started [p={self.portfolio}, cant={self.amount}]")
+        Deposit.distribute_deposits([self])
 
-        total_weight = sum(pa.weight for pa in portfolio_assets)
-        if total_weight != 1:
-            raise ValidationError("The weights of the assets must sum up to 100%.")
+    @classmethod
+    def distribute_deposits(cls, deposits: list):
+        """
+        Split each deposit across the assets of its portfolio by their weights.
 
-        for pa in portfolio_assets:
-            allocation = pa.weight * self.amount
-            logger.debug(
-                f"Deposit for Asset: {pa.weight} * {self.amount} = {allocation} "
-                f"[p={self.portfolio.name}, a={pa.asset.name}, cant={self.amount}]",
+        All the portfolios are handled in one pass: their assets are locked and
+        read in one query, the prices of the deposit dates in another one, and
+        the new quantities are written with a single bulk update.
+        """
+        to_date = cls._meta.get_field("date").to_python
+
+        with transaction.atomic():
+            portfolio_assets = defaultdict(list)
+            for pa in (
+                PortfolioAsset.objects.select_for_update()
+                .filter(portfolio_id__in={d.portfolio_id for d in deposits})
+                .select_related("portfolio", "asset")
+                .order_by("id")
+            ):
+                portfolio_assets[pa.portfolio_id].append(pa)
+
+            prices = Price.prices_as_of(
+                (
+                    (pa.asset_id, to_date(d.date))
+                    for d in deposits
+                    for pa in portfolio_assets[d.portfolio_id]
+                ),
+                cached=False,
             )
 
-            asset_price = pa.asset.price_by_date(self.date)
-            if not asset_price:
-                raise ValidationError(
-                    f"Missing asset value for the given date [a={pa.asset}, date={self.date}]."
+            deltas = {}
+            for deposit in deposits:
+                rows_logger.debug(
+                    "Deposit Started [p=%d, cant=%s]",
+                    deposit.portfolio_id,
+                    deposit.amount,
                 )
+                date = to_date(deposit.date)
 
-            logger.debug(
-                f"Deposit for Asset: Adding {allocation} / {asset_price} to {pa.quantity} "
-                f"[p={self.portfolio.name}, a={pa.asset.name}, cant={self.amount}]",
-            )
-            pa.quantity += allocation / asset_price
-            logger.info(
-                f"Deposit for Asset Done "
-                f"[p={self.portfolio.name}, a={pa.asset.name}, cant={self.amount}, q={pa.quantity}]",
+                total_weight = sum(
+                    pa.weight for pa in portfolio_assets[deposit.portfolio_id]
+                )
+                if total_weight != 1:
+                    raise ValidationError(
+                        f"The weights of the assets must sum up to 100% [p={deposit.portfolio}]."
+                    )
+
+                for pa in portfolio_assets[deposit.portfolio_id]:
+                    allocation = pa.weight * deposit.amount
+
+                    asset_price = prices.get((pa.asset_id, date))
+                    if not asset_price:
+                        raise ValidationError(
+                            f"Missing asset value for the given date [a={pa.asset}, date={date}]."
+                        )
+
+                    quantity = allocation / asset_price
+                    # round like saving the PortfolioAsset each time would
+                    pa.quantity = (pa.quantity + quantity).quantize(QUANTITY_PLACES)
+                    rows_logger.debug(
+                        "Deposit for Asset Done [p=%d, a=%d, cant=%s, w=%s, price=%s, q=%s]",
+                        pa.portfolio_id,
+                        pa.asset_id,
+                        deposit.amount,
+                        pa.weight,
+                        asset_price,
+                        pa.quantity,
+                    )
+
+                    key = (pa.portfolio_id, pa.asset_id, date)
+                    deltas[key] = deltas.get(key, 0) + quantity.quantize(
+                        QUANTITY_PLACES
+                    )
+
+            PortfolioAsset.objects.bulk_update(
+                [pa for pas in portfolio_assets.values() for pa in pas],
+                ["quantity"],
+                batch_size=1000,
             )
+            Holding.apply_deltas(deltas)
 
-            pa.save()
+        logger.info(
+            "Deposits Done [n=%d, holdings=%d]",
+            len(deposits),
+            len(deltas),
+            extra={"deposits": len(deposits), "holdings": len(deltas)},
+        )
 
     def __str__(self):
         return f"Deposit of {self.amount} to {self.portfolio.name} on {self.date}"
@@ -134,7 +665,7 @@ class Transaction(models.Model):
         """
         logger.info("Preparing transaction changes on PortfolioAsset")
         # Get the price based on the asset and date
-        price = self.asset.price_by_date(self.date)
+        price = self.asset.price_by_date(self.date, cached=False)
         if not price:
             raise ValidationError(
                 f"Price not found for the given Asset [a={self.asset.name}, d={self.date}]"
@@ -174,8 +705,14 @@ class Transaction(models.Model):
                     )
                 portfolio_asset.quantity -= quantity
 
-            # Save the PortfolioAsset changes
-            portfolio_asset.save()
+            # Save the PortfolioAsset changes, recorded on the ledger below
+            portfolio_asset.save(record=False)
+
+            # Keep the point-in-time positions in sync
+            if self.transaction_type == self.TRANSACTION_BUY:
+                Holding.apply_delta(self.portfolio, self.asset, self.date, quantity)
+            else:
+                Holding.apply_delta(self.portfolio, self.asset, self.date, -quantity)
 
             # delete the portfolio_asset if quantities becomes zero
             if portfolio_asset.quantity == 0 and portfolio_asset.weight == 0:
@@ -185,3 +722,72 @@ class Transaction(models.Model):
 
     def __str__(self):
         return f"{self.transaction_type.capitalize()} {self.value} value of {self.asset.name} for {self.portfolio.name} on {self.date}"
+
+
+class ImportJob(models.Model):
+    """
+    Tracks an uploaded .xlsx file while it's imported in the background
+    """
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    file_name = models.CharField(max_length=255)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    rows_processed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Import of {self.file_name} ({self.status})"
+
+    @property
+    def throughput(self):
+        """
+        Rows processed per second since the job started
+        """
+        if not self.started_at:
+            return None
+        elapsed = (
+            (self.finished_at or timezone.now()) - self.started_at
+        ).total_seconds()
+        return self.rows_processed / elapsed if elapsed else None
+
+
+class PortfolioDailyValue(models.Model):
+    """
+    Materialized valuation of a portfolio on a date.
+
+    Rows are recomputed from Portfolio.values_stale_since on whenever the
+    prices or holdings behind them change.
+    """
+
+    portfolio = models.ForeignKey(
+        Portfolio, on_delete=models.CASCADE, related_name="daily_values"
+    )
+    date = models.DateField()
+    value = models.DecimalField(max_digits=20, decimal_places=4)
+    # actual weight of each priced asset by name (its share of the value that
+    # day), as numbers with 4 decimals
+    weights = models.JSONField(default=dict)
+    # the target weights (PortfolioAsset.weight) of the priced assets
+    target_weights = models.JSONField(default=dict)
+
+    class Meta:
+        unique_together = ("portfolio", "date")
+
+    def __str__(self):
+        return f"{self.portfolio.name} - {self.value} on {self.date}"
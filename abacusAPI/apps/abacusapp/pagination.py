@@ -0,0 +1,84 @@
+import base64
+from datetime import date
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class PriceKeysetPagination(BasePagination):
+    """
+    Keyset pagination over (date, asset, id).
+
+    The cursor is the key of the last row of the page, and the next page is
+    the rows after it, so every page is an index range scan instead of a
+    COUNT(*) and a growing OFFSET. Pages can only be walked forward.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    ordering = ("date", "asset_id", "id")
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return settings.REST_FRAMEWORK["PAGE_SIZE"]
+        return max(1, min(page_size, self.max_page_size))
+
+    def encode_cursor(self, price) -> str:
+        key = f"{price.date.isoformat()}|{price.asset_id}|{price.id}"
+        return base64.urlsafe_b64encode(key.encode()).decode()
+
+    def decode_cursor(self, cursor: str):
+        try:
+            day, asset_id, price_id = (
+                base64.urlsafe_b64decode(cursor).decode().split("|")
+            )
+            return date.fromisoformat(day), int(asset_id), int(price_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ParseError("Invalid cursor.")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            day, asset_id, price_id = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(date__gt=day)
+                | Q(date=day, asset_id__gt=asset_id)
+                | Q(date=day, asset_id=asset_id, id__gt=price_id)
+            )
+
+        # one extra row tells whether there's a next page
+        rows = list(queryset.order_by(*self.ordering)[: page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -0,0 +1,122 @@
+"""
+Read-side copy of the Price table as compact per-asset arrays.
+
+Each asset gets a .npy file of (date, price) records sorted by date, with dates
+as day ordinals and prices as integers scaled by 10^4, the decimal places of
+Price.price. Files are memory-mapped on read, so a date range is a slice of
+the mapped file instead of one ORM object per row.
+
+Files are only written from what's committed on the Price table (see
+Price.rebuild_store), and a missing file is rebuilt on the next read.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows, where only threads of one process are ordered
+    fcntl = None
+
+RECORD = np.dtype([("date", "<i4"), ("price", "<i8")])
+SCALE = 10**4
+
+# held with the lock file while reading the table and writing files, so
+# writes land in order
+_thread_lock = threading.Lock()
+
+# path of a file -> (its mtime, mapped records)
+_mapped = {}
+
+
+def get_store_dir():
+    """
+    Get the directory of the store, or None when it's disabled
+    """
+    path = getattr(settings, "PRICE_STORE_DIR", None)
+    return Path(path) if path else None
+
+
+@contextmanager
+def locked():
+    """
+    Hold the store's write lock, shared by every process using its directory.
+
+    Whoever holds it reads the table after every earlier holder wrote its
+    files, so a file can't be replaced by one read before a newer commit.
+    """
+    store_dir = get_store_dir()
+    store_dir.mkdir(parents=True, exist_ok=True)
+
+    with _thread_lock, open(store_dir / ".lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _path(asset_id) -> Path:
+    return get_store_dir() / f"{asset_id}.npy"
+
+
+def write(asset_id, records: np.ndarray):
+    """
+    Replace the records of an asset, atomically for readers
+    """
+    path = _path(asset_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, records.astype(RECORD, copy=False))
+    os.replace(tmp_path, path)
+
+
+def discard(asset_ids):
+    """
+    Remove the files of the given assets
+    """
+    if get_store_dir() is None:
+        return
+
+    for asset_id in asset_ids:
+        _mapped.pop(_path(asset_id), None)
+        _path(asset_id).unlink(missing_ok=True)
+
+
+def read(asset_id):
+    """
+    Get the mapped records of an asset, or None if it has no file yet
+    """
+    path = _path(asset_id)
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    # files are replaced, never modified, so a mapping is good until then
+    cached = _mapped.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    records = np.load(path, mmap_mode="r")
+    _mapped[path] = (mtime, records)
+    return records
+
+
+def read_range(records: np.ndarray, initial_date, end_date):
+    """
+    Slice the records between two dates (inclusive), without copying them
+    """
+    dates = records["date"]
+    start = np.searchsorted(dates, initial_date.toordinal(), side="left")
+    end = np.searchsorted(dates, end_date.toordinal(), side="right")
+    return records[start:end]
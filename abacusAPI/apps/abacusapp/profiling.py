@@ -0,0 +1,155 @@
+"""
+On-demand profiles of single requests, and of the imports they start, for
+when something is slow with one customer's data and can't be reproduced
+locally.
+
+Each profile is a folder under MEDIA_ROOT/profiles with the cProfile stats
+(profile.prof, for pstats or snakeviz), a text summary of them, the queries
+that ran and some metadata. Only one profile runs at a time, as the
+profiler is process-wide state.
+"""
+
+import cProfile
+import io
+import json
+import logging
+import pstats
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import timing
+from .timing import RequestTiming
+
+logger = logging.getLogger("abacusapp")
+
+lock = threading.Lock()
+NAME_PATTERN = re.compile(r"^[\w-]+$")
+
+
+def get_profile_dir() -> Path:
+    return Path(settings.MEDIA_ROOT) / "profiles"
+
+
+@contextmanager
+def profile(label: str, wait: float = 0, **meta):
+    """
+    Profile the block and store it with the given metadata.
+
+    Yields the metadata, which the block can add to, or None when profiling
+    is off or another profile didn't finish within `wait` seconds.
+    """
+    acquired = settings.REQUEST_PROFILING and (
+        lock.acquire(timeout=wait) if wait else lock.acquire(blocking=False)
+    )
+    if not acquired:
+        yield None
+        return
+
+    metrics = timing.current.get()
+    token = None
+    if metrics is None:
+        metrics = RequestTiming()
+        token = timing.current.set(metrics)
+    metrics.query_log = []
+
+    created = timezone.now()
+    meta = {
+        # timestamped, so names sort by age
+        "name": "-".join(
+            [
+                created.strftime("%Y%m%dT%H%M%S"),
+                slugify(label.replace("/", " ")),
+                uuid.uuid4().hex[:6],
+            ]
+        ),
+        "label": label,
+        "created": created.isoformat(),
+        **meta,
+    }
+
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    try:
+        profiler.enable()
+        yield meta
+    except Exception as e:
+        meta["error"] = repr(e)
+        raise
+    finally:
+        profiler.disable()
+        meta["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        meta["queries"] = len(metrics.query_log)
+        try:
+            save(profiler, meta, metrics.query_log)
+        except Exception:
+            logger.exception("Saving Profile Failed [name=%s]", meta["name"])
+        finally:
+            metrics.query_log = None
+            if token is not None:
+                timing.current.reset(token)
+            lock.release()
+
+
+def save(profiler: cProfile.Profile, meta: dict, queries: list):
+    directory = get_profile_dir() / meta["name"]
+    directory.mkdir(parents=True)
+
+    profiler.dump_stats(directory / "profile.prof")
+    summary = io.StringIO()
+    stats = pstats.Stats(profiler, stream=summary)
+    stats.sort_stats("cumulative").print_stats(50)
+    (directory / "stats.txt").write_text(summary.getvalue())
+    (directory / "queries.json").write_text(json.dumps(queries, indent=2, default=str))
+    (directory / "meta.json").write_text(json.dumps(meta, indent=2, default=str))
+    logger.info("Saved Profile [name=%s]", meta["name"])
+
+    # only keep the newest ones
+    newest_first = sorted(get_profile_dir().iterdir(), reverse=True)
+    for old in newest_first[settings.PROFILE_KEEP :]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def list_profiles() -> list:
+    """
+    Get the metadata of the stored profiles, newest first
+    """
+    directory = get_profile_dir()
+    if not directory.exists():
+        return []
+    profiles = [
+        json.loads((path / "meta.json").read_text())
+        for path in directory.iterdir()
+        if (path / "meta.json").exists()
+    ]
+    return sorted(profiles, key=lambda meta: meta["created"], reverse=True)
+
+
+def get_profile_path(name: str, file_name: str) -> Path:
+    """
+    Get the path of one of the files of a profile, raising FileNotFoundError
+    when there's no such profile
+    """
+    path = get_profile_dir() / name / file_name
+    if not NAME_PATTERN.match(name) or not path.exists():
+        raise FileNotFoundError(name)
+    return path
+
+
+def load_profile(name: str) -> dict:
+    """
+    Get the metadata, stats summary and queries of a profile
+    """
+    return {
+        **json.loads(get_profile_path(name, "meta.json").read_text()),
+        "stats": get_profile_path(name, "stats.txt").read_text(),
+        "query_log": json.loads(get_profile_path(name, "queries.json").read_text()),
+    }
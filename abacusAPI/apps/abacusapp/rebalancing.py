@@ -0,0 +1,37 @@
+"""
+Trades that bring portfolios back to the target weights of their assets.
+
+The positions of every portfolio are laid out as flat arrays with one entry
+per (portfolio, asset) pair, so valuing them and sizing the trades takes a
+few vectorized passes whatever the number of portfolios.
+"""
+
+import numpy as np
+
+
+def rebalance(
+    portfolio_index: np.ndarray,
+    quantities: np.ndarray,
+    weights: np.ndarray,
+    prices: np.ndarray,
+    n_portfolios: int,
+    min_value: float = 0.0,
+) -> tuple:
+    """
+    Size the trade of each pair, where `portfolio_index` numbers the
+    portfolio of each pair from 0 and missing prices are NaN.
+
+    Returns the value of each portfolio, the current weight of each pair and
+    the cash to trade on each pair: positive to buy, negative to sell and 0
+    when it's under `min_value`.
+    """
+    positions = quantities * np.nan_to_num(prices)
+    values = np.bincount(portfolio_index, weights=positions, minlength=n_portfolios)
+    pair_values = values[portfolio_index]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        current = np.nan_to_num(positions / pair_values)
+
+    trades = weights * pair_values - positions
+    trades[np.abs(trades) < max(min_value, 1e-9)] = 0
+    return values, current, trades
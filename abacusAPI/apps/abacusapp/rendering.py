@@ -0,0 +1,181 @@
+"""
+Chart rendering, kept apart from Django so it can run in worker processes.
+
+Figures are built with matplotlib's object-oriented Agg API instead of the
+global pyplot state, which isn't thread-safe.
+"""
+
+import asyncio
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.dates import DateFormatter
+from matplotlib.figure import Figure
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PoolUnavailable(Exception):
+    pass
+
+
+def lttb_indices(x, y, threshold: int):
+    """
+    Pick `threshold` points of a series with Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept, and each bucket in between keeps
+    the point forming the largest triangle with the previously kept point and
+    the average of the next bucket, which preserves the shape of the series.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    bucket_size = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+
+    return indices
+
+
+def render_portfolio_plot(
+    name: str, dates: list, values, weights: dict, image_format: str = "png"
+) -> bytes:
+    """
+    Draw the value of a portfolio as a line over the stacked weights of its
+    assets, and return it as PNG or SVG bytes
+    """
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+
+    # Set the portfolio value as a line graph
+    ax1 = fig.add_subplot()
+    ax1.plot(dates, values, label=name, color="blue")
+    ax1.set_xlabel("Fecha")
+    ax1.set_ylabel("Valor (t)", color="blue")
+    ax1.tick_params(axis="y", labelcolor="blue")
+
+    # Format date on x-axis
+    ax1.xaxis.set_major_formatter(DateFormatter("%Y-%m-%d"))
+    fig.autofmt_xdate()
+
+    # Make a second y-axis for the stacked area plot
+    ax2 = ax1.twinx()
+    ax2.stackplot(dates, *weights.values(), labels=weights.keys(), alpha=0.4)
+    ax2.set_ylabel("Weights (t)")
+
+    # Adding legends and title
+    ax1.legend(loc="upper left")
+    ax2.legend(loc="upper right")
+    ax2.set_title(f'Portfolio Value and Weights for "{name}"')
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format=image_format)
+    return buf.getvalue()
+
+
+def get_executor(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Get the process pool shared by this process, starting it on first use
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            # spawn, as forking a process with running threads isn't safe
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def discard_executor(executor: ProcessPoolExecutor):
+    """
+    Drop a broken pool, so the next job starts a new one
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_all(calls: list, workers: int, timeout: float = None) -> list:
+    """
+    Run (func, args, kwargs) calls in the process pool and get their results
+    in order, waiting up to `timeout` seconds for each.
+
+    Raises PoolTimeout when one takes longer, and PoolUnavailable when a
+    worker died, after which the pool is replaced.
+    """
+    executor = get_executor(workers)
+    futures = []
+    try:
+        for func, args, kwargs in calls:
+            futures.append(executor.submit(func, *args, **kwargs))
+        return [future.result(timeout=timeout) for future in futures]
+    except FutureTimeoutError:
+        for future in futures:
+            future.cancel()
+        raise PoolTimeout(f"The request took over {timeout} seconds, try less data.")
+    except BrokenProcessPool:
+        discard_executor(executor)
+        raise PoolUnavailable("A worker process crashed, try again.")
+
+
+def render(func, *args, workers: int = 0, timeout: float = None):
+    """
+    Run a rendering function in the process pool, or inline without workers
+    (see run_all for the errors)
+    """
+    if not workers:
+        return func(*args)
+    [result] = run_all([(func, args, {})], workers, timeout)
+    return result
+
+
+async def arender(func, *args, workers: int = 0, timeout: float = None):
+    """
+    Like render, but awaiting the result instead of blocking a thread on it
+    """
+    if not workers:
+        return await sync_to_async(func, thread_sensitive=False)(*args)
+
+    executor = get_executor(workers)
+    try:
+        future = executor.submit(func, *args)
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        raise PoolTimeout(f"The request took over {timeout} seconds, try less data.")
+    except BrokenProcessPool:
+        discard_executor(executor)
+        raise PoolUnavailable("A worker process crashed, try again.")
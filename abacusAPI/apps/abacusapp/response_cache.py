@@ -0,0 +1,144 @@
+"""
+Cache of API response data, kept in one of Django's cache backends.
+
+Keys are built from the view, its arguments, the query parameters and the
+version of the data behind the response, so entries are never deleted one
+by one: writes change the version and old entries just stop being read.
+
+List endpoints depend on a global generation token that every write path
+changes (see Portfolio.touch), while portfolio actions depend on that
+portfolio's own data version. With the local-memory backend each process
+keeps its own entries and generation, so a write in one worker doesn't expire
+the responses of the others: deployments with several workers need a shared
+backend, like the file one production uses.
+"""
+
+import functools
+import hashlib
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+GENERATION_KEY = "responses:generation"
+
+
+class CacheStats:
+    """
+    Thread-safe hit/miss counters per view, for this process
+    """
+
+    def __init__(self):
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, name: str, hit: bool):
+        with self._lock:
+            (self.hits if hit else self.misses)[name] += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            views = {}
+            for name in sorted(self.hits.keys() | self.misses.keys()):
+                hits, misses = self.hits[name], self.misses[name]
+                views[name] = {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_ratio": round(hits / (hits + misses), 4),
+                }
+            hits, misses = sum(self.hits.values()), sum(self.misses.values())
+
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+            "views": views,
+        }
+
+    def clear(self):
+        with self._lock:
+            self.hits.clear()
+            self.misses.clear()
+
+
+stats = CacheStats()
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def generation() -> str:
+    """
+    Get the current generation token, starting one if there's none
+    """
+    cache = get_cache()
+    token = cache.get(GENERATION_KEY)
+    if token is None:
+        # a random token, so a lost one never matches older entries again
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+        token = cache.get(GENERATION_KEY)
+    return token
+
+
+def invalidate():
+    """
+    Expire every response cached on the generation, once the current
+    transaction (if any) commits
+    """
+    transaction.on_commit(
+        lambda: get_cache().set(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+    )
+
+
+def cached_response(version=None):
+    """
+    Cache the data of successful GET responses of a viewset method.
+
+    `version(view, request)` gives the version of the data the response is
+    built from, the global generation by default. Only DRF Responses are
+    cached, other responses (like images) go through untouched.
+    """
+
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method != "GET":
+                return view_method(self, request, *args, **kwargs)
+
+            name = f"{type(self).__name__}.{view_method.__name__}"
+            data_version = version(self, request) if version else generation()
+            # the host too, as pagination links are absolute
+            raw_key = ":".join(
+                [
+                    name,
+                    request.get_host(),
+                    str(sorted(kwargs.items())),
+                    str(sorted(request.query_params.lists())),
+                    str(data_version),
+                ]
+            )
+            digest = hashlib.md5(raw_key.encode(), usedforsecurity=False).hexdigest()
+            key = f"responses:{digest}"
+
+            cache = get_cache()
+            data = cache.get(key)
+            if data is not None:
+                stats.record(name, hit=True)
+                return Response(data, headers={"X-Cache": "hit"})
+
+            response = view_method(self, request, *args, **kwargs)
+            if isinstance(response, Response) and response.status_code == 200:
+                stats.record(name, hit=False)
+                cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+                response["X-Cache"] = "miss"
+            return response
+
+        return wrapper
+
+    return decorator
@@ -1,23 +1,63 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
 from rest_framework import serializers
 
-from .models import Asset, Deposit, Portfolio, PortfolioAsset, Price, Transaction
+from .backtest import FREQUENCIES
+from .models import (
+    Asset,
+    Deposit,
+    ImportJob,
+    Portfolio,
+    PortfolioAsset,
+    Price,
+    Transaction,
+)
+from .timing import measure
 
 
-class PortfolioSerializer(serializers.ModelSerializer):
+class TimedSerializerMixin:
+    """
+    Count the time spent turning objects into data as serialization, in the
+    request's timings (see timing.py)
+    """
+
+    def to_representation(self, instance):
+        with measure("serialize"):
+            return super().to_representation(instance)
+
+
+class PortfolioSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Portfolio
-        fields = "__all__"
+        # internal bookkeeping of the cached and materialized valuations
+        exclude = Portfolio.TRACKING_FIELDS
 
 
-class PortfolioDailyValueSerializer(serializers.Serializer):
+class PortfolioDailyValueSerializer(TimedSerializerMixin, serializers.Serializer):
     date = serializers.DateField()
     value = serializers.DecimalField(max_digits=20, decimal_places=4)
     weights = serializers.DictField(
         child=serializers.DecimalField(max_digits=7, decimal_places=4)
     )
+    # only with ?weights=both
+    target_weights = serializers.DictField(
+        child=serializers.DecimalField(max_digits=7, decimal_places=4),
+        required=False,
+    )
+
+
+class AssetListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        """
+        Resolve the latest prices of the whole page at once
+        """
+        assets = list(data.all() if isinstance(data, models.Manager) else data)
+        Asset.latest_prices([asset.id for asset in assets])
+        return super().to_representation(assets)
 
 
-class AssetSerializer(serializers.ModelSerializer):
+class AssetSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     price = serializers.SerializerMethodField()
 
     def get_price(self, obj):
@@ -26,27 +66,196 @@ class AssetSerializer(serializers.ModelSerializer):
     class Meta:
         model = Asset
         fields = "__all__"
+        list_serializer_class = AssetListSerializer
 
 
-class PriceSerializer(serializers.ModelSerializer):
+class PriceSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Price
         fields = "__all__"
 
 
-class PortfolioAssetSerializer(serializers.ModelSerializer):
+class PortfolioAssetSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = PortfolioAsset
         fields = "__all__"
 
 
-class DepositSerializer(serializers.ModelSerializer):
+class DepositSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Deposit
         fields = "__all__"
 
 
-class TransactionSerializer(serializers.ModelSerializer):
+def resolve_portfolios(pks: list) -> list:
+    """
+    Get the portfolios of a list of pks in one query, in the same order
+    """
+    portfolios = Portfolio.objects.in_bulk(pks)
+    missing = [pk for pk in pks if pk not in portfolios]
+    if missing:
+        raise serializers.ValidationError(
+            f"Invalid pks {missing} - objects do not exist."
+        )
+    return [portfolios[pk] for pk in pks]
+
+
+class MultiPortfolioDepositSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+    The same deposit made into many portfolios at once
+    """
+
+    portfolios = serializers.ListField(child=serializers.IntegerField(), min_length=1)
+    amount = serializers.DecimalField(max_digits=20, decimal_places=4)
+    date = serializers.DateField(default=timezone.localdate)
+
+    def validate_portfolios(self, value):
+        return resolve_portfolios(value)
+
+
+class RebalanceSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+    Bring many portfolios back to their target weights on a date
+    """
+
+    portfolios = serializers.ListField(child=serializers.IntegerField(), min_length=1)
+    date = serializers.DateField()
+    # skip trades worth less than this
+    min_value = serializers.DecimalField(max_digits=20, decimal_places=4, default=0)
+    # make the trades, or just list them
+    execute = serializers.BooleanField(default=False)
+
+    def validate_portfolios(self, value):
+        # each portfolio once, or its trades would be made twice
+        return resolve_portfolios(list(dict.fromkeys(value)))
+
+
+class RebalanceTradeSerializer(TimedSerializerMixin, serializers.Serializer):
+    portfolio = serializers.IntegerField()
+    asset = serializers.IntegerField()
+    asset_name = serializers.CharField()
+    transaction_type = serializers.CharField()
+    value = serializers.DecimalField(max_digits=20, decimal_places=4)
+    price = serializers.DecimalField(max_digits=10, decimal_places=4)
+    quantity = serializers.DecimalField(max_digits=20, decimal_places=4)
+    weight = serializers.DecimalField(max_digits=7, decimal_places=4)
+    target_weight = serializers.DecimalField(max_digits=7, decimal_places=4)
+    # only when executed
+    transaction = serializers.IntegerField(required=False)
+
+
+class RebalancePlanSerializer(TimedSerializerMixin, serializers.Serializer):
+    date = serializers.DateField()
+    executed = serializers.BooleanField()
+    # value of each portfolio by id, before the trades
+    values = serializers.DictField(
+        child=serializers.DecimalField(max_digits=20, decimal_places=4)
+    )
+    trades = RebalanceTradeSerializer(many=True)
+
+
+class BacktestScenarioSerializer(serializers.Serializer):
+    rebalance = serializers.ChoiceField(choices=FREQUENCIES, default="monthly")
+    # drift of any weight that triggers a threshold rebalance, like 0.05
+    threshold = serializers.FloatField(min_value=0, max_value=1, required=False)
+    # paid on the value traded, like 0.001 for 0.1%
+    cost = serializers.FloatField(min_value=0, max_value=0.5, required=False)
+
+
+class BacktestSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+    Backtest many portfolios under many rebalancing scenarios
+    """
+
+    portfolios = serializers.ListField(child=serializers.IntegerField(), min_length=1)
+    fecha_inicio = serializers.DateField()
+    fecha_fin = serializers.DateField()
+    capital = serializers.FloatField(
+        min_value=1, default=lambda: settings.BACKTEST_DEFAULT_CAPITAL
+    )
+    # monthly rebalancing without costs by default
+    scenarios = BacktestScenarioSerializer(many=True, required=False)
+    windows = serializers.ListField(
+        child=serializers.IntegerField(min_value=2),
+        max_length=10,
+        default=lambda: settings.ANALYTICS_DEFAULT_WINDOWS,
+    )
+    risk_free = serializers.FloatField(default=0)
+    series = serializers.BooleanField(default=False)
+
+    def validate_portfolios(self, value):
+        return resolve_portfolios(list(dict.fromkeys(value)))
+
+    def validate_windows(self, value):
+        if any(window > settings.ANALYTICS_MAX_WINDOW for window in value):
+            raise serializers.ValidationError(
+                f"Windows can be up to {settings.ANALYTICS_MAX_WINDOW} days."
+            )
+        return sorted(set(value))
+
+    def validate(self, attrs):
+        attrs["scenarios"] = attrs.get("scenarios") or [{"rebalance": "monthly"}]
+        runs = len(attrs["portfolios"]) * len(attrs["scenarios"])
+        if runs > settings.BACKTEST_MAX_RUNS:
+            raise serializers.ValidationError(
+                f"Too many runs ({runs}), up to {settings.BACKTEST_MAX_RUNS} "
+                "portfolios x scenarios."
+            )
+        return attrs
+
+
+class TransactionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Transaction
+        fields = "__all__"
+
+
+class ImportJobSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # rows per second
+    throughput = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = "__all__"
+
+
+class TransactionBatchListSerializer(serializers.ListSerializer):
+    def validate(self, attrs):
+        """
+        Resolve the portfolios and assets of the whole batch in two queries
+        """
+        portfolios = Portfolio.objects.in_bulk({t["portfolio"] for t in attrs})
+        assets = Asset.objects.in_bulk({t["asset"] for t in attrs})
+
+        errors = []
+        for t in attrs:
+            error = {}
+            if t["portfolio"] not in portfolios:
+                error["portfolio"] = [
+                    f'Invalid pk "{t["portfolio"]}" - object does not exist.'
+                ]
+            if t["asset"] not in assets:
+                error["asset"] = [f'Invalid pk "{t["asset"]}" - object does not exist.']
+            errors.append(error)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return [
+            {
+                **t,
+                "portfolio": portfolios[t["portfolio"]],
+                "asset": assets[t["asset"]],
+            }
+            for t in attrs
+        ]
+
+
+class TransactionBatchSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # plain ids, resolved in bulk by the list serializer
+    portfolio = serializers.IntegerField()
+    asset = serializers.IntegerField()
+
     class Meta:
         model = Transaction
         fields = "__all__"
+        list_serializer_class = TransactionBatchListSerializer
@@ -1,109 +1,858 @@
-import base64
+import csv
 import io
+import json
+import logging
+import threading
 from collections import defaultdict
-from decimal import Decimal
+from decimal import ROUND_DOWN, Decimal
 
-import matplotlib.pyplot as plt
-from matplotlib.dates import DateFormatter
+import numpy as np
+import openpyxl
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import ValidationError
 
-from .models import Asset, Portfolio, PortfolioAsset, Price, Transaction
+from .analytics import compute_analytics, to_json
+from .backtest import backtest
+from .cache import invalidate_prices
+from .models import (
+    QUANTITY_PLACES,
+    Asset,
+    Deposit,
+    Holding,
+    Portfolio,
+    PortfolioAsset,
+    Price,
+    Transaction,
+)
+from .rebalancing import rebalance
+from .rendering import arender, lttb_indices, render, render_portfolio_plot, run_all
+from .valuation import (
+    FOUR_PLACES,
+    aload_daily_values,
+    arefresh_daily_values,
+    load_daily_values,
+    load_price_matrix,
+    refresh_daily_values,
+    to_decimal,
+    values_query,
+    weights_queries,
+)
 
+logger = logging.getLogger("abacusapp")
+# per-row logs, sampled (see log.py)
+rows_logger = logging.getLogger("abacusapp.rows")
 
-def calculate_portfolio_daily_value(portfolio: Portfolio, date):
-    assets = PortfolioAsset.objects.filter(portfolio=portfolio)
-    prices = Price.objects.filter(asset__in=assets.values("asset"), date=date)
+# Rows written per bulk query
+BATCH_SIZE = 1000
+assets_lock = threading.Lock()
 
-    total_value = Decimal(0)
-    weights = {}
 
-    for price in prices:
-        asset_quantity = assets.get(asset=price.asset).quantity
-        value = asset_quantity * price.price
-        total_value += value
-        weights[price.asset.name] = assets.get(asset=price.asset).weight
+def calculate_portfolio_daily_value(portfolio: Portfolio, date, weights="actual"):
+    daily_values = load_daily_values(portfolio, date, date, weights)
 
+    if not daily_values:
+        return {
+            "date": date,
+            "value": Decimal(0),
+            "weights": {},
+        }
+
+    return {**daily_values[0], "date": date}
+
+
+def calculate_portfolio_daily_values(
+    portfolio: Portfolio, initial_date, end_date, weights="actual"
+):
+    return load_daily_values(portfolio, initial_date, end_date, weights)
+
+
+async def acalculate_portfolio_daily_values(
+    portfolio: Portfolio, initial_date, end_date, weights="actual"
+):
+    return await aload_daily_values(portfolio, initial_date, end_date, weights)
+
+
+def get_portfolio_series(portfolio, initial_date, end_date, points=None):
+    """
+    Get the daily values and actual weights of a portfolio as plain arrays,
+    downsampled to about `points` dates when given.
+
+    The dates are picked from the values alone, so the weights, most of each
+    row, are only read for the dates kept.
+    """
+    refresh_daily_values(portfolio)
+
+    rows = values_query(portfolio, initial_date, end_date)
+    series = build_portfolio_series(list(rows), points)
+    if series:
+        weights = {}
+        for query in weights_queries(portfolio, series["dates"]):
+            weights.update(query)
+        series["weights"] = build_weight_series(series["dates"], weights)
+    return series
+
+
+async def aget_portfolio_series(portfolio, initial_date, end_date, points=None):
+    await arefresh_daily_values(portfolio)
+
+    rows = values_query(portfolio, initial_date, end_date)
+    series = build_portfolio_series([row async for row in rows], points)
+    if series:
+        weights = {}
+        for query in weights_queries(portfolio, series["dates"]):
+            weights.update({date: row async for date, row in query})
+        series["weights"] = build_weight_series(series["dates"], weights)
+    return series
+
+
+def build_portfolio_series(rows: list, points=None):
+    """
+    Get the dates and values of the (date, value) rows, downsampled to about
+    `points` of them when given
+    """
+    if not rows:
+        return None
+
+    dates = [date for date, _ in rows]
+    values = np.array([float(value) for _, value in rows])
+
+    if points and len(dates) > points:
+        # pick the dates that keep the shape of the value line
+        x = np.array([date.toordinal() for date in dates], dtype=np.float64)
+        indices = lttb_indices(x, values, points)
+        dates = [dates[i] for i in indices]
+        values = values[indices]
+
+    return {"dates": dates, "values": values}
+
+
+def build_weight_series(dates: list, weights: dict) -> dict:
+    """
+    Get the weight of each asset on each of the dates, from the weights of
+    each date
+    """
+    # an asset only counts towards the weights on the days it has a price
+    names = sorted({name for date in dates for name in weights[date]})
     return {
-        "date": date,
-        "value": total_value,
-        "weights": weights,
+        name: np.array([float(weights[date].get(name, 0)) for date in dates])
+        for name in names
     }
 
 
-def calculate_portfolio_daily_values(portfolio: Portfolio, initial_date, end_date):
-    assets = PortfolioAsset.objects.filter(portfolio=portfolio)
-    prices = Price.objects.filter(
-        asset__in=assets.values("asset"), date__range=[initial_date, end_date]
+def chart_cache_key(portfolio, initial_date, end_date, points) -> str:
+    # data_key, as the charts show the portfolio's name too
+    return f"chart:{portfolio.data_key}:{initial_date}:{end_date}:{points}"
+
+
+def plot_cache_key(portfolio, initial_date, end_date, image_format, points) -> str:
+    return (
+        f"plot:{portfolio.data_key}:{initial_date}:{end_date}:{image_format}:{points}"
     )
 
-    daily_values = defaultdict(
-        lambda: {
-            "value": Decimal(0),
-            "weights": {},
-        }
+
+def build_chart_data(portfolio, series: dict) -> dict:
+    return {
+        "portfolio": portfolio.name,
+        "dates": series["dates"],
+        "values": np.round(series["values"], 4).tolist(),
+        "weights": {
+            name: np.round(weights, 4).tolist()
+            for name, weights in series["weights"].items()
+        },
+    }
+
+
+def render_args(portfolio, series: dict, image_format: str) -> tuple:
+    return (
+        render_portfolio_plot,
+        portfolio.name,
+        series["dates"],
+        series["values"],
+        series["weights"],
+        image_format,
+    )
+
+
+def generate_portfolio_chart_data(portfolio, initial_date, end_date, points):
+    """
+    Get the series of a portfolio, downsampled to `points` dates, so clients can
+    draw the chart themselves
+    """
+    key = chart_cache_key(portfolio, initial_date, end_date, points)
+    data = cache.get(key)
+    if data is not None:
+        return data
+
+    series = get_portfolio_series(portfolio, initial_date, end_date, points)
+    if not series:
+        return None
+
+    data = build_chart_data(portfolio, series)
+    cache.set(key, data, settings.PLOT_CACHE_TIMEOUT)
+
+    return data
+
+
+async def agenerate_portfolio_chart_data(portfolio, initial_date, end_date, points):
+    key = chart_cache_key(portfolio, initial_date, end_date, points)
+    data = await cache.aget(key)
+    if data is not None:
+        return data
+
+    series = await aget_portfolio_series(portfolio, initial_date, end_date, points)
+    if not series:
+        return None
+
+    data = build_chart_data(portfolio, series)
+    await cache.aset(key, data, settings.PLOT_CACHE_TIMEOUT)
+
+    return data
+
+
+def generate_portfolio_plots(
+    portfolio, initial_date, end_date, image_format="png", points=None
+):
+    """
+    Get the chart of a portfolio between two dates, or None without data.
+
+    Renders run in a process pool and are cached until the portfolio's data
+    version changes.
+    """
+    key = plot_cache_key(portfolio, initial_date, end_date, image_format, points)
+    image = cache.get(key)
+    if image is not None:
+        return image
+
+    series = get_portfolio_series(portfolio, initial_date, end_date, points)
+    if not series:
+        return None
+
+    image = render(
+        *render_args(portfolio, series, image_format),
+        workers=settings.PLOT_RENDER_WORKERS,
+        timeout=settings.PLOT_RENDER_TIMEOUT,
     )
+    cache.set(key, image, settings.PLOT_CACHE_TIMEOUT)
+
+    return image
+
 
-    for price in prices:
-        asset_quantity = assets.get(asset=price.asset).quantity
-        value = asset_quantity * price.price
-        daily_values[price.date]["value"] += value
-        daily_values[price.date]["weights"][price.asset.name] = assets.get(
-            asset=price.asset
-        ).weight
+async def agenerate_portfolio_plots(
+    portfolio, initial_date, end_date, image_format="png", points=None
+):
+    """
+    Async version of generate_portfolio_plots, awaiting the render instead of
+    blocking a thread on it
+    """
+    key = plot_cache_key(portfolio, initial_date, end_date, image_format, points)
+    image = await cache.aget(key)
+    if image is not None:
+        return image
+
+    series = await aget_portfolio_series(portfolio, initial_date, end_date, points)
+    if not series:
+        return None
 
+    image = await arender(
+        *render_args(portfolio, series, image_format),
+        workers=settings.PLOT_RENDER_WORKERS,
+        timeout=settings.PLOT_RENDER_TIMEOUT,
+    )
+    await cache.aset(key, image, settings.PLOT_CACHE_TIMEOUT)
+
+    return image
+
+
+def get_portfolio_cash_flows(portfolio: Portfolio, dates: list) -> np.ndarray:
+    """
+    Get the net money that came into a portfolio on each of the given dates:
+    deposits and buys, minus sells. Flows on a date without a value count on
+    the next date.
+    """
+    deposits = (
+        Deposit.objects.filter(portfolio=portfolio, date__range=(dates[0], dates[-1]))
+        .values("date")
+        .annotate(total=Sum("amount"))
+        .values_list("date", "total")
+    )
+    trades = (
+        Transaction.objects.filter(
+            portfolio=portfolio, date__range=(dates[0], dates[-1])
+        )
+        .values("date")
+        .annotate(
+            total=Sum(
+                Case(
+                    When(
+                        transaction_type=Transaction.TRANSACTION_SELL,
+                        then=-F("value"),
+                    ),
+                    default=F("value"),
+                )
+            )
+        )
+        .values_list("date", "total")
+    )
+
+    flows = np.zeros(len(dates))
+    movements = [*deposits, *trades]
+    if movements:
+        ordinals = np.array([date.toordinal() for date in dates])
+        indices = np.searchsorted(ordinals, [date.toordinal() for date, _ in movements])
+        np.add.at(flows, indices, [float(total) for _, total in movements])
+    return flows
+
+
+def get_portfolio_analytics(
+    portfolio: Portfolio,
+    initial_date,
+    end_date,
+    windows: list,
+    risk_free=0.0,
+    include_series=False,
+):
+    """
+    Get the returns, volatility, drawdown and Sharpe ratio of a portfolio
+    between two dates (see analytics.py), None without two values to compare
+    """
+    daily_values = load_daily_values(portfolio, initial_date, end_date)
+    if len(daily_values) < 2:
+        return None
+
+    dates = [row["date"] for row in daily_values]
+    values = np.array([float(row["value"]) for row in daily_values])
+    flows = get_portfolio_cash_flows(portfolio, dates)
+
+    data = compute_analytics(
+        dates, values, flows, windows, risk_free, include_series=include_series
+    )
+    return {"portfolio": portfolio.name, **to_json(data)}
+
+
+def run_backtests(
+    portfolios: list,
+    initial_date,
+    end_date,
+    capital: float,
+    scenarios: list,
+    windows: list,
+    risk_free=0.0,
+    include_series=False,
+) -> list:
+    """
+    Backtest each of the given portfolios under each scenario (the keyword
+    arguments of backtest.backtest, like `rebalance`), from their target
+    weights and the prices between two dates.
+
+    The weights and prices of all the portfolios are read once, and the runs
+    are spread over the process pool when there's more than one.
+    """
+    targets = defaultdict(dict)
+    for portfolio_id, asset_id, weight in PortfolioAsset.objects.filter(
+        portfolio__in=portfolios, weight__gt=0
+    ).values_list("portfolio_id", "asset_id", "weight"):
+        targets[portfolio_id][asset_id] = weight
+
+    for portfolio in portfolios:
+        if sum(targets[portfolio.id].values()) != 1:
+            raise ValidationError(
+                f"The weights of the assets must sum up to 100% [p={portfolio}]."
+            )
+
+    asset_ids = sorted(
+        {asset_id for weights in targets.values() for asset_id in weights}
+    )
+    prices = load_price_matrix(asset_ids, initial_date, end_date)
+    column_by_asset = {asset_id: j for j, asset_id in enumerate(asset_ids)}
+
+    runs = []
+    for portfolio in portfolios:
+        weights = targets[portfolio.id]
+        columns = [column_by_asset[asset_id] for asset_id in weights]
+        args = (
+            prices.dates,
+            prices.values[:, columns],
+            np.array([float(weight) for weight in weights.values()]),
+            capital,
+        )
+        for scenario in scenarios:
+            kwargs = {
+                **scenario,
+                "windows": windows,
+                "risk_free": risk_free,
+                "include_series": include_series,
+            }
+            runs.append((portfolio, scenario, args, kwargs))
+
+    if len(runs) > 1 and settings.BACKTEST_WORKERS:
+        results = run_all(
+            [(backtest, args, kwargs) for *_, args, kwargs in runs],
+            settings.BACKTEST_WORKERS,
+            settings.BACKTEST_TIMEOUT,
+        )
+    else:
+        results = [backtest(*args, **kwargs) for *_, args, kwargs in runs]
+
+    logger.info("Backtests Done [portfolios=%d, runs=%d]", len(portfolios), len(runs))
     return [
         {
-            "date": date,
-            "value": data["value"],
-            "weights": data["weights"],
+            "portfolio": portfolio.id,
+            "name": portfolio.name,
+            **scenario,
+            "result": result,
         }
-        for date, data in daily_values.items()
+        for (portfolio, scenario, _, _), result in zip(runs, results)
     ]
 
 
-def generate_portfolio_plots(portfolio, initial_date, end_date):
-    # Get the daily values
-    daily_values = calculate_portfolio_daily_values(portfolio, initial_date, end_date)
+def export_prices(prices, output="csv"):
+    """
+    Yield the rows of a Price queryset as CSV or NDJSON, one chunk at a time.
 
-    if not daily_values:
-        return None
+    Rows are fetched and written BATCH_SIZE at a time, so the whole table can
+    be streamed without holding it in memory.
+    """
+    rows = prices.values_list("id", "asset_id", "date", "price").iterator(
+        chunk_size=BATCH_SIZE
+    )
+    buffer = io.StringIO()
+
+    if output == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(["id", "asset", "date", "price"])
+        write = writer.writerow
+    else:
+
+        def write(row):
+            price_id, asset_id, date, price = row
+            line = {
+                "id": price_id,
+                "asset": asset_id,
+                "date": date.isoformat(),
+                "price": str(price),
+            }
+            buffer.write(json.dumps(line) + "\n")
+
+    for count, row in enumerate(rows, start=1):
+        write(row)
+        if count % BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def get_or_create_assets(names, assets_by_name: dict) -> dict:
+    """
+    Get or create the assets with the given names in bulk,
+    adding them to `assets_by_name`
+    """
+    missing = {name for name in names if name and name not in assets_by_name}
+    if not missing:
+        return assets_by_name
+
+    # imports run concurrently and asset names aren't unique in the DB
+    with assets_lock:
+        for asset in Asset.objects.filter(name__in=missing):
+            assets_by_name.setdefault(asset.name, asset)
+
+        new_assets = [
+            Asset(name=name) for name in missing if name not in assets_by_name
+        ]
+        if new_assets:
+            logger.debug("Creating Assets (%d)", len(new_assets))
+            for asset in Asset.objects.bulk_create(new_assets):
+                assets_by_name[asset.name] = asset
+
+    return assets_by_name
+
+
+def import_weights_sheet(sheet, assets_by_name: dict, on_progress=None) -> int:
+    """
+    Load the portfolios and the target weights of their assets.
+
+    The header holds the portfolio names from the third column on, and each row
+    is `date, asset, *weights`. Rows are upserted in fixed-size batches, and
+    `on_progress` is called with the number of rows written by each batch.
+    """
+    rows = sheet.iter_rows(values_only=True)
+    portfolio_names = next(rows, ())[2:]
+
+    # Create portfolios if they don't exist
+    portfolios = {}
+    for name in portfolio_names:
+        rows_logger.debug("Creating Portfolio [name=%s]", name)
+        portfolios[name] = Portfolio.objects.get_or_create(name=name)[0]
+
+    count = 0
+    reported = 0
+    # keyed by the unique fields, as an upsert can't touch a row twice
+    batch = {}
+
+    def flush():
+        nonlocal reported
+        PortfolioAsset.objects.bulk_create(
+            batch.values(),
+            update_conflicts=True,
+            unique_fields=["portfolio", "asset"],
+            update_fields=["weight"],
+        )
+        batch.clear()
+        if on_progress:
+            on_progress(count - reported)
+        reported = count
+
+    for row in rows:
+        date, asset_name, *weights = row
+
+        # stop when rows are empty
+        if not date or not asset_name:
+            break
+
+        asset = get_or_create_assets([asset_name], assets_by_name)[asset_name]
+        for portfolio_name, weight in zip(portfolio_names, weights):
+            if weight is None:
+                continue
+            portfolio = portfolios[portfolio_name]
+            batch[portfolio.id, asset.id] = PortfolioAsset(
+                portfolio=portfolio,
+                asset=asset,
+                weight=weight,
+            )
+
+        count += 1
+        if len(batch) >= BATCH_SIZE:
+            flush()
+
+    if batch:
+        flush()
+
+    logger.info("Done processing Portfolios [rows=%d]", count, extra={"rows": count})
+    return count
+
+
+def import_prices_sheet(sheet, assets_by_name: dict, on_progress=None) -> int:
+    """
+    Load the asset prices.
+
+    The header holds the asset names from the second column on, and each row is
+    `date, *prices`. Prices are upserted in fixed-size batches, so memory stays
+    flat no matter how many rows the sheet has, and `on_progress` is called with
+    the number of rows written by each batch.
+    """
+    rows = sheet.iter_rows(values_only=True)
+    asset_names = next(rows, ())[1:]
+
+    # First get/create the assets
+    get_or_create_assets(asset_names, assets_by_name)
+    assets = [assets_by_name.get(name) for name in asset_names]
+
+    count = 0
+    reported = 0
+    # keyed by the unique fields, as an upsert can't touch a row twice
+    batch = {}
+
+    def flush():
+        nonlocal reported
+        rows_logger.debug("Saving Asset Prices (%d)", len(batch))
+        Price.objects.bulk_create(
+            batch.values(),
+            update_conflicts=True,
+            unique_fields=["asset", "date"],
+            update_fields=["price"],
+        )
+        batch.clear()
+        if on_progress:
+            on_progress(count - reported)
+        reported = count
+
+    for row in rows:
+        date, *prices = row
+
+        # stop when rows are empty
+        if not date:
+            break
+
+        for asset, price in zip(assets, prices):
+            if asset is None or price is None:
+                continue
+            batch[asset.id, date] = Price(asset=asset, date=date, price=price)
+
+        count += 1
+        if len(batch) >= BATCH_SIZE:
+            flush()
+
+    if batch:
+        flush()
 
-    dates = [entry["date"] for entry in daily_values]
-    values = [entry["value"] for entry in daily_values]
-    weights = {asset: [] for asset in daily_values[0]["weights"].keys()}
+    logger.info("Done processing Prices [rows=%d]", count, extra={"rows": count})
+    return count
 
-    for entry in daily_values:
-        for asset, weight in entry["weights"].items():
-            weights[asset].append(weight)
 
-    # Set the portfolio value as a line graph
-    fig, ax1 = plt.subplots(figsize=(10, 6))
+def import_workbook(file_path, on_progress=None):
+    """
+    Load the .xlsx setup file, streaming its "weights" and "Precios" sheets.
 
-    ax1.plot(dates, values, label=f"{portfolio.name}", color="blue")
-    ax1.set_xlabel("Fecha")
-    ax1.set_ylabel("Valor (t)", color="blue")
-    ax1.tick_params(axis="y", labelcolor="blue")
+    Each batch is committed on its own so progress is visible while the import
+    runs. Batches are upserts, so uploading the same file again after a failure
+    picks up where it stopped.
+    """
+    # read_only streams the rows instead of loading the whole file
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    # this is to avoid getting/creating Assets multiple times
+    assets_by_name = {}
 
-    # Format date on x-axis
-    ax1.xaxis.set_major_formatter(DateFormatter("%Y-%m-%d"))
-    fig.autofmt_xdate()
+    try:
+        import_weights_sheet(workbook["weights"], assets_by_name, on_progress)
+        import_prices_sheet(workbook["Precios"], assets_by_name, on_progress)
+    finally:
+        workbook.close()
+        # bulk writes skip Price.save, so expire the cached results here
+        asset_ids = [asset.id for asset in assets_by_name.values()]
+        transaction.on_commit(lambda: invalidate_prices(asset_ids))
+        # before touching, so refreshes after that read the new prices
+        Price.rebuild_store(asset_ids)
+        Portfolio.touch(asset_ids=asset_ids)
 
-    # Make a second y-axis for the stacked area plot
-    ax2 = ax1.twinx()
-    ax2.stackplot(dates, *weights.values(), labels=weights.keys(), alpha=0.4)
-    ax2.set_ylabel("Weights (t)")
 
-    # Adding legends and title
-    ax1.legend(loc="upper left")
-    ax2.legend(loc="upper right")
-    plt.title(f'Portfolio Value and Weights for "{portfolio.name}"')
+def apply_transactions(transactions: list) -> list:
+    """
+    Apply and save many unsaved Transactions in a single atomic pass.
 
-    # Save the plot to a BytesIO object
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    plt.close(fig)
+    Follows the same rules as Transaction.save, applied in the given order, but
+    prices are fetched in one query and each PortfolioAsset is locked once.
+    """
+    logger.info("Preparing batch of transactions [n=%d]", len(transactions))
 
-    # Encode the image to base64
-    image_base64 = base64.b64encode(buf.read()).decode("utf-8")
+    # Get the prices based on the assets and dates
+    prices = Price.prices_as_of(
+        ((t.asset_id, t.date) for t in transactions), cached=False
+    )
+
+    pairs = {(t.portfolio_id, t.asset_id) for t in transactions}
+    deltas = {}
+
+    # to avoid partial updates
+    with transaction.atomic():
+        # Retrieve or create the PortfolioAsset objects
+        portfolio_assets = {
+            (pa.portfolio_id, pa.asset_id): pa
+            for pa in PortfolioAsset.objects.select_for_update().filter(
+                portfolio_id__in={pair[0] for pair in pairs},
+                asset_id__in={pair[1] for pair in pairs},
+            )
+        }
+        new_portfolio_assets = [
+            PortfolioAsset(portfolio_id=portfolio_id, asset_id=asset_id)
+            for portfolio_id, asset_id in pairs - portfolio_assets.keys()
+        ]
+        for pa in PortfolioAsset.objects.bulk_create(new_portfolio_assets):
+            portfolio_assets[pa.portfolio_id, pa.asset_id] = pa
+
+        for i, t in enumerate(transactions):
+            price = prices.get((t.asset_id, t.date))
+            if not price:
+                raise ValidationError(
+                    f"Price not found for the given Asset [#{i}, a={t.asset.name}, d={t.date}]"
+                )
+
+            # Calculate quantity based on value and price
+            quantity = t.value / price
+            portfolio_asset = portfolio_assets[t.portfolio_id, t.asset_id]
+
+            # Adjust quantity based on transaction type
+            if t.transaction_type == Transaction.TRANSACTION_BUY:
+                delta = quantity
+            elif t.transaction_type == Transaction.TRANSACTION_SELL:
+                if portfolio_asset.quantity < quantity:
+                    raise ValidationError(
+                        f"Cannot sell more assets than owned! [#{i}] (current={portfolio_asset.quantity:.2f} < selling={quantity:.2f})",
+                    )
+                delta = -quantity
+
+            # round like saving each transaction on its own would
+            portfolio_asset.quantity = (portfolio_asset.quantity + delta).quantize(
+                QUANTITY_PLACES
+            )
+            key = (t.portfolio_id, t.asset_id, t.date)
+            deltas[key] = deltas.get(key, 0) + delta.quantize(QUANTITY_PLACES)
+
+        # Save the PortfolioAsset changes
+        PortfolioAsset.objects.bulk_update(
+            portfolio_assets.values(), ["quantity"], batch_size=BATCH_SIZE
+        )
+
+        # delete the portfolio_assets whose quantities became zero
+        PortfolioAsset.objects.filter(
+            id__in=[
+                pa.id
+                for pa in portfolio_assets.values()
+                if pa.quantity == 0 and pa.weight == 0
+            ]
+        ).delete()
+
+        # Keep the point-in-time positions in sync
+        Holding.apply_deltas(deltas)
+
+        transactions = Transaction.objects.bulk_create(
+            transactions, batch_size=BATCH_SIZE
+        )
+
+    logger.info("Batch of transactions done [n=%d]", len(transactions))
+    return transactions
+
+
+def plan_rebalance(portfolios: list, date, min_value=Decimal(0), lock=False) -> dict:
+    """
+    Get the trades that bring each of the given portfolios back to the target
+    weights of its assets, at the prices and positions of the given date.
+
+    The positions (from the holdings ledger) and prices of all the portfolios
+    are read in two queries and sized in one vectorized pass (see
+    rebalancing.py). Trade values are rounded down, so sells never exceed
+    what's held.
+    """
+    held = Holding.objects.filter(
+        portfolio=OuterRef("portfolio"), asset=OuterRef("asset"), date__lte=date
+    ).order_by("-date")
+    positions = (
+        PortfolioAsset.objects.filter(portfolio__in=portfolios)
+        .annotate(held=Coalesce(Subquery(held.values("quantity")[:1]), Decimal(0)))
+        .order_by("portfolio_id", "asset_id")
+    )
+    if lock:
+        positions = positions.select_for_update(of=("self",))
+    rows = list(
+        positions.values_list(
+            "portfolio_id", "asset_id", "asset__name", "held", "weight"
+        )
+    )
+    prices = {
+        asset_id: price
+        for (asset_id, _), price in Price.prices_as_of(
+            ((row[1], date) for row in rows), cached=not lock
+        ).items()
+    }
+
+    index_by_portfolio = {portfolio.id: i for i, portfolio in enumerate(portfolios)}
+    portfolio_index = np.array(
+        [index_by_portfolio[row[0]] for row in rows], dtype=np.intp
+    )
+    quantities = np.array([float(row[3]) for row in rows])
+    weights = np.array([float(row[4]) for row in rows])
+
+    totals = np.bincount(portfolio_index, weights=weights, minlength=len(portfolios))
+    for portfolio, total in zip(portfolios, totals):
+        if round(total, 4) != 1:
+            raise ValidationError(
+                f"The weights of the assets must sum up to 100% [p={portfolio}]."
+            )
+
+    for portfolio_id, asset_id, name, quantity, weight in rows:
+        if (quantity or weight) and asset_id not in prices:
+            raise ValidationError(
+                f"Missing asset value for the given date [a={name}, date={date}]."
+            )
+
+    values, current, trade_values = rebalance(
+        portfolio_index,
+        quantities,
+        weights,
+        np.array([float(prices.get(row[1], np.nan)) for row in rows]),
+        len(portfolios),
+        float(min_value),
+    )
+
+    trades = []
+    amounts = trade_values.tolist()
+    for i in np.flatnonzero(trade_values).tolist():
+        portfolio_id, asset_id, name, _, weight = rows[i]
+        value = Decimal(repr(round(abs(amounts[i]), 8))).quantize(
+            FOUR_PLACES, rounding=ROUND_DOWN
+        )
+        quantity = (value / prices[asset_id]).quantize(QUANTITY_PLACES)
+        # leftovers of the rounding of earlier trades
+        if not quantity:
+            continue
+        trades.append(
+            {
+                "portfolio": portfolio_id,
+                "asset": asset_id,
+                "asset_name": name,
+                "transaction_type": (
+                    Transaction.TRANSACTION_BUY
+                    if amounts[i] > 0
+                    else Transaction.TRANSACTION_SELL
+                ),
+                "value": value,
+                "price": prices[asset_id],
+                "quantity": quantity,
+                "weight": to_decimal(current[i]),
+                "target_weight": weight,
+            }
+        )
+
+    return {
+        "date": date,
+        "values": {
+            portfolio.id: to_decimal(value)
+            for portfolio, value in zip(portfolios, values)
+        },
+        "trades": trades,
+    }
+
+
+def rebalance_portfolios(
+    portfolios: list, date, min_value=Decimal(0), execute=False
+) -> dict:
+    """
+    Plan the rebalancing of the given portfolios and, when `execute`, make
+    every trade in a single atomic pass through apply_transactions
+    """
+    # to avoid trading on positions that changed since they were read
+    with transaction.atomic():
+        plan = plan_rebalance(portfolios, date, min_value, lock=execute)
+
+        if execute and plan["trades"]:
+            transactions = apply_transactions(
+                [
+                    Transaction(
+                        portfolio_id=trade["portfolio"],
+                        asset_id=trade["asset"],
+                        date=date,
+                        transaction_type=trade["transaction_type"],
+                        value=trade["value"],
+                    )
+                    for trade in plan["trades"]
+                ]
+            )
+            for trade, t in zip(plan["trades"], transactions):
+                trade["transaction"] = t.id
+
+    logger.info(
+        "Rebalance Done [portfolios=%d, trades=%d, executed=%s]",
+        len(portfolios),
+        len(plan["trades"]),
+        execute,
+    )
+    return {**plan, "executed": execute}
+
+
+def create_deposits(portfolios: list, amount, date) -> list:
+    """
+    Deposit the same amount into each of the given portfolios in a single pass
+    """
+    deposits = [
+        Deposit(portfolio=portfolio, amount=amount, date=date)
+        for portfolio in portfolios
+    ]
 
-    return image_base64
+    # to avoid partial updates
+    with transaction.atomic():
+        Deposit.distribute_deposits(deposits)
+        return Deposit.objects.bulk_create(deposits, batch_size=BATCH_SIZE)
@@ -0,0 +1,230 @@
+"""
+Synthetic data at a configurable scale, to try out and benchmark the API with
+far more data than the sample workbook has.
+
+Prices follow a geometric random walk over business days, and portfolios get
+random target weights, an opening deposit and then random deposits and
+trades, all written through the same services the API uses.
+"""
+
+from dataclasses import dataclass
+from datetime import date as Date
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+import openpyxl
+from django.db import transaction
+
+from .cache import invalidate_prices
+from .models import Asset, Portfolio, PortfolioAsset, Price, Transaction
+from .services import BATCH_SIZE, apply_transactions, create_deposits
+
+FOUR_PLACES = Decimal("0.0001")
+OPENING_DEPOSIT = Decimal(1_000_000)
+
+
+@dataclass
+class Scale:
+    portfolios: int
+    assets: int
+    days: int
+    transactions: int
+    deposits: int
+
+
+SCALES = {
+    "small": Scale(portfolios=5, assets=20, days=250, transactions=200, deposits=20),
+    "medium": Scale(
+        portfolios=20, assets=100, days=1250, transactions=1000, deposits=100
+    ),
+    "large": Scale(
+        portfolios=50, assets=300, days=2500, transactions=5000, deposits=500
+    ),
+}
+
+
+def business_days(start: Date, days: int) -> list:
+    """
+    Get `days` consecutive weekdays from `start` on
+    """
+    dates = []
+    day = start
+    while len(dates) < days:
+        if day.weekday() < 5:
+            dates.append(day)
+        day += timedelta(days=1)
+    return dates
+
+
+def price_paths(rng, days: int, assets: int) -> np.ndarray:
+    """
+    Get a days x assets matrix of prices following geometric random walks
+    """
+    opening = rng.uniform(10, 500, size=assets)
+    volatility = rng.uniform(0.005, 0.03, size=assets)
+    drift = rng.normal(0.0002, 0.0005, size=assets)
+    returns = rng.normal(drift, volatility, size=(days, assets))
+    returns[0] = 0
+    return np.round(opening * np.exp(np.cumsum(returns, axis=0)), 4)
+
+
+def random_weights(rng, n: int) -> list:
+    """
+    Get `n` random weights with 4 decimal places that sum up to exactly 1
+    """
+    weights = [
+        Decimal(str(w)).quantize(FOUR_PLACES)
+        for w in np.round(rng.dirichlet(np.ones(n) * 2), 4)
+    ]
+    # give the rounding leftover to the largest weight
+    largest = max(range(n), key=lambda i: weights[i])
+    weights[largest] += 1 - sum(weights)
+    return weights
+
+
+def generate_dataset(scale: Scale, start=Date(2015, 1, 1), seed=0, prefix="SYN"):
+    """
+    Write a synthetic dataset of the given scale, returning how many rows of
+    each kind were created
+    """
+    rng = np.random.default_rng(seed)
+    dates = business_days(start, scale.days)
+    prices = price_paths(rng, scale.days, scale.assets)
+
+    # a fifth of the assets are listed later on, and only traded afterwards
+    listed_from = np.zeros(scale.assets, dtype=int)
+    late = rng.choice(scale.assets, size=scale.assets // 5, replace=False)
+    listed_from[late] = rng.integers(1, scale.days, size=len(late))
+    from_start = np.flatnonzero(listed_from == 0)
+
+    assets = Asset.objects.bulk_create(
+        [Asset(name=f"{prefix}-{j + 1:04d}") for j in range(scale.assets)]
+    )
+
+    count = 0
+    batch = []
+    for j, asset in enumerate(assets):
+        for i in range(listed_from[j], scale.days):
+            batch.append(
+                Price(asset=asset, date=dates[i], price=Decimal(str(prices[i, j])))
+            )
+            if len(batch) >= BATCH_SIZE:
+                count += len(Price.objects.bulk_create(batch))
+                batch = []
+    count += len(Price.objects.bulk_create(batch))
+
+    # bulk writes skip Price.save
+    asset_ids = [asset.id for asset in assets]
+    transaction.on_commit(lambda: invalidate_prices(asset_ids))
+    Price.rebuild_store(asset_ids)
+    Portfolio.touch(asset_ids=asset_ids)
+
+    portfolios = []
+    with transaction.atomic():
+        for p in range(scale.portfolios):
+            portfolio = Portfolio.objects.create(name=f"{prefix} Portfolio {p + 1}")
+            size = int(
+                rng.integers(min(5, len(from_start)), min(30, len(from_start)) + 1)
+            )
+            members = rng.choice(from_start, size=size, replace=False)
+            PortfolioAsset.objects.bulk_create(
+                [
+                    PortfolioAsset(portfolio=portfolio, asset=assets[j], weight=w)
+                    for j, w in zip(members, random_weights(rng, size))
+                ]
+            )
+            portfolios.append(portfolio)
+
+    create_deposits(portfolios, OPENING_DEPOSIT, dates[0])
+
+    # later deposits, in chronological order
+    deposits = 0
+    for i in np.sort(rng.integers(1, scale.days, size=scale.deposits)):
+        portfolio = portfolios[rng.integers(len(portfolios))]
+        amount = Decimal(int(rng.integers(1_000, 100_000)))
+        create_deposits([portfolio], amount, dates[i])
+        deposits += 1
+
+    trades = generate_trades(rng, scale, dates, prices, listed_from, portfolios, assets)
+    apply_transactions(trades)
+
+    return {
+        "assets": len(assets),
+        "prices": count,
+        "portfolios": len(portfolios),
+        "deposits": len(portfolios) + deposits,
+        "transactions": len(trades),
+    }
+
+
+def generate_trades(rng, scale, dates, prices, listed_from, portfolios, assets):
+    """
+    Get unsaved buys and sells in chronological order.
+
+    Each sell closes half of an earlier buy at the later price, so no sell
+    takes more than a portfolio holds.
+    """
+    n_buys = scale.transactions - scale.transactions // 4
+    buys = []
+    for _ in range(n_buys):
+        j = int(rng.integers(scale.assets))
+        i = int(rng.integers(listed_from[j], scale.days))
+        p = int(rng.integers(len(portfolios)))
+        buys.append((i, p, j, Decimal(int(rng.integers(100, 10_000)))))
+
+    sells = []
+    for k in rng.choice(len(buys), size=scale.transactions - n_buys, replace=False):
+        i, p, j, value = buys[k]
+        later = int(rng.integers(i, scale.days))
+        ratio = Decimal(str(prices[later, j])) / Decimal(str(prices[i, j]))
+        sells.append((later, p, j, (value * ratio / 2).quantize(Decimal("0.01"))))
+
+    trades = sorted(
+        [(i, p, j, v, Transaction.TRANSACTION_BUY) for i, p, j, v in buys]
+        + [(i, p, j, v, Transaction.TRANSACTION_SELL) for i, p, j, v in sells],
+        # buys first on the same day, so a same-day sell finds its quantity
+        key=lambda trade: (trade[0], trade[4]),
+    )
+    return [
+        Transaction(
+            portfolio=portfolios[p],
+            asset=assets[j],
+            date=dates[i],
+            transaction_type=kind,
+            value=value,
+        )
+        for i, p, j, value, kind in trades
+    ]
+
+
+def write_workbook(path, scale: Scale, start=Date(2015, 1, 1), seed=0, prefix="XLS"):
+    """
+    Write an upload file of the given scale, in the layout import_workbook reads
+    """
+    rng = np.random.default_rng(seed)
+    dates = business_days(start, scale.days)
+    prices = price_paths(rng, scale.days, scale.assets)
+    names = [f"{prefix}-{j + 1:04d}" for j in range(scale.assets)]
+    portfolio_names = [f"{prefix} Portfolio {p + 1}" for p in range(scale.portfolios)]
+
+    # each asset is weighted in a random portfolio
+    weights = np.zeros((scale.assets, scale.portfolios))
+    owners = rng.integers(scale.portfolios, size=scale.assets)
+    for p in range(scale.portfolios):
+        members = np.flatnonzero(owners == p)
+        if len(members):
+            weights[members, p] = random_weights(rng, len(members))
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("weights")
+    sheet.append(["Fecha", "activos", *portfolio_names])
+    for j, name in enumerate(names):
+        sheet.append([dates[0], name, *[w or None for w in weights[j].tolist()]])
+
+    sheet = workbook.create_sheet("Precios")
+    sheet.append(["Dates", *names])
+    for i, date in enumerate(dates):
+        sheet.append([date, *prices[i].tolist()])
+
+    workbook.save(path)
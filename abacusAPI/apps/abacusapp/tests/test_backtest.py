@@ -0,0 +1,90 @@
+from datetime import date, timedelta
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from ..backtest import backtest, calendar_rebalances, simulate, threshold_rebalances
+
+
+def simulate_daily(prices, weights, capital, rebalances, cost):
+    """
+    Step the portfolio one date at a time, trading back to the target weights
+    on each rebalance
+    """
+    rebalances = set(rebalances.tolist())
+    values, turnovers, costs = [], [], []
+    quantities = None
+    for i, day_prices in enumerate(prices):
+        if quantities is None:
+            value, turnover = capital, 1.0
+        elif i in rebalances:
+            value = quantities @ day_prices
+            turnover = np.abs(quantities * day_prices / value - weights).sum()
+        else:
+            values.append(quantities @ day_prices)
+            continue
+
+        costs.append(value * cost * turnover)
+        turnovers.append(turnover)
+        quantities = value * (1 - cost * turnover) * weights / day_prices
+        values.append(quantities @ day_prices)
+
+    return np.array(values), np.array(turnovers), np.array(costs)
+
+
+def drift_rebalances(prices, weights, threshold):
+    """
+    Check every date against the last rebalance, one at a time
+    """
+    starts = [0]
+    for i in range(1, len(prices)):
+        held = prices[i] / prices[starts[-1]] * weights
+        if (np.abs(held / held.sum() - weights) > threshold).any():
+            starts.append(i)
+    return np.array(starts)
+
+
+class BacktestTest(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.dates = [date(2020, 1, 1) + timedelta(days=i) for i in range(400)]
+        returns = rng.normal(0.0003, 0.02, size=(len(self.dates), 4))
+        self.prices = 100 * np.exp(np.cumsum(returns, axis=0))
+        self.weights = np.array([0.4, 0.3, 0.2, 0.1])
+
+    def test_simulate_matches_daily_steps(self):
+        for frequency in ("daily", "weekly", "monthly"):
+            for cost in (0.0, 0.001):
+                with self.subTest(frequency=frequency, cost=cost):
+                    rebalances = calendar_rebalances(self.dates, frequency)
+                    expected = simulate_daily(
+                        self.prices, self.weights, 1000.0, rebalances, cost
+                    )
+                    result = simulate(
+                        self.prices, self.weights, 1000.0, rebalances, cost
+                    )
+                    for got, want in zip(result, expected):
+                        np.testing.assert_allclose(got, want, rtol=1e-6)
+
+    def test_threshold_rebalances_match_daily_checks(self):
+        for threshold in (0.01, 0.05, 0.2):
+            with self.subTest(threshold=threshold):
+                np.testing.assert_array_equal(
+                    threshold_rebalances(self.prices, self.weights, threshold),
+                    drift_rebalances(self.prices, self.weights, threshold),
+                )
+
+    def test_backtest_starts_once_every_asset_is_priced(self):
+        prices = self.prices.copy()
+        prices[:10, 2] = np.nan
+        prices[50, 1] = np.nan
+
+        data = backtest(self.dates, prices, self.weights, 1000.0, "monthly")
+
+        self.assertEqual(data["start"], self.dates[10])
+        self.assertEqual(data["start_value"], 1000.0)
+
+    def test_backtest_needs_two_priced_dates(self):
+        prices = self.prices[:5].copy()
+        prices[:4, 0] = np.nan
+        self.assertIsNone(backtest(self.dates[:5], prices, self.weights, 1000.0))
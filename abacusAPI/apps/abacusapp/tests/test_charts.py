@@ -0,0 +1,87 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from ..models import Asset, Portfolio, PortfolioAsset, Price
+from ..rendering import lttb_indices
+from ..services import aget_portfolio_series, get_portfolio_series
+from ..valuation import load_daily_values
+
+START = date(2024, 1, 1)
+END = date(2024, 12, 31)
+
+
+@override_settings(PRICE_STORE_DIR=None)
+class PortfolioSeriesTest(TestCase):
+    def setUp(self):
+        self.portfolio = Portfolio.objects.create(name="P")
+        for i, name in enumerate("AB"):
+            asset = Asset.objects.create(name=name)
+            PortfolioAsset.objects.create(
+                portfolio=self.portfolio, asset=asset, quantity=10, weight=0.5
+            )
+            Price.objects.bulk_create(
+                Price(
+                    asset=asset,
+                    date=START + timedelta(days=day),
+                    price=Decimal(100 + (day * (i + 3)) % 37),
+                )
+                # B has no prices on some days
+                for day in range(300)
+                if i == 0 or day % 5
+            )
+        self.portfolio.refresh_from_db()
+        # refreshed here, as an async refresh runs in a thread of its own that
+        # can't see this test's transaction
+        load_daily_values(self.portfolio, START, END)
+
+    def expected(self, points) -> dict:
+        rows = load_daily_values(self.portfolio, START, END)
+        values = np.array([float(row["value"]) for row in rows])
+        x = np.array([row["date"].toordinal() for row in rows], dtype=np.float64)
+        kept = [rows[i] for i in lttb_indices(x, values, points)]
+        return {
+            "dates": [row["date"] for row in kept],
+            "values": [float(row["value"]) for row in kept],
+            "weights": {
+                name: [float(row["weights"].get(name, 0)) for row in kept]
+                for name in "AB"
+            },
+        }
+
+    def assertSeries(self, series, expected):
+        self.assertEqual(series["dates"], expected["dates"])
+        self.assertEqual(series["values"].tolist(), expected["values"])
+        self.assertEqual(
+            {name: weights.tolist() for name, weights in series["weights"].items()},
+            expected["weights"],
+        )
+
+    def test_downsampled(self):
+        expected = self.expected(50)
+
+        with CaptureQueriesContext(connection) as queries:
+            series = get_portfolio_series(self.portfolio, START, END, points=50)
+
+        self.assertSeries(series, expected)
+        # the weights are only read for the dates kept
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn("weights", queries[0]["sql"])
+
+    def test_async(self):
+        for points in (None, 50):
+            with self.subTest(points=points):
+                self.assertSeries(
+                    async_to_sync(aget_portfolio_series)(
+                        self.portfolio, START, END, points
+                    ),
+                    self.expected(points or 300),
+                )
+
+    def test_without_data(self):
+        self.assertIsNone(get_portfolio_series(self.portfolio, END, END))
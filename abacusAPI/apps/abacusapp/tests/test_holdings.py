@@ -0,0 +1,95 @@
+import random
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+
+from ..models import Asset, Holding, Portfolio, PortfolioAsset
+from ..valuation import quantities_on
+
+
+def replay(deltas: list) -> dict:
+    """
+    Rebuild the positions from scratch: the running sum of the deltas of each
+    pair, on each date one of them falls on
+    """
+    by_pair = defaultdict(lambda: defaultdict(Decimal))
+    for portfolio_id, asset_id, day, delta in deltas:
+        by_pair[portfolio_id, asset_id][day] += delta
+
+    positions = {}
+    for pair, changes in by_pair.items():
+        quantity = Decimal(0)
+        for day in sorted(changes):
+            quantity += changes[day]
+            positions[(*pair, day)] = quantity
+    return positions
+
+
+@override_settings(PRICE_STORE_DIR=None)
+class HoldingLedgerTest(TestCase):
+    def setUp(self):
+        self.rng = random.Random(3)
+        self.portfolios = [Portfolio.objects.create(name=f"P{i}") for i in range(2)]
+        self.assets = [Asset.objects.create(name=f"A{i}") for i in range(3)]
+
+    def random_deltas(self, count: int) -> list:
+        # out of order on purpose, so most of them are back-dated
+        start = date(2022, 1, 1)
+        return [
+            (
+                self.rng.choice(self.portfolios).id,
+                self.rng.choice(self.assets).id,
+                start + timedelta(days=self.rng.randrange(60)),
+                Decimal(self.rng.randrange(-50_000, 100_000)) / 100,
+            )
+            for _ in range(count)
+        ]
+
+    def ledger(self) -> dict:
+        return {
+            (h.portfolio_id, h.asset_id, h.date): h.quantity
+            for h in Holding.objects.all()
+        }
+
+    def test_apply_delta_matches_replay(self):
+        deltas = self.random_deltas(150)
+        portfolios = {p.id: p for p in self.portfolios}
+        assets = {a.id: a for a in self.assets}
+
+        for portfolio_id, asset_id, day, delta in deltas:
+            Holding.apply_delta(portfolios[portfolio_id], assets[asset_id], day, delta)
+
+        self.assertEqual(self.ledger(), replay(deltas))
+
+    def test_apply_deltas_matches_replay(self):
+        deltas = self.random_deltas(300)
+
+        # in batches, some of them with several deltas on the same key
+        for i in range(0, len(deltas), 40):
+            batch = defaultdict(Decimal)
+            for portfolio_id, asset_id, day, delta in deltas[i : i + 40]:
+                batch[portfolio_id, asset_id, day] += delta
+            Holding.apply_deltas(batch)
+
+        self.assertEqual(self.ledger(), replay(deltas))
+
+    def test_direct_quantities_count_from_the_start(self):
+        portfolio, asset = self.portfolios[0], self.assets[0]
+        Holding.apply_delta(portfolio, asset, date(2022, 3, 1), Decimal(10))
+
+        pa = PortfolioAsset.objects.create(
+            portfolio=portfolio, asset=asset, quantity=Decimal(210)
+        )
+        self.assertEqual(
+            quantities_on(portfolio, [asset.id], date(2022, 2, 1)), {asset.id: 210}
+        )
+        self.assertEqual(
+            quantities_on(portfolio, [asset.id], date(2022, 3, 1)), {asset.id: 220}
+        )
+
+        pa.delete()
+        self.assertEqual(
+            quantities_on(portfolio, [asset.id], date(2022, 3, 1)), {asset.id: 10}
+        )
@@ -0,0 +1,68 @@
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import openpyxl
+from django.test import TestCase, override_settings
+
+from ..models import Deposit, Holding, Portfolio, Price
+from ..services import import_workbook
+from ..valuation import load_daily_values
+
+START = datetime(2024, 1, 1)
+
+
+@override_settings(PRICE_STORE_DIR=None)
+class ImportWorkbookTest(TestCase):
+    def write_workbook(self, factor: int) -> str:
+        workbook = openpyxl.Workbook(write_only=True)
+        weights = workbook.create_sheet("weights")
+        weights.append(["Fecha", "activos", "P1"])
+        weights.append([START, "A", 0.5])
+        weights.append([START, "B", 0.5])
+
+        prices = workbook.create_sheet("Precios")
+        prices.append(["Dates", "A", "B"])
+        for day in range(5):
+            prices.append(
+                [START + timedelta(days=day), factor * (10 + day), factor * 20]
+            )
+
+        fd, path = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        workbook.save(path)
+        return path
+
+    def upload(self, factor: int):
+        with self.captureOnCommitCallbacks(execute=True):
+            import_workbook(self.write_workbook(factor))
+
+    def daily_values(self, portfolio) -> dict:
+        portfolio = Portfolio.objects.get(pk=portfolio.pk)
+        rows = load_daily_values(portfolio, date(2024, 1, 1), date(2024, 1, 31))
+        return {row["date"]: row["value"] for row in rows}
+
+    def test_upload_again_updates_prices(self):
+        self.upload(factor=1)
+        portfolio = Portfolio.objects.get(name="P1")
+        Deposit.objects.create(portfolio=portfolio, amount=Decimal(1000), date=START)
+        holdings = list(Holding.objects.values_list("asset__name", "date", "quantity"))
+        before = self.daily_values(portfolio)
+        self.assertEqual(before[date(2024, 1, 1)], 1000)
+
+        self.upload(factor=2)
+
+        self.assertEqual(Portfolio.objects.filter(name="P1").count(), 1)
+        self.assertEqual(Price.objects.count(), 10)
+        self.assertEqual(
+            Price.objects.get(asset__name="A", date=date(2024, 1, 3)).price, 24
+        )
+        # same positions, worth twice as much
+        self.assertEqual(
+            list(Holding.objects.values_list("asset__name", "date", "quantity")),
+            holdings,
+        )
+        after = self.daily_values(portfolio)
+        self.assertEqual(after, {day: 2 * value for day, value in before.items()})
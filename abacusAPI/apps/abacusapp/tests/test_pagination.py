@@ -0,0 +1,82 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from ..models import Asset, Price
+
+
+@override_settings(PRICE_STORE_DIR=None)
+class PriceKeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="admin"))
+
+        # every date has a price of each asset, so pages end inside a date
+        self.assets = [Asset.objects.create(name=name) for name in "CAB"]
+        start = date(2024, 1, 1)
+        Price.objects.bulk_create(
+            Price(asset=asset, date=start + timedelta(days=day), price=Decimal(day))
+            for day in range(4)
+            for asset in self.assets
+        )
+
+    def walk(self, url) -> tuple[list, int]:
+        """
+        Follow the next links from url, returning every row and the pages
+        """
+        rows, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            rows += response.json()["results"]
+            url = response.json()["next"]
+            pages += 1
+        return rows, pages
+
+    def keys(self, rows) -> list:
+        return [(row["date"], row["asset"]) for row in rows]
+
+    def expected(self, prices) -> list:
+        return [
+            (price.date.isoformat(), price.asset_id)
+            for price in prices.order_by("date", "asset_id", "id")
+        ]
+
+    def test_pages_cover_every_row_once_in_order(self):
+        for page_size in (1, 2, 5, 12, 100):
+            with self.subTest(page_size=page_size):
+                rows, pages = self.walk(f"/prices/?page_size={page_size}")
+
+                self.assertEqual(self.keys(rows), self.expected(Price.objects.all()))
+                self.assertEqual(pages, max(1, -(-12 // page_size)))
+
+    def test_ties_on_date_break_by_asset(self):
+        first = self.client.get("/prices/?page_size=2").json()
+        second = self.client.get(first["next"]).json()
+
+        # the page ends between the assets of one date
+        day = "2024-01-01"
+        ids = sorted(asset.id for asset in self.assets)
+        self.assertEqual(self.keys(first["results"]), [(day, ids[0]), (day, ids[1])])
+        self.assertEqual(self.keys(second["results"])[0], (day, ids[2]))
+
+    def test_filters_apply_to_every_page(self):
+        asset = self.assets[0]
+        rows, _ = self.walk(
+            f"/prices/?page_size=1&asset_id={asset.id}&fecha_inicio=2024-01-02"
+        )
+
+        self.assertEqual(
+            self.keys(rows),
+            self.expected(Price.objects.filter(asset=asset, date__gte="2024-01-02")),
+        )
+
+    def test_invalid_cursor(self):
+        for cursor in ("nope", "bm9wZQ==", "MjAyNC0wMS0wMXx4fDE="):
+            with self.subTest(cursor=cursor):
+                response = self.client.get("/prices/", {"cursor": cursor})
+
+                self.assertEqual(response.status_code, 400)
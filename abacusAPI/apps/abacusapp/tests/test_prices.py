@@ -0,0 +1,191 @@
+import fcntl
+import tempfile
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from .. import pricestore
+from ..cache import latest_prices, price_history
+from ..models import Asset, Portfolio, PortfolioAsset, Price
+from ..valuation import load_daily_values
+
+
+@override_settings(PRICE_STORE_DIR=None)
+class PriceMoveTest(TestCase):
+    def setUp(self):
+        self.portfolio = Portfolio.objects.create(name="P")
+        self.a = Asset.objects.create(name="A")
+        self.b = Asset.objects.create(name="B")
+        for asset in (self.a, self.b):
+            PortfolioAsset.objects.create(
+                portfolio=self.portfolio,
+                asset=asset,
+                quantity=Decimal(10),
+                weight=Decimal("0.5"),
+            )
+        self.price = Price.objects.create(
+            asset=self.a, date=date(2024, 1, 3), price=Decimal(5)
+        )
+        Price.objects.create(asset=self.a, date=date(2024, 1, 10), price=Decimal(6))
+        Price.objects.create(asset=self.b, date=date(2024, 1, 5), price=Decimal(2))
+
+    def daily_values(self) -> dict:
+        # a fresh instance, like each request gets
+        portfolio = Portfolio.objects.get(pk=self.portfolio.pk)
+        rows = load_daily_values(portfolio, date(2024, 1, 1), date(2024, 1, 31))
+        return {row["date"]: (row["value"], set(row["weights"])) for row in rows}
+
+    def test_moving_a_price_to_a_later_date(self):
+        self.assertEqual(self.daily_values()[date(2024, 1, 3)][0], 50)
+
+        self.price.date = date(2024, 1, 8)
+        self.price.save()
+
+        values = self.daily_values()
+        self.assertNotIn(date(2024, 1, 3), values)
+        self.assertEqual(values[date(2024, 1, 8)], (50, {"A"}))
+
+    def test_moving_a_price_to_another_asset(self):
+        self.daily_values()
+
+        self.price.asset = self.b
+        self.price.date = date(2024, 1, 8)
+        self.price.save()
+
+        values = self.daily_values()
+        self.assertNotIn(date(2024, 1, 3), values)
+        self.assertEqual(values[date(2024, 1, 8)], (50, {"B"}))
+        self.assertEqual(values[date(2024, 1, 10)], (60, {"A"}))
+
+
+class PriceStoreMoveTest(TestCase):
+    def setUp(self):
+        store_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(store_dir.cleanup)
+        settings = override_settings(PRICE_STORE_DIR=store_dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # ids are reused between tests
+        latest_prices.clear()
+        price_history.clear()
+
+        self.a = Asset.objects.create(name="A")
+        self.b = Asset.objects.create(name="B")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.price = Price.objects.create(
+                asset=self.a, date=date(2024, 1, 3), price=Decimal(5)
+            )
+
+    def test_moving_a_price_to_another_asset(self):
+        day = date(2024, 1, 5)
+        self.assertEqual(Price.prices_as_of([(self.a.id, day)]), {(self.a.id, day): 5})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.price.asset = self.b
+            self.price.save()
+
+        self.assertEqual(Price.prices_as_of([(self.a.id, day)]), {})
+        self.assertEqual(len(pricestore.read(self.a.id)), 0)
+        self.assertEqual(len(pricestore.read(self.b.id)), 1)
+
+    def test_one_rewrite_per_transaction(self):
+        with mock.patch.object(Price, "rebuild_store") as rebuild_store:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    for day in range(4, 8):
+                        Price.objects.create(
+                            asset=self.b, date=date(2024, 1, day), price=Decimal(day)
+                        )
+                    self.price.delete()
+
+        rebuild_store.assert_called_once()
+        self.assertEqual(set(rebuild_store.call_args.args[0]), {self.a.id, self.b.id})
+
+    def test_lock_is_shared_by_processes(self):
+        lock_path = Path(pricestore.get_store_dir()) / ".lock"
+        with pricestore.locked(), open(lock_path) as other:
+            # another open file, as another process would have
+            with self.assertRaises(BlockingIOError):
+                fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        with open(lock_path) as other:
+            fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+@override_settings(PRICE_STORE_DIR=None, PRICE_MAX_STALENESS_DAYS=7)
+class PricesAsOfTest(TestCase):
+    def setUp(self):
+        # ids are reused between tests
+        price_history.clear()
+        self.asset = Asset.objects.create(name="A")
+        # no prices on the weekends nor on new year's day
+        for day, price in (
+            (date(2023, 12, 29), 1),
+            (date(2024, 1, 2), 2),
+            (date(2024, 1, 5), 5),
+            (date(2024, 1, 8), 8),
+        ):
+            Price.objects.create(asset=self.asset, date=day, price=Decimal(price))
+
+    def prices(self, days, **kwargs) -> dict:
+        prices = Price.prices_as_of([(self.asset.id, day) for day in days], **kwargs)
+        return {day: price for (_, day), price in prices.items()}
+
+    def test_last_price_on_or_before_each_date(self):
+        self.assertEqual(
+            self.prices(
+                [
+                    date(2023, 12, 28),
+                    date(2024, 1, 1),
+                    date(2024, 1, 2),
+                    date(2024, 1, 6),
+                    date(2024, 1, 7),
+                    date(2024, 1, 8),
+                ]
+            ),
+            {
+                date(2024, 1, 1): 1,
+                date(2024, 1, 2): 2,
+                date(2024, 1, 6): 5,
+                date(2024, 1, 7): 5,
+                date(2024, 1, 8): 8,
+            },
+        )
+
+    def test_max_staleness(self):
+        days = [date(2024, 1, 1), date(2024, 1, 7), date(2024, 1, 20)]
+
+        self.assertEqual(self.prices(days, max_staleness=2), {date(2024, 1, 7): 5})
+        # PRICE_MAX_STALENESS_DAYS by default, and no limit with None
+        self.assertEqual(set(self.prices(days)), set(days[:2]))
+        with self.settings(PRICE_MAX_STALENESS_DAYS=None):
+            self.assertEqual(set(self.prices(days)), set(days))
+
+    def test_uncached_reads_only_the_dates_it_can_use(self):
+        days = [date(2024, 1, 6), date(2024, 1, 7)]
+
+        with mock.patch.object(
+            Price, "price_histories", wraps=Price.price_histories
+        ) as price_histories:
+            prices = self.prices(days, max_staleness=4, cached=False)
+
+        self.assertEqual(prices, {date(2024, 1, 6): 5, date(2024, 1, 7): 5})
+        self.assertEqual(
+            price_histories.call_args.kwargs["between"],
+            (date(2024, 1, 2), date(2024, 1, 7)),
+        )
+        # a partial history isn't cached, and matches a whole one
+        self.assertEqual(len(price_history), 0)
+        self.assertEqual(prices, self.prices(days, max_staleness=4))
+
+    def test_uncached_reads_see_the_current_transaction(self):
+        day = date(2024, 1, 9)
+        self.assertEqual(self.prices([day]), {day: 8})
+
+        Price.objects.create(asset=self.asset, date=day, price=Decimal(9))
+
+        self.assertEqual(self.prices([day], cached=False), {day: 9})
@@ -0,0 +1,37 @@
+import os
+import time
+
+from django.test import SimpleTestCase
+
+from ..rendering import (
+    PoolTimeout,
+    PoolUnavailable,
+    discard_executor,
+    get_executor,
+    run_all,
+)
+
+
+def crash():
+    os._exit(1)
+
+
+class ProcessPoolTest(SimpleTestCase):
+    def tearDown(self):
+        discard_executor(get_executor(1))
+
+    def test_results_come_back_in_order(self):
+        calls = [(pow, (2, n), {}) for n in range(5)]
+        self.assertEqual(run_all(calls, workers=1), [1, 2, 4, 8, 16])
+
+    def test_timeout(self):
+        with self.assertRaises(PoolTimeout):
+            run_all([(time.sleep, (5,), {})], workers=1, timeout=0.1)
+
+    def test_crashed_pool_is_replaced(self):
+        broken = get_executor(1)
+        with self.assertRaises(PoolUnavailable):
+            run_all([(crash, (), {})], workers=1)
+
+        self.assertIsNot(get_executor(1), broken)
+        self.assertEqual(run_all([(abs, (-3,), {})], workers=1), [3])
@@ -0,0 +1,84 @@
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from ..models import Asset, Holding, Portfolio, PortfolioAsset, Price, Transaction
+
+
+@override_settings(PRICE_STORE_DIR=None)
+class TransactionBatchTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="admin"))
+
+        self.portfolio = Portfolio.objects.create(name="P")
+        self.a = Asset.objects.create(name="A")
+        self.b = Asset.objects.create(name="B")
+        for asset in (self.a, self.b):
+            Price.objects.create(asset=asset, date=date(2024, 1, 2), price=Decimal(10))
+        PortfolioAsset.objects.create(
+            portfolio=self.portfolio, asset=self.a, quantity=Decimal(5)
+        )
+
+    def trade(self, asset, transaction_type, value, day="2024-01-02") -> dict:
+        return {
+            "portfolio": self.portfolio.id,
+            "asset": asset.id,
+            "date": day,
+            "transaction_type": transaction_type,
+            "value": str(value),
+        }
+
+    def post(self, trades):
+        return self.client.post("/transactions/batch/", trades, format="json")
+
+    def positions(self) -> dict:
+        return dict(
+            PortfolioAsset.objects.values_list("asset__name", "quantity").order_by(
+                "asset__name"
+            )
+        )
+
+    def test_trades_apply_in_order(self):
+        # B is only held after the first trade
+        response = self.post(
+            [self.trade(self.b, "buy", 100), self.trade(self.b, "sell", 40)]
+        )
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(len(response.json()), 2)
+        self.assertEqual(self.positions(), {"A": 5, "B": 6})
+        self.assertEqual(
+            Holding.objects.get(asset=self.b, date=date(2024, 1, 2)).quantity, 6
+        )
+
+    def test_oversell_is_rejected(self):
+        response = self.post([self.trade(self.a, "sell", 60)])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Cannot sell more assets than owned", str(response.json()))
+
+    def test_a_failing_trade_rolls_back_the_batch(self):
+        holdings = list(Holding.objects.values_list("asset", "date", "quantity"))
+
+        for failing in (
+            self.trade(self.a, "sell", 1000),
+            # no price that far back
+            self.trade(self.a, "buy", 10, day="2023-01-02"),
+        ):
+            with self.subTest(failing=failing):
+                response = self.post(
+                    [self.trade(self.b, "buy", 100), self.trade(self.a, "buy", 10)]
+                    + [failing]
+                )
+
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(self.positions(), {"A": 5})
+                self.assertFalse(Transaction.objects.exists())
+                self.assertEqual(
+                    list(Holding.objects.values_list("asset", "date", "quantity")),
+                    holdings,
+                )
@@ -0,0 +1,170 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+
+from ..cache import price_history
+from ..models import Asset, Holding, Portfolio, PortfolioAsset, Price
+from ..valuation import (
+    FOUR_PLACES,
+    scaled_to_decimal,
+    value_portfolio,
+    value_portfolios,
+)
+
+START = date(2024, 1, 1)
+
+
+@override_settings(PRICE_STORE_DIR=None)
+class ExactValuesTest(TestCase):
+    """
+    Values against a reference summed in Decimal
+    """
+
+    def setUp(self):
+        # ids are reused between tests
+        price_history.clear()
+        self.portfolio = Portfolio.objects.create(name="P")
+
+    def hold(self, positions: list):
+        """
+        Hold each (price, quantity) of `positions` on the first date, as an
+        asset of its own
+        """
+        for price, quantity in positions:
+            asset = Asset.objects.create(name=f"A{price}")
+            Price.objects.create(asset=asset, date=START, price=Decimal(price))
+            PortfolioAsset.objects.create(
+                portfolio=self.portfolio, asset=asset, quantity=Decimal(quantity)
+            )
+
+    def values(self) -> tuple:
+        """
+        Get the values of each date from both engines
+        """
+        rows = value_portfolio(self.portfolio, START, date.max).to_daily_values()
+        ((_, dates, values),) = value_portfolios([self.portfolio], START, date.max)
+        return (
+            {row["date"]: row["value"] for row in rows},
+            dict(zip(dates, map(scaled_to_decimal, values))),
+        )
+
+    def reference(self) -> dict:
+        values = {}
+        for day in Price.objects.values_list("date", flat=True).distinct():
+            value = Decimal(0)
+            for pa in PortfolioAsset.objects.filter(portfolio=self.portfolio):
+                quantity = (
+                    Holding.objects.filter(
+                        portfolio=self.portfolio, asset=pa.asset, date__lte=day
+                    )
+                    .order_by("-date")
+                    .values_list("quantity", flat=True)
+                    .first()
+                )
+                # only the prices of that date count
+                price = (
+                    Price.objects.filter(asset=pa.asset, date=day)
+                    .values_list("price", flat=True)
+                    .first()
+                )
+                if price is not None and quantity:
+                    value += price * quantity
+            values[day] = value.quantize(FOUR_PLACES)
+        return values
+
+    def test_float_sum_off_by_one_place(self):
+        # summed as floats, this is 1122142227.6278 instead of .6277
+        self.hold(
+            [
+                ("4614.753", "49298.8939"),
+                ("7755.0307", "97684.2009"),
+                ("4741.5656", "28913.6635"),
+            ]
+        )
+
+        for values in self.values():
+            self.assertEqual(values, {START: Decimal("1122142227.6277")})
+
+    def test_values_too_large_for_int64(self):
+        self.hold([("999999.9999", "500000000000.0001"), ("0.0001", "1")])
+
+        reference = self.reference()
+        self.assertGreater(reference[START], 2**63 / 10**8)
+        for values in self.values():
+            self.assertEqual(values, reference)
+
+    def test_random_histories(self):
+        rng = random.Random(5)
+        self.hold(
+            (
+                f"{rng.randint(1, 10**9) / 10**4:.4f}",
+                f"{rng.randint(1, 10**9) / 10**4:.4f}",
+            )
+            for _ in range(4)
+        )
+        for asset in Asset.objects.all():
+            for day in range(1, 60):
+                if rng.random() < 0.8:
+                    Price.objects.create(
+                        asset=asset,
+                        date=START + timedelta(days=day),
+                        price=Decimal(rng.randint(1, 10**9)) / 10**4,
+                    )
+            # changes in the middle of the range, on and off priced dates
+            Holding.apply_delta(
+                self.portfolio,
+                asset,
+                START + timedelta(days=rng.randint(1, 59)),
+                Decimal(rng.randint(-(10**8), 10**8)) / 10**4,
+            )
+
+        reference = self.reference()
+        for values in self.values():
+            self.assertEqual(values, reference)
+
+
+@override_settings(PRICE_STORE_DIR=None)
+class ValuePortfoliosTest(TestCase):
+    def setUp(self):
+        price_history.clear()
+        rng = random.Random(7)
+        self.assets = [Asset.objects.create(name=f"A{i}") for i in range(4)]
+        for asset in self.assets:
+            for day in range(30):
+                if rng.random() < 0.7:
+                    Price.objects.create(
+                        asset=asset,
+                        date=START + timedelta(days=day),
+                        price=Decimal(rng.randint(1, 10**6)) / 10**4,
+                    )
+
+        # overlapping assets, one only on the ledger and one with none
+        self.portfolios = [Portfolio.objects.create(name=f"P{i}") for i in range(4)]
+        for portfolio, held in zip(self.portfolios, ([0, 1], [1, 2, 3], [3], [])):
+            for j in held:
+                PortfolioAsset.objects.create(
+                    portfolio=portfolio, asset=self.assets[j], quantity=Decimal(j + 1)
+                )
+        Holding.apply_delta(
+            self.portfolios[1], self.assets[0], START + timedelta(days=10), Decimal(5)
+        )
+        Holding.apply_delta(
+            self.portfolios[2], self.assets[3], START + timedelta(days=20), Decimal(-4)
+        )
+
+    def test_same_as_each_portfolio_alone(self):
+        end = START + timedelta(days=25)
+        results = value_portfolios(self.portfolios, START + timedelta(days=5), end)
+
+        for portfolio, (valued, dates, values) in zip(self.portfolios, results):
+            with self.subTest(portfolio=portfolio.name):
+                rows = value_portfolio(
+                    portfolio, START + timedelta(days=5), end
+                ).to_daily_values()
+                self.assertIs(valued, portfolio)
+                self.assertEqual(
+                    list(zip(dates, map(scaled_to_decimal, values))),
+                    [(row["date"], row["value"]) for row in rows],
+                )
@@ -0,0 +1,140 @@
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from ..models import Asset, Portfolio, PortfolioAsset, Price
+from ..rendering import PoolTimeout, PoolUnavailable
+
+
+@override_settings(PRICE_STORE_DIR=None)
+class ApiTestCase(TestCase):
+    def setUp(self):
+        # cached responses outlive each test's rollback
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="admin"))
+
+
+class PortfolioApiTest(ApiTestCase):
+    def test_tracking_fields_are_not_exposed(self):
+        portfolio = Portfolio.objects.create(name="P")
+        Portfolio.touch([portfolio.id])
+
+        data = self.client.get(f"/portfolios/{portfolio.id}/").json()
+
+        self.assertEqual(data["name"], "P")
+        for field in Portfolio.TRACKING_FIELDS:
+            self.assertNotIn(field, data)
+
+
+class PlotApiTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.portfolio = Portfolio.objects.create(name="P")
+        asset = Asset.objects.create(name="A")
+        PortfolioAsset.objects.create(
+            portfolio=self.portfolio, asset=asset, quantity=1, weight=1
+        )
+        Price.objects.create(asset=asset, date=date(2024, 1, 2), price=Decimal(5))
+        self.url = (
+            f"/portfolios/{self.portfolio.id}/plot/"
+            "?fecha_inicio=2024-01-01&fecha_fin=2024-01-31"
+        )
+
+    def test_pool_errors(self):
+        for error, status in ((PoolTimeout, 504), (PoolUnavailable, 503)):
+            with self.subTest(error=error), mock.patch(
+                "abacusAPI.apps.abacusapp.services.render", side_effect=error("no")
+            ):
+                response = self.client.get(self.url)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(response.json(), {"error": "no"})
+
+    def test_backtest_pool_errors(self):
+        for error, status in ((PoolTimeout, 504), (PoolUnavailable, 503)):
+            with self.subTest(error=error), mock.patch(
+                "abacusAPI.apps.abacusapp.services.run_all", side_effect=error("no")
+            ), self.settings(BACKTEST_WORKERS=2):
+                response = self.client.post(
+                    "/portfolios/backtests/",
+                    {
+                        "portfolios": [self.portfolio.id],
+                        "fecha_inicio": "2024-01-01",
+                        "fecha_fin": "2024-01-31",
+                        "scenarios": [{"rebalance": "daily"}, {"rebalance": "weekly"}],
+                    },
+                    format="json",
+                )
+                self.assertEqual(response.status_code, status, response.content)
+
+
+class ConditionalGetTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.portfolio = Portfolio.objects.create(name="P")
+        self.asset = Asset.objects.create(name="A")
+        PortfolioAsset.objects.create(
+            portfolio=self.portfolio, asset=self.asset, quantity=1, weight=1
+        )
+        Price.objects.create(asset=self.asset, date=date(2024, 1, 2), price=Decimal(5))
+        self.url = (
+            f"/portfolios/{self.portfolio.id}/daily_values/"
+            "?fecha_inicio=2024-01-01&fecha_fin=2024-01-31"
+        )
+
+    def get(self, **headers):
+        with mock.patch(
+            "abacusAPI.apps.abacusapp.views.calculate_portfolio_daily_values",
+            return_value=[],
+        ) as calculate:
+            response = self.client.get(self.url, headers=headers)
+        return response, calculate.called
+
+    def test_current_copy_is_not_modified(self):
+        response, _ = self.get()
+        self.assertEqual(response.status_code, 200)
+
+        for headers in (
+            {"If-None-Match": response["ETag"]},
+            {"If-Modified-Since": response["Last-Modified"]},
+        ):
+            with self.subTest(headers=headers):
+                # not even from the response cache
+                cache.clear()
+                not_modified, computed = self.get(**headers)
+
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified.content, b"")
+                self.assertFalse(computed)
+
+    def test_writes_change_the_etag(self):
+        etag = self.get()[0]["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Price.objects.create(
+                asset=self.asset, date=date(2024, 1, 3), price=Decimal(6)
+            )
+        response, computed = self.get(**{"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertTrue(computed)
+
+    def test_other_portfolios_keep_their_etag(self):
+        other = Portfolio.objects.create(name="Q")
+        url = f"/portfolios/{other.id}/daily_value/?date=2024-01-02"
+        etag = self.client.get(url)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Price.objects.create(
+                asset=self.asset, date=date(2024, 1, 3), price=Decimal(6)
+            )
+
+        self.assertEqual(
+            self.client.get(url, headers={"If-None-Match": etag}).status_code, 304
+        )
@@ -0,0 +1,84 @@
+"""
+Per-request instrumentation: how many queries a request ran and how long it
+spent in the database, serializing and rendering.
+
+The numbers of the current request live in a context variable, which
+asgiref carries into sync_to_async threads, so async views are measured
+too. RequestTimingMiddleware starts them and reports them.
+"""
+
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+current = ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        # name -> seconds
+        self.durations = defaultdict(float)
+        self.active = set()
+        # a list to keep every query in, while profiling
+        self.query_log = None
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+@contextmanager
+def measure(name: str):
+    """
+    Add the time spent in the block to the current request's `name` timing.
+
+    Nested blocks of the same name are only counted once, by the outer one.
+    """
+    timing = current.get()
+    if timing is None or name in timing.active:
+        yield
+        return
+
+    timing.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.durations[name] += time.perf_counter() - started
+        timing.active.discard(name)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting queries and their time
+    """
+    timing = current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+
+    timing.queries += 1
+    started = time.perf_counter()
+    try:
+        with measure("db"):
+            return execute(sql, params, many, context)
+    finally:
+        if timing.query_log is not None:
+            timing.query_log.append(
+                {
+                    "sql": sql,
+                    # executemany params can be whole batches
+                    "params": "<many>" if many else params,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                }
+            )
+
+
+def install_query_recorder(connection, **kwargs):
+    """
+    Add record_query to a connection's execute wrappers, once
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
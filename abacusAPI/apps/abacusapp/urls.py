@@ -1,12 +1,16 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from . import async_views
 from .views import (
     AssetViewSet,
+    CacheStatsView,
     DepositViewSet,
+    ImportJobViewSet,
     PortfolioAssetViewSet,
     PortfolioViewSet,
     PriceViewSet,
+    ProfileViewSet,
     TransactionViewSet,
     UploadExcelView,
 )
@@ -18,8 +22,22 @@ router.register(r"prices", PriceViewSet)
 router.register(r"portfolio-assets", PortfolioAssetViewSet)
 router.register(r"deposits", DepositViewSet)
 router.register(r"transactions", TransactionViewSet)
+router.register(r"jobs", ImportJobViewSet)
+router.register(r"profiles", ProfileViewSet, basename="profile")
 
 urlpatterns = [
     path("", include(router.urls)),
     path("upload-excel/", UploadExcelView.as_view(), name="upload-excel"),
+    path("cache-stats/", CacheStatsView.as_view(), name="cache-stats"),
+    # async versions of the heavy portfolio actions, for ASGI deployments
+    path(
+        "async/portfolios/<int:pk>/daily_values/",
+        async_views.portfolio_daily_values,
+        name="async-portfolio-daily-values",
+    ),
+    path(
+        "async/portfolios/<int:pk>/plot/",
+        async_views.portfolio_plot,
+        name="async-portfolio-plot",
+    ),
 ]
@@ -0,0 +1,589 @@
+"""
+Batched valuation engine.
+
+Holdings and prices are pulled in a fixed number of queries (or, for prices,
+from the memory-mapped price store) and laid out as a dates x assets price
+matrix, so a portfolio's value over a whole range is a single matrix-vector
+product instead of one query per price row.
+"""
+
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import date as Date
+from decimal import Decimal
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import DateField, OuterRef, Q, Subquery
+
+from . import pricestore
+from .models import (
+    Asset,
+    Holding,
+    Portfolio,
+    PortfolioAsset,
+    PortfolioDailyValue,
+    Price,
+)
+
+FOUR_PLACES = Decimal("0.0001")
+
+# prices and quantities have 4 decimals, so the values of positions have 8 and
+# add up exactly as integers scaled by SCALE**2
+SCALE = 10**4
+
+
+def to_decimal(value: float) -> Decimal:
+    """
+    Convert a float result from the engine, like a weight, into the Decimal
+    the serializers expect.
+
+    Floats are only exact to about 1e-16 of the value, so a result within
+    that of a rounding tie can end up 0.0001 off; the values of portfolios
+    are summed exactly instead (see scaled_to_decimal).
+    """
+    # exact values have at most 8 decimals: snapping to those first keeps
+    # float noise from flipping rounding ties
+    return Decimal(repr(round(float(value), 8))).quantize(FOUR_PLACES)
+
+
+def to_scaled(values: np.ndarray) -> np.ndarray:
+    """
+    Convert floats with 4 decimals (and NaN for none) into integers scaled by
+    SCALE, still as floats. Exact up to 2**53 / SCALE, about 9e11.
+    """
+    return np.rint(np.nan_to_num(values) * SCALE)
+
+
+def integer_dtype(largest_product: float, terms: int):
+    """
+    Get the dtype to add up `terms` products of scaled integers, each up to
+    `largest_product`, without overflowing: int64 when it can, and Python ints
+    (much slower) otherwise
+    """
+    return np.int64 if largest_product * terms < 2**62 else object
+
+
+def as_integers(values: np.ndarray, dtype) -> np.ndarray:
+    if dtype is object:
+        return np.frompyfunc(int, 1, 1)(values)
+    return values.astype(np.int64)
+
+
+def scaled_to_decimal(value) -> Decimal:
+    """
+    Convert a value scaled by SCALE**2 into the Decimal the serializers expect
+    """
+    return Decimal(int(value)).scaleb(-8).quantize(FOUR_PLACES)
+
+
+@dataclass
+class Holdings:
+    """
+    The assets of a portfolio, one entry per asset.
+
+    Includes assets that are no longer held but still have a history on the
+    holdings ledger; those have no target weight (None).
+    """
+
+    asset_ids: list
+    asset_names: list
+    quantities: np.ndarray
+    weights: list
+
+    def __len__(self):
+        return len(self.asset_ids)
+
+    @property
+    def has_target(self) -> np.ndarray:
+        return np.array([weight is not None for weight in self.weights], dtype=bool)
+
+
+@dataclass
+class PriceMatrix:
+    """
+    Prices as a dates x assets matrix, with NaN where an asset has no price
+    """
+
+    dates: list
+    asset_ids: list
+    values: np.ndarray
+
+    @property
+    def present(self) -> np.ndarray:
+        return ~np.isnan(self.values)
+
+
+@dataclass
+class PortfolioValuation:
+    """
+    The result of valuing a portfolio over a date range
+    """
+
+    holdings: Holdings
+    prices: PriceMatrix
+    quantities: np.ndarray
+    # dates x assets value of each position
+    positions: np.ndarray
+    values: np.ndarray
+
+    @property
+    def dates(self):
+        return self.prices.dates
+
+    @property
+    def weights(self) -> np.ndarray:
+        """
+        Get the actual weight of each asset on each date, as a dates x assets
+        matrix of each position's share of that day's value
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weights = self.positions / self.values[:, None]
+        return np.nan_to_num(weights)
+
+    def exact_values(self) -> np.ndarray:
+        """
+        Get the value of each date as an integer scaled by SCALE**2, added up
+        without the rounding errors of `values`
+        """
+        prices = to_scaled(self.prices.values)
+        quantities = to_scaled(self.quantities)
+        dtype = integer_dtype(
+            np.abs(prices).max(initial=0) * np.abs(quantities).max(initial=0),
+            prices.shape[1],
+        )
+        positions = as_integers(prices, dtype) * as_integers(quantities, dtype)
+        return positions.sum(axis=1)
+
+    def to_daily_values(self) -> list:
+        """
+        Build the rows expected by PortfolioDailyValueSerializer, with both the
+        actual weights of each day and the target ones
+        """
+        present = self.prices.present
+        names = self.holdings.asset_names
+        targets = self.holdings.weights
+        # an asset counts on the days it's priced, if it's a target or held
+        counted = present & ((self.positions != 0) | self.holdings.has_target)
+        # plain floats with 4 decimals, much cheaper to build than Decimals
+        weights = np.round(self.weights, 4).tolist()
+        targets = [None if w is None else float(w) for w in targets]
+        values = self.exact_values().tolist()
+
+        return [
+            {
+                "date": date,
+                "value": scaled_to_decimal(values[i]),
+                "weights": {names[j]: weights[i][j] for j in columns},
+                "target_weights": {
+                    names[j]: targets[j] for j in columns if targets[j] is not None
+                },
+            }
+            for i, date in enumerate(self.dates)
+            for columns in [np.flatnonzero(counted[i]).tolist()]
+        ]
+
+
+def load_holdings(portfolio: Portfolio) -> Holdings:
+    """
+    Get every asset of a portfolio, with its current position, in a single query
+    """
+    portfolio_assets = PortfolioAsset.objects.filter(
+        portfolio=portfolio, asset=OuterRef("pk")
+    )
+    rows = list(
+        Asset.objects.filter(
+            Q(id__in=PortfolioAsset.objects.filter(portfolio=portfolio).values("asset"))
+            | Q(id__in=Holding.objects.filter(portfolio=portfolio).values("asset"))
+        )
+        .annotate(
+            quantity=Subquery(portfolio_assets.values("quantity")[:1]),
+            weight=Subquery(portfolio_assets.values("weight")[:1]),
+        )
+        .order_by("id")
+        .values_list("id", "name", "quantity", "weight")
+    )
+
+    return Holdings(
+        asset_ids=[row[0] for row in rows],
+        asset_names=[row[1] for row in rows],
+        quantities=np.array([float(row[2] or 0) for row in rows], dtype=np.float64),
+        # subqueries don't keep the decimal places on every backend
+        weights=[
+            None if row[3] is None else row[3].quantize(FOUR_PLACES) for row in rows
+        ],
+    )
+
+
+def quantities_on(portfolio: Portfolio, asset_ids: list, date) -> dict:
+    """
+    Get the quantity held of each asset at the end of the given date.
+
+    Each asset costs one indexed lookup on the ledger, all in a single query.
+    """
+    latest = Holding.objects.filter(
+        portfolio=portfolio, asset=OuterRef("pk"), date__lte=date
+    ).order_by("-date")
+    rows = (
+        Asset.objects.filter(id__in=asset_ids)
+        .annotate(quantity=Subquery(latest.values("quantity")[:1]))
+        .values_list("id", "quantity")
+    )
+    return {asset_id: quantity or Decimal(0) for asset_id, quantity in rows}
+
+
+def load_quantity_matrix(portfolio: Portfolio, asset_ids: list, dates: list):
+    """
+    Get the quantities held as a dates x assets matrix aligned with `dates`.
+
+    The opening positions come from `quantities_on` and every later change is
+    read with a single range scan over the ledger, then carried forward.
+    """
+    quantities = np.full((len(dates), len(asset_ids)), np.nan)
+    if not dates or not asset_ids:
+        return quantities
+
+    column_by_asset = {asset_id: j for j, asset_id in enumerate(asset_ids)}
+    opening = quantities_on(portfolio, asset_ids, dates[0])
+    quantities[0] = [float(opening.get(asset_id, 0)) for asset_id in asset_ids]
+
+    changes = (
+        Holding.objects.filter(
+            portfolio=portfolio,
+            asset_id__in=asset_ids,
+            date__gt=dates[0],
+            date__lte=dates[-1],
+        )
+        .order_by("date")
+        .values_list("date", "asset_id", "quantity")
+    )
+    for date, asset_id, quantity in changes:
+        # a change counts from the first priced date on or after it
+        quantities[bisect_left(dates, date), column_by_asset[asset_id]] = quantity
+
+    # carry the last known quantity forward
+    rows = np.where(~np.isnan(quantities), np.arange(len(dates))[:, None], 0)
+    rows = np.maximum.accumulate(rows, axis=0)
+    return quantities[rows, np.arange(len(asset_ids))]
+
+
+def load_price_matrix(asset_ids: list, initial_date, end_date) -> PriceMatrix:
+    """
+    Get the prices of the given assets between two dates, from the price store
+    when it's enabled and with a single query otherwise.
+
+    Only dates where at least one of the assets has a price become rows.
+    """
+    if not asset_ids:
+        return PriceMatrix(dates=[], asset_ids=[], values=np.empty((0, 0)))
+
+    if pricestore.get_store_dir() is None:
+        return query_price_matrix(asset_ids, initial_date, end_date)
+
+    # accept whatever a DateField lookup would, like the query does
+    initial_date = DateField().to_python(initial_date)
+    end_date = DateField().to_python(end_date)
+
+    records = {asset_id: pricestore.read(asset_id) for asset_id in asset_ids}
+    missing = [asset_id for asset_id, rows in records.items() if rows is None]
+    if missing:
+        Price.rebuild_store(missing)
+        records.update({asset_id: pricestore.read(asset_id) for asset_id in missing})
+
+    ranges = [
+        pricestore.read_range(records[asset_id], initial_date, end_date)
+        for asset_id in asset_ids
+    ]
+    ordinals = np.unique(
+        np.concatenate([np.empty(0, dtype=np.int32)] + [r["date"] for r in ranges])
+    )
+
+    values = np.full((len(ordinals), len(asset_ids)), np.nan)
+    for j, rows in enumerate(ranges):
+        values[np.searchsorted(ordinals, rows["date"]), j] = (
+            rows["price"] / pricestore.SCALE
+        )
+
+    return PriceMatrix(
+        dates=[Date.fromordinal(int(ordinal)) for ordinal in ordinals],
+        asset_ids=list(asset_ids),
+        values=values,
+    )
+
+
+def query_price_matrix(asset_ids: list, initial_date, end_date) -> PriceMatrix:
+    """
+    Get the prices of the given assets between two dates in a single query
+    """
+    rows = (
+        Price.objects.filter(
+            asset_id__in=asset_ids,
+            date__range=[initial_date, end_date],
+        )
+        .order_by("date")
+        .values_list("date", "asset_id", "price")
+    )
+
+    column_by_asset = {asset_id: j for j, asset_id in enumerate(asset_ids)}
+    dates = []
+    row_idx, col_idx, prices = [], [], []
+
+    for date, asset_id, price in rows:
+        if not dates or dates[-1] != date:
+            dates.append(date)
+        row_idx.append(len(dates) - 1)
+        col_idx.append(column_by_asset[asset_id])
+        prices.append(float(price))
+
+    values = np.full((len(dates), len(asset_ids)), np.nan)
+    values[row_idx, col_idx] = prices
+
+    return PriceMatrix(dates=dates, asset_ids=list(asset_ids), values=values)
+
+
+def value_portfolio(portfolio: Portfolio, initial_date, end_date) -> PortfolioValuation:
+    """
+    Value a portfolio on every priced date between two dates, using the
+    quantities held on each of those dates
+    """
+    holdings = load_holdings(portfolio)
+    prices = load_price_matrix(holdings.asset_ids, initial_date, end_date)
+    quantities = load_quantity_matrix(portfolio, holdings.asset_ids, prices.dates)
+
+    positions = np.nan_to_num(prices.values) * quantities
+    values = positions.sum(axis=1)
+
+    return PortfolioValuation(
+        holdings=holdings,
+        prices=prices,
+        quantities=quantities,
+        positions=positions,
+        values=values,
+    )
+
+
+def value_portfolios(portfolios: list, initial_date, end_date):
+    """
+    Value many portfolios over the same date range in one pass.
+
+    The ledgers of all of them and the prices of every asset involved are read
+    once, up front. Then each portfolio's values are computed as it's yielded,
+    so a consumer can send each one out before the next is computed. Values
+    start as the dates x assets price matrix times the opening quantities, and
+    each later change on the ledger adds its delta from its date on, all as
+    integers scaled by SCALE**2 so they add up exactly. Yields (portfolio,
+    dates, values) for each portfolio, with those scaled values (see
+    scaled_to_decimal).
+    """
+    row_by_portfolio = {portfolio.id: i for i, portfolio in enumerate(portfolios)}
+
+    members = list(
+        PortfolioAsset.objects.filter(portfolio_id__in=row_by_portfolio).values_list(
+            "portfolio_id", "asset_id"
+        )
+    )
+    ledger = list(
+        Holding.objects.filter(portfolio_id__in=row_by_portfolio, date__lte=end_date)
+        .order_by("date")
+        .values_list("portfolio_id", "asset_id", "date", "quantity")
+    )
+
+    asset_ids = sorted({row[1] for row in members} | {row[1] for row in ledger})
+    column_by_asset = {asset_id: j for j, asset_id in enumerate(asset_ids)}
+    prices = load_price_matrix(asset_ids, initial_date, end_date)
+    dates = prices.dates
+
+    if not dates:
+        for portfolio in portfolios:
+            yield portfolio, [], np.zeros(0)
+        return
+
+    # the columns of each portfolio's assets, their quantities on the first
+    # date and their later changes
+    columns = [set() for _ in portfolios]
+    opening = [{} for _ in portfolios]
+    changes = [[] for _ in portfolios]
+    for portfolio_id, asset_id in members:
+        columns[row_by_portfolio[portfolio_id]].add(column_by_asset[asset_id])
+    for portfolio_id, asset_id, date, quantity in ledger:
+        i, j = row_by_portfolio[portfolio_id], column_by_asset[asset_id]
+        columns[i].add(j)
+        quantity = int(quantity * SCALE)
+        if date <= dates[0]:
+            opening[i][j] = quantity
+        elif date <= dates[-1]:
+            # a change counts from the first priced date on or after it
+            changes[i].append((j, bisect_left(dates, date), quantity))
+
+    filled = to_scaled(prices.values)
+    largest = max(
+        [abs(quantity) for row in opening for quantity in row.values()]
+        + [abs(change[2]) for row in changes for change in row],
+        default=0,
+    )
+    dtype = integer_dtype(np.abs(filled).max(initial=0) * largest, len(asset_ids))
+    filled = as_integers(filled, dtype)
+    present = prices.present
+
+    for i, portfolio in enumerate(portfolios):
+        held = sorted(columns[i])
+        quantities = {j: opening[i].get(j, 0) for j in held}
+        # with the opening quantities held all along
+        values = filled[:, held] @ np.array(list(quantities.values()), dtype=dtype)
+        for j, k, quantity in changes[i]:
+            values[k:] += filled[k:, j] * (quantity - quantities[j])
+            quantities[j] = quantity
+
+        # a portfolio only has a value on the dates one of its assets is priced
+        mask = present[:, held].any(axis=1)
+        portfolio_dates = [date for date, keep in zip(dates, mask) if keep]
+        yield portfolio, portfolio_dates, values[mask]
+
+
+def refresh_daily_values(portfolio: Portfolio):
+    """
+    Recompute the stale PortfolioDailyValue rows of a portfolio, from its
+    values_stale_since date on
+    """
+    since = portfolio.values_stale_since
+    if since is None:
+        return
+
+    version = portfolio.data_version
+    daily_values = value_portfolio(portfolio, since, Date.max).to_daily_values()
+
+    with transaction.atomic():
+        # another worker may have refreshed the rows while computing, lock the
+        # portfolio so only one of them writes them
+        stale = (
+            Portfolio.objects.select_for_update()
+            .filter(id=portfolio.id)
+            .values_list("values_stale_since", flat=True)
+            .first()
+        )
+        if stale is None:
+            portfolio.values_stale_since = None
+            return
+
+        PortfolioDailyValue.objects.filter(
+            portfolio=portfolio, date__gte=since
+        ).delete()
+        PortfolioDailyValue.objects.bulk_create(
+            [
+                PortfolioDailyValue(
+                    portfolio_id=portfolio.id,
+                    date=row["date"],
+                    value=row["value"],
+                    weights=row["weights"],
+                    target_weights=row["target_weights"],
+                )
+                for row in daily_values
+            ],
+            batch_size=1000,
+        )
+        # unless something changed while computing, the rows are up to date
+        Portfolio.objects.filter(id=portfolio.id, data_version=version).update(
+            values_stale_since=None
+        )
+
+    portfolio.values_stale_since = None
+
+
+async def arefresh_daily_values(portfolio: Portfolio):
+    """
+    Async version of refresh_daily_values, run in a worker thread when there's
+    something to refresh
+    """
+    if portfolio.values_stale_since is not None:
+        await sync_to_async(refresh_daily_values, thread_sensitive=False)(portfolio)
+
+
+def refresh_stale_daily_values():
+    """
+    Recompute the stale rows of every portfolio
+    """
+    for portfolio in Portfolio.objects.filter(values_stale_since__isnull=False):
+        refresh_daily_values(portfolio)
+
+
+# the weights each kind of request gets, as key -> column
+WEIGHT_COLUMNS = {
+    "actual": {"weights": "weights"},
+    "target": {"weights": "target_weights"},
+    "both": {"weights": "weights", "target_weights": "target_weights"},
+}
+
+
+def daily_values_query(portfolio: Portfolio, initial_date, end_date, weights="actual"):
+    return (
+        PortfolioDailyValue.objects.filter(
+            portfolio=portfolio, date__range=[initial_date, end_date]
+        )
+        .order_by("date")
+        .values_list("date", "value", *WEIGHT_COLUMNS[weights].values())
+    )
+
+
+def values_query(portfolio: Portfolio, initial_date, end_date):
+    """
+    Get the (date, value) of each daily value between two dates, without the
+    weights
+    """
+    return (
+        PortfolioDailyValue.objects.filter(
+            portfolio=portfolio, date__range=[initial_date, end_date]
+        )
+        .order_by("date")
+        .values_list("date", "value")
+    )
+
+
+def weights_queries(portfolio: Portfolio, dates: list) -> list:
+    """
+    Get the (date, actual weights) of the given dates, in batches of queries
+    that stay under the databases' limits on parameters
+    """
+    return [
+        PortfolioDailyValue.objects.filter(
+            portfolio=portfolio, date__in=dates[i : i + 1000]
+        ).values_list("date", "weights")
+        for i in range(0, len(dates), 1000)
+    ]
+
+
+def to_daily_value(row, weights="actual") -> dict:
+    date, value, *columns = row
+    return {"date": date, "value": value, **dict(zip(WEIGHT_COLUMNS[weights], columns))}
+
+
+def load_daily_values(
+    portfolio: Portfolio, initial_date, end_date, weights="actual"
+) -> list:
+    """
+    Get the materialized daily values of a portfolio between two dates,
+    refreshing them first if they're stale.
+
+    `weights` picks the weights of each day: the `actual` ones (each asset's
+    share of the value), the `target` ones, or `both` (the target ones as
+    `target_weights`).
+    """
+    refresh_daily_values(portfolio)
+
+    rows = daily_values_query(portfolio, initial_date, end_date, weights)
+    return [to_daily_value(row, weights) for row in rows]
+
+
+async def aload_daily_values(
+    portfolio: Portfolio, initial_date, end_date, weights="actual"
+) -> list:
+    """
+    Async version of load_daily_values.
+
+    A refresh is CPU bound, so it runs in a worker thread instead of the
+    event loop.
+    """
+    await arefresh_daily_values(portfolio)
+
+    rows = daily_values_query(portfolio, initial_date, end_date, weights)
+    return [to_daily_value(row, weights) async for row in rows]
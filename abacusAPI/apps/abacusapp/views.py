@@ -1,47 +1,248 @@
-import base64
+import functools
+import hashlib
+import json
 import logging
 import os
 
-import openpyxl
 from django.conf import settings
 from django.core.files.storage import default_storage
-from django.db import transaction
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.exceptions import ValidationError
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.views import APIView
 
 from abacusAPI.apps.abacusapp.services import (
+    apply_transactions,
     calculate_portfolio_daily_value,
     calculate_portfolio_daily_values,
+    create_deposits,
+    export_prices,
+    generate_portfolio_chart_data,
     generate_portfolio_plots,
+    get_portfolio_analytics,
+    rebalance_portfolios,
+    run_backtests,
 )
 
-from .filters import PortfolioAssetFilter
-from .models import Asset, Deposit, Portfolio, PortfolioAsset, Price, Transaction
+from . import profiling
+from .backtest import FREQUENCIES
+from .filters import PortfolioAssetFilter, PriceFilter
+from .jobs import JobQueueFull, submit_import
+from .models import (
+    Asset,
+    Deposit,
+    ImportJob,
+    Portfolio,
+    PortfolioAsset,
+    Price,
+    Transaction,
+)
+from .pagination import PriceKeysetPagination
+from .rendering import PoolTimeout, PoolUnavailable
+from .response_cache import cached_response
+from .response_cache import stats as response_cache_stats
 from .serializers import (
     AssetSerializer,
+    BacktestSerializer,
     DepositSerializer,
+    ImportJobSerializer,
+    MultiPortfolioDepositSerializer,
     PortfolioAssetSerializer,
     PortfolioDailyValueSerializer,
     PortfolioSerializer,
     PriceSerializer,
+    RebalancePlanSerializer,
+    RebalanceSerializer,
+    TransactionBatchSerializer,
     TransactionSerializer,
 )
+from .valuation import scaled_to_decimal, value_portfolios
 
 logger = logging.getLogger("abacusapp")
 
+PLOT_CONTENT_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def conditional_on_portfolio(view_method):
+    """
+    Answer with 304 Not Modified, before running the action, when the
+    client's copy of the response is still current.
+
+    Responses are stamped with an ETag and Last-Modified derived from the
+    portfolio's data version, which every write behind its valuations bumps.
+    """
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        etag, last_modified = portfolio_validators(self.get_object())
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=int(last_modified)
+        )
+        if response is not None:
+            return response
+
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    return wrapper
+
+
+def portfolio_validators(portfolio: Portfolio) -> tuple:
+    """
+    Get the ETag and Last-Modified timestamp of responses built from the
+    data of a portfolio
+    """
+    key = portfolio.data_key.encode()
+    etag = quote_etag(hashlib.md5(key, usedforsecurity=False).hexdigest())
+    last_modified = max(
+        filter(None, [portfolio.updated_at, portfolio.data_updated_at])
+    ).timestamp()
+    return etag, last_modified
+
+
+def get_plot_params(query_params) -> tuple:
+    """
+    Get the `output` format and number of `points` of a chart request,
+    raising ValueError when they're not valid
+    """
+    # png by default, or svg/json downsampled to a number of points
+    output = query_params.get("output", "png")
+    if output not in PLOT_CONTENT_TYPES and output != "json":
+        raise ValueError("output must be one of png, svg or json.")
+
+    points = query_params.get("points")
+    if points is None and output != "png":
+        points = settings.CHART_DEFAULT_POINTS
+    if points is not None:
+        try:
+            points = min(max(int(points), 3), settings.CHART_MAX_POINTS)
+        except ValueError:
+            raise ValueError("points must be a number.")
+
+    return output, points
+
+
+def get_weights_param(query_params) -> str:
+    """
+    Get which weights a daily values request wants, raising ValueError when
+    it's not valid
+    """
+    weights = query_params.get("weights", "actual")
+    if weights not in ("actual", "target", "both"):
+        raise ValueError("weights must be one of actual, target or both.")
+    return weights
 
-class PortfolioViewSet(viewsets.ModelViewSet):
+
+def get_analytics_params(query_params) -> tuple:
+    """
+    Get the rolling `windows`, `risk_free` rate and whether to include the
+    series of an analytics request, raising ValueError when they're not valid
+    """
+    windows = query_params.get("windows")
+    if windows is None:
+        windows = settings.ANALYTICS_DEFAULT_WINDOWS
+    else:
+        try:
+            windows = sorted({int(window) for window in windows.split(",")})
+        except ValueError:
+            raise ValueError("windows must be a comma separated list of numbers.")
+        if len(windows) > 10 or not all(
+            2 <= window <= settings.ANALYTICS_MAX_WINDOW for window in windows
+        ):
+            raise ValueError(
+                "windows must be up to 10 numbers of days, "
+                f"between 2 and {settings.ANALYTICS_MAX_WINDOW}."
+            )
+
+    try:
+        risk_free = float(query_params.get("risk_free", 0))
+    except ValueError:
+        raise ValueError("risk_free must be a number, like 0.03 for 3% a year.")
+
+    include_series = query_params.get("series", "").lower() in ("1", "true")
+    return windows, risk_free, include_series
+
+
+def get_backtest_params(query_params) -> tuple:
+    """
+    Get the starting `capital` and the rebalancing scenario of a backtest
+    request, raising ValueError when they're not valid
+    """
+    try:
+        capital = float(query_params.get("capital", settings.BACKTEST_DEFAULT_CAPITAL))
+    except ValueError:
+        raise ValueError("capital must be a number.")
+    if capital < 1:
+        raise ValueError("capital must be at least 1.")
+
+    scenario = {"rebalance": query_params.get("rebalance", "monthly")}
+    if scenario["rebalance"] not in FREQUENCIES:
+        raise ValueError(
+            "rebalance must be one of daily, weekly, monthly or threshold."
+        )
+    for name in ("threshold", "cost"):
+        if name in query_params:
+            try:
+                scenario[name] = float(query_params[name])
+            except ValueError:
+                raise ValueError(f"{name} must be a number, like 0.05 for 5%.")
+            if not 0 <= scenario[name] <= 1:
+                raise ValueError(f"{name} must be between 0 and 1.")
+
+    return capital, scenario
+
+
+def portfolio_data_key(view, request) -> str:
+    return view.get_object().data_key
+
+
+class CachedReadMixin:
+    """
+    Serve list and retrieve from the response cache, until the next write
+    """
+
+    @cached_response()
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response()
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class PortfolioViewSet(CachedReadMixin, viewsets.ModelViewSet):
     queryset = Portfolio.objects.all()
     serializer_class = PortfolioSerializer
 
+    def get_object(self):
+        # conditional actions look the portfolio up before the action itself
+        if not hasattr(self, "_object"):
+            self._object = super().get_object()
+        return self._object
+
     @action(detail=True, methods=["get"])
+    @conditional_on_portfolio
+    @cached_response(version=portfolio_data_key)
     def daily_value(self, request, pk=None):
         portfolio = self.get_object()
         date = request.query_params.get("date")
@@ -51,12 +252,19 @@ class PortfolioViewSet(viewsets.ModelViewSet):
                 {"error": "Please provide a date."}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        daily_value = calculate_portfolio_daily_value(portfolio, date)
+        try:
+            weights = get_weights_param(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        daily_value = calculate_portfolio_daily_value(portfolio, date, weights)
         serializer = PortfolioDailyValueSerializer(daily_value)
 
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=["get"])
+    @conditional_on_portfolio
+    @cached_response(version=portfolio_data_key)
     def daily_values(self, request, pk=None):
         portfolio = self.get_object()
         initial_date = request.query_params.get("fecha_inicio")
@@ -68,14 +276,21 @@ class PortfolioViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        try:
+            weights = get_weights_param(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         daily_values = calculate_portfolio_daily_values(
-            portfolio, initial_date, end_date
+            portfolio, initial_date, end_date, weights
         )
         serializer = PortfolioDailyValueSerializer(daily_values, many=True)
 
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=["get"])
+    @conditional_on_portfolio
+    @cached_response(version=portfolio_data_key)
     def plot(self, request, pk=None):
         portfolio = self.get_object()
         initial_date = request.query_params.get("fecha_inicio")
@@ -87,29 +302,267 @@ class PortfolioViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        image_base64 = generate_portfolio_plots(portfolio, initial_date, end_date)
-        if not image_base64:
+        try:
+            output, points = get_plot_params(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if output == "json":
+                data = generate_portfolio_chart_data(
+                    portfolio, initial_date, end_date, points
+                )
+            else:
+                data = generate_portfolio_plots(
+                    portfolio, initial_date, end_date, output, points
+                )
+        except PoolTimeout as e:
+            return Response({"error": str(e)}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+        except PoolUnavailable as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+        if not data:
             return Response(
                 {"error": "No data available for the given date range."},
                 status=status.HTTP_404_NOT_FOUND,
             )
 
+        if output == "json":
+            return Response(data, status=status.HTTP_200_OK)
+
         # Return the image as a response
-        return HttpResponse(base64.b64decode(image_base64), content_type="image/png")
+        return HttpResponse(data, content_type=PLOT_CONTENT_TYPES[output])
+
+    @action(detail=True, methods=["get"])
+    @conditional_on_portfolio
+    @cached_response(version=portfolio_data_key)
+    def analytics(self, request, pk=None):
+        """
+        Time-weighted returns, volatility, max drawdown and Sharpe ratio of
+        the portfolio, overall and over rolling `windows` of days
+        """
+        portfolio = self.get_object()
+        initial_date = request.query_params.get("fecha_inicio")
+        end_date = request.query_params.get("fecha_fin")
 
+        if not initial_date or not end_date:
+            return Response(
+                {"error": "Please provide both fecha_inicio and fecha_fin."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            windows, risk_free, include_series = get_analytics_params(
+                request.query_params
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class AssetViewSet(viewsets.ModelViewSet):
+        data = get_portfolio_analytics(
+            portfolio, initial_date, end_date, windows, risk_free, include_series
+        )
+        if not data:
+            return Response(
+                {"error": "No data available for the given date range."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=["get"])
+    @conditional_on_portfolio
+    @cached_response(version=portfolio_data_key)
+    def backtest(self, request, pk=None):
+        """
+        Simulate the portfolio from a starting `capital` and its target
+        weights between two dates, rebalancing `daily`, `weekly`, `monthly`
+        or past a drift `threshold`, and get its analytics
+        """
+        portfolio = self.get_object()
+        initial_date = request.query_params.get("fecha_inicio")
+        end_date = request.query_params.get("fecha_fin")
+
+        if not initial_date or not end_date:
+            return Response(
+                {"error": "Please provide both fecha_inicio and fecha_fin."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            capital, scenario = get_backtest_params(request.query_params)
+            windows, risk_free, include_series = get_analytics_params(
+                request.query_params
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            [run] = run_backtests(
+                [portfolio],
+                initial_date,
+                end_date,
+                capital,
+                [scenario],
+                windows,
+                risk_free,
+                include_series,
+            )
+        except ValidationError as e:
+            return Response({"error": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+        except PoolTimeout as e:
+            return Response({"error": str(e)}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+        except PoolUnavailable as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+        if run["result"] is None:
+            return Response(
+                {"error": "No data available for the given date range."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        return Response(
+            {"portfolio": portfolio.name, **run["result"]}, status=status.HTTP_200_OK
+        )
+
+    @action(detail=False, methods=["post"])
+    def backtests(self, request):
+        """
+        Backtest many portfolios under many rebalancing `scenarios` at once,
+        in parallel
+        """
+        serializer = BacktestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        try:
+            runs = run_backtests(
+                data["portfolios"],
+                data["fecha_inicio"],
+                data["fecha_fin"],
+                data["capital"],
+                data["scenarios"],
+                data["windows"],
+                data["risk_free"],
+                data["series"],
+            )
+        except ValidationError as e:
+            return Response({"error": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+        except PoolTimeout as e:
+            return Response({"error": str(e)}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+        except PoolUnavailable as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+        return Response(runs, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["post"])
+    def rebalance(self, request):
+        """
+        List the trades that bring many portfolios back to their target
+        weights on a date, and make them in a single atomic pass with
+        `execute`
+        """
+        serializer = RebalanceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            plan = rebalance_portfolios(**serializer.validated_data)
+        except ValidationError as e:
+            return Response({"error": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            RebalancePlanSerializer(plan).data,
+            status=status.HTTP_201_CREATED if plan["executed"] else status.HTTP_200_OK,
+        )
+
+    @action(detail=False, methods=["get"])
+    def valuations(self, request):
+        """
+        Value many portfolios (all of them, or the given `ids`) in one pass,
+        streamed as one JSON line per portfolio
+        """
+        initial_date = request.query_params.get("fecha_inicio")
+        end_date = request.query_params.get("fecha_fin")
+
+        if not initial_date or not end_date:
+            return Response(
+                {"error": "Please provide both fecha_inicio and fecha_fin."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        portfolios = self.get_queryset().order_by("id")
+        ids = request.query_params.get("ids")
+        if ids:
+            try:
+                portfolios = portfolios.filter(id__in=ids.split(","))
+            except ValueError:
+                return Response(
+                    {"error": "ids must be a comma separated list of numbers."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        lines = (
+            json.dumps(
+                {
+                    "portfolio": portfolio.id,
+                    "name": portfolio.name,
+                    "values": [
+                        {
+                            "date": date.isoformat(),
+                            "value": str(scaled_to_decimal(value)),
+                        }
+                        for date, value in zip(dates, values)
+                    ],
+                }
+            )
+            + "\n"
+            for portfolio, dates, values in value_portfolios(
+                list(portfolios), initial_date, end_date
+            )
+        )
+        return StreamingHttpResponse(lines, content_type="application/x-ndjson")
+
+
+class AssetViewSet(CachedReadMixin, viewsets.ModelViewSet):
     queryset = Asset.objects.all()
     serializer_class = AssetSerializer
 
 
 class PriceViewSet(viewsets.ModelViewSet):
-    queryset = Price.objects.all().order_by("date")
+    queryset = Price.objects.all()
     serializer_class = PriceSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = PriceKeysetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = PriceFilter
 
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Stream every (filtered) price as CSV or NDJSON, in constant memory
+        """
+        output = request.query_params.get("output", "csv")
+        if output not in EXPORT_CONTENT_TYPES:
+            return Response(
+                {"error": "output must be one of csv or ndjson."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        prices = self.filter_queryset(self.get_queryset()).order_by(
+            *PriceKeysetPagination.ordering
+        )
+        response = StreamingHttpResponse(
+            export_prices(prices, output), content_type=EXPORT_CONTENT_TYPES[output]
+        )
+        response["Content-Disposition"] = f'attachment; filename="prices.{output}"'
+        return response
 
-class PortfolioAssetViewSet(viewsets.ModelViewSet):
+
+class PortfolioAssetViewSet(CachedReadMixin, viewsets.ModelViewSet):
     queryset = PortfolioAsset.objects.all()
     serializer_class = PortfolioAssetSerializer
     filter_backends = [DjangoFilterBackend]
@@ -120,6 +573,22 @@ class DepositViewSet(viewsets.ModelViewSet):
     queryset = Deposit.objects.all()
     serializer_class = DepositSerializer
 
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """
+        Deposit the same amount into many portfolios in a single pass
+        """
+        serializer = MultiPortfolioDepositSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            deposits = create_deposits(**serializer.validated_data)
+        except ValidationError as e:
+            return Response({"error": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(deposits, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 
 class TransactionViewSet(viewsets.ModelViewSet):
     queryset = Transaction.objects.all()
@@ -143,10 +612,35 @@ class TransactionViewSet(viewsets.ModelViewSet):
         except ValidationError as e:
             return Response({"error": e.detail}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """
+        Create a list of transactions in a single atomic pass, applied in order
+        """
+        serializer = TransactionBatchSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            transactions = apply_transactions(
+                [Transaction(**data) for data in serializer.validated_data]
+            )
+        except ValidationError as e:
+            return Response({"error": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(transactions, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class ImportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = ImportJob.objects.all().order_by("-created_at")
+    serializer_class = ImportJobSerializer
+
 
 class UploadExcelView(APIView):
     """
-    View to be able to load the .xlsx setup file
+    View to be able to load the .xlsx setup file.
+
+    The file is imported in the background, check the returned job for progress.
     """
 
     def get(self, request, *args, **kwargs):
@@ -169,135 +663,70 @@ class UploadExcelView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        logger.info(f"Received File Correctly [file={f.name}]")
+        logger.info("Received File Correctly [file=%s]", f.name)
 
         # save the file
         file_path = default_storage.save("temp/" + f.name, f)
         file_full_path = os.path.join(settings.MEDIA_ROOT, file_path)
 
-        # TODO: The file logic could be split to helper functions
-        # to have a cleaner code structure
         try:
-            # Read the file
-            workbook = openpyxl.load_workbook(file_full_path)
-
-            # Process "weights" sheet
-            weights_sheet = workbook["weights"]
-
-            # Portfolio names are in the header row starting from the third column
-            portfolio_names = [cell.value for cell in weights_sheet[1][2:]]
-            portfolios = {}
-            # Create portfolios if they don't exist
-            for name in portfolio_names:
-                logger.debug("Creating Portfolio [name=%s]", name)
-                portfolio, _ = Portfolio.objects.get_or_create(name=name)
-                portfolios[name] = portfolio
-
-            # this is to avoid getting/creating Assets multiple times
-            assets_by_name = {}
-
-            # Process each row for the assets and weights
-            for row in weights_sheet.iter_rows(min_row=2, values_only=True):
-                date, asset_name, *weights = row
-
-                # stop when rows are empty
-                if not date or not asset_name:
-                    logger.info("Done processing Portfolios")
-                    break
-
-                # create the asset if it doesn't exist
-                logger.debug("Retrieving Asset [name=%s]", asset_name)
-                assets_by_name[asset_name] = Asset.objects.get_or_create(
-                    name=asset_name,
-                )[0]
-
-                # then the weights and amounts
-                # TODO: this could also be a transaction so it's faster
-                for portfolio_name, weight in zip(portfolio_names, weights):
-                    logger.debug(
-                        "Creating PortfolioAsset [p=%s, a=%s, d=%s, w=%s]",
-                        portfolio_name,
-                        asset_name,
-                        date,
-                        weight,
-                    )
-                    PortfolioAsset.objects.update_or_create(
-                        portfolio=portfolios[portfolio_name],
-                        asset=assets_by_name[asset_name],
-                        weight=weight,
-                    )
-
-            # Process "Precios" sheet
-            prices_sheet = workbook["Precios"]
-
-            # Get the asset names from the header row
-            asset_names = [cell.value for cell in prices_sheet[1][1:]]
-
-            # First get/create the assets and save them
-            for name in asset_names:
-                if name in assets_by_name:
-                    # skip if we saw it already on the previous step
-                    continue
-                logger.debug("Retrieving Asset [name=%s]", name)
-                assets_by_name[name] = Asset.objects.get_or_create(
-                    name=name,
-                )[0]
-
-            # then create or update their prices in bulk
-            new_prices = []
-            prices_to_update = []
-
-            for row in prices_sheet.iter_rows(min_row=2, values_only=True):
-                date = row[0]
-                for asset_name, price in zip(asset_names, row[1:]):
-                    logger.debug(
-                        "Preparing Asset Price [asset=%s, price=%s, date=%s]",
-                        asset_name,
-                        price,
-                        date,
-                    )
-
-                    asset = assets_by_name[asset_name]
-                    price_obj = Price.objects.filter(
-                        asset=asset,
-                        date=date,
-                    ).first()
-
-                    if price_obj:
-                        price_obj.value = price
-                        prices_to_update.append(price_obj)
-                    else:
-                        new_prices.append(
-                            Price(
-                                asset=asset,
-                                date=date,
-                                price=price,
-                            ),
-                        )
-
-            # transaction to ensure atomicity
-            with transaction.atomic():
-                # Bulk create new prices
-                if new_prices:
-                    logger.debug("Creating Asset Prices (%d)", len(new_prices))
-                    Price.objects.bulk_create(new_prices)
-
-                # Bulk update existing prices
-                if prices_to_update:
-                    logger.debug("Updating Asset Prices (%d)", len(prices_to_update))
-                    Price.objects.bulk_update(prices_to_update, ["price"])
-
-        except Exception as e:
-            logger.exception("File Upload Failed")
+            job = submit_import(
+                file_full_path,
+                f.name,
+                # profile the import too, when profiling the upload
+                profile=getattr(request, "profile", None) is not None,
+            )
+        except JobQueueFull as e:
+            os.remove(file_full_path)
             return Response(
                 {"error": str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
             )
-        finally:
-            # Always clean up the file
-            os.remove(file_full_path)
 
         return Response(
-            {"status": "File processed successfully"},
-            status=status.HTTP_200_OK,
+            {
+                "status": "File queued for processing",
+                "job": reverse("importjob-detail", args=[job.id], request=request),
+            },
+            status=status.HTTP_202_ACCEPTED,
         )
+
+
+class CacheStatsView(APIView):
+    """
+    Hit/miss counters of the response cache, for this process
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(response_cache_stats.as_dict())
+
+
+class ProfileViewSet(viewsets.ViewSet):
+    """
+    Profiles of requests made with the profiling flag (see middleware.py)
+    """
+
+    permission_classes = [IsAdminUser]
+    lookup_value_regex = r"[\w-]+"
+
+    def list(self, request):
+        return Response(profiling.list_profiles())
+
+    def retrieve(self, request, pk=None):
+        try:
+            return Response(profiling.load_profile(pk))
+        except FileNotFoundError:
+            raise NotFound()
+
+    @action(detail=True)
+    def download(self, request, pk=None):
+        """
+        The raw cProfile stats, for pstats or snakeviz
+        """
+        try:
+            path = profiling.get_profile_path(pk, "profile.prof")
+        except FileNotFoundError:
+            raise NotFound()
+        return FileResponse(open(path, "rb"), as_attachment=True, filename=f"{pk}.prof")
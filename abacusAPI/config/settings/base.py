@@ -35,6 +35,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so it measures everything else
+    "abacusAPI.apps.abacusapp.middleware.RequestTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -42,6 +44,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "abacusAPI.apps.abacusapp.middleware.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "abacusAPI.config.urls"
@@ -114,14 +117,98 @@ REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": ("django_filters.rest_framework.DjangoFilterBackend",),
 }
 
+# Local memory by default, for a single process. A FileBasedCache (as in
+# production.py) shares cached responses and their invalidations between
+# processes, without an external service.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Cached API responses, expired by writes (see response_cache.py)
+RESPONSE_CACHE_ALIAS = "default"
+RESPONSE_CACHE_TIMEOUT = 60 * 10  # seconds
+
+# In-process cache of the latest price of each asset
+LATEST_PRICE_CACHE_SIZE = 1024
+LATEST_PRICE_CACHE_TTL = 60  # seconds
+# Transactions, deposits and rebalances use the last price on or before their
+# date, up to this many days old to cover weekends and holidays (None for any)
+PRICE_MAX_STALENESS_DAYS = 7
+# In-process price history of each asset, for those lookups
+PRICE_HISTORY_CACHE_SIZE = 256
+PRICE_HISTORY_CACHE_TTL = 60  # seconds
+
+# Background Excel imports
+IMPORT_JOB_WORKERS = 2
+IMPORT_JOB_MAX_PENDING = 4  # queued + running, more uploads get a 429
+
+# Portfolio charts, rendered in a process pool (0 renders in the request)
+PLOT_RENDER_WORKERS = 2
+PLOT_RENDER_TIMEOUT = 30  # seconds
+PLOT_CACHE_TIMEOUT = 60 * 60  # seconds
+# Points the svg/json charts are downsampled to, unless asked otherwise
+CHART_DEFAULT_POINTS = 500
+CHART_MAX_POINTS = 5000
+
+# Rolling windows (in days) of the portfolio analytics, unless asked otherwise
+ANALYTICS_DEFAULT_WINDOWS = [21, 63, 252]
+ANALYTICS_MAX_WINDOW = 2520
+
+# Backtests, run in the same process pool as the charts when there's more
+# than one (0 runs them in the request)
+BACKTEST_WORKERS = 2
+BACKTEST_TIMEOUT = 60  # seconds, per run
+BACKTEST_MAX_RUNS = 100  # portfolios x scenarios in one request
+BACKTEST_DEFAULT_CAPITAL = 1_000_000
+
+# Memory-mapped copy of the prices for range reads (empty or None reads the
+# database). Generated data, kept out of the repository.
+PRICE_STORE_DIR = os.getenv("PRICE_STORE_DIR", BASE_DIR / "price_store")
+
+# Per-request timings (see middleware.py). Requests over either budget are
+# logged as warnings.
+SERVER_TIMING_HEADER = True
+REQUEST_QUERY_BUDGET = 50
+REQUEST_TIME_BUDGET_MS = 1000
+
+# Staff can profile a request with `X-Profile: 1` (see profiling.py)
+REQUEST_PROFILING = True
+PROFILE_KEEP = 50  # newest profiles kept under MEDIA_ROOT/profiles
+
+
+# Log level of the app and format of the logs (plain or json), which the
+# environment settings can change. Logs inside loops over rows (deposits,
+# imports) are sampled, one every LOG_ROW_SAMPLE_EVERY.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "plain")
+LOG_ROW_SAMPLE_EVERY = int(os.getenv("LOG_ROW_SAMPLE_EVERY", 100))
 
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "formatters": {
+        "plain": {
+            "format": "{asctime} {levelname} {name} {message}",
+            "style": "{",
+        },
+        "json": {
+            "()": "abacusAPI.apps.abacusapp.log.JsonFormatter",
+        },
+    },
+    "filters": {
+        "sample_rows": {
+            "()": "abacusAPI.apps.abacusapp.log.SampleFilter",
+            "every": LOG_ROW_SAMPLE_EVERY,
+        },
+    },
     "handlers": {
+        # written from a background thread (see log.py)
         "console": {
+            "()": "abacusAPI.apps.abacusapp.log.QueueHandler",
             "level": "DEBUG",
-            "class": "logging.StreamHandler",
+            "formatter": LOG_FORMAT,
         },
         # 'file': {
         #     'level': 'DEBUG',
@@ -143,8 +230,11 @@ LOGGING = {
                 "console",
                 # 'file',
             ],
-            "level": "DEBUG",
+            "level": LOG_LEVEL,
             "propagate": False,
         },
+        "abacusapp.rows": {
+            "filters": ["sample_rows"],
+        },
     },
 }
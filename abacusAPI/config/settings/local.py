@@ -19,5 +19,8 @@ INSTALLED_APPS += [
     "django_extensions",  # Example: useful for debugging and development tools
 ]
 
+# Everything, readable
+LOGGING["loggers"]["abacusapp"]["level"] = os.getenv("LOG_LEVEL", "DEBUG")
+
 # Local email settings (for example, using console backend)
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
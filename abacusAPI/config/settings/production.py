@@ -15,6 +15,15 @@ DATABASES = {
     }
 }
 
+# Shared by every worker process, so cached responses are expired by writes
+# made in any of them (see response_cache.py)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("CACHE_DIR", "/var/tmp/abacusAPI/cache"),
+    }
+}
+
 # Static files (production)
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
@@ -29,6 +38,9 @@ SECURE_SSL_REDIRECT = True
 CSRF_COOKIE_SECURE = True
 SESSION_COOKIE_SECURE = True
 
+# Structured logs, for the log collector
+LOGGING["handlers"]["console"]["formatter"] = os.getenv("LOG_FORMAT", "json")
+
 # Email settings for production
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = os.getenv("EMAIL_HOST")
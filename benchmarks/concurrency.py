@@ -0,0 +1,84 @@
+"""
+Fire concurrent requests at a running deployment and report throughput and
+latency percentiles, to compare the WSGI and ASGI request paths.
+
+Start the server under test first (see docs/README.md), then e.g.:
+
+    python3 benchmarks/concurrency.py --url http://localhost:8000 \
+        --path "/portfolios/1/plot/?fecha_inicio=2022-01-01&fecha_fin=2022-12-31&output=svg&points={n}" \
+        --concurrency 32 --requests 256 --user admin --password admin
+
+`{n}` in the path is replaced by a different number for each request (100
+and up), so requests can be spread over uncached variants.
+"""
+
+import argparse
+import base64
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def fetch(url: str, headers: dict) -> tuple:
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as r:
+            r.read()
+            status = r.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = None
+    return status, time.perf_counter() - started
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", required=True)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=128)
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    args = parser.parse_args()
+
+    headers = {}
+    if args.user:
+        token = base64.b64encode(f"{args.user}:{args.password}".encode()).decode()
+        headers["Authorization"] = f"Basic {token}"
+
+    urls = [
+        args.url + args.path.replace("{n}", str(100 + i)) for i in range(args.requests)
+    ]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda url: fetch(url, headers), urls))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for status, latency in results if status == 200]
+    errors = len(results) - len(latencies)
+
+    print(f"requests:    {len(results)} ({errors} failed)")
+    print(f"concurrency: {args.concurrency}")
+    print(f"elapsed:     {elapsed:.2f}s")
+    print(f"throughput:  {len(latencies) / elapsed:.1f} req/s")
+    if latencies:
+        print(
+            "latency:     "
+            f"p50 {percentile(latencies, 0.5) * 1000:.0f}ms, "
+            f"p95 {percentile(latencies, 0.95) * 1000:.0f}ms, "
+            f"p99 {percentile(latencies, 0.99) * 1000:.0f}ms, "
+            f"mean {statistics.mean(latencies) * 1000:.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()